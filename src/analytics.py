@@ -0,0 +1,364 @@
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from decimal import Decimal
+
+import cache
+import datagen
+import db
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Rowids read per statement; memory follows this, not the size of the table
+CHUNK_ROWS = int(os.environ.get("PATIENT_ANALYTICS_CHUNK", "250000"))
+AGE_BANDS = (0, 18, 30, 45, 60, 75)
+PERCENTILES = (10, 50, 90)
+# Blood pressure is counted in 1 mmHg bins up to this; higher readings land in the last bin
+BP_MAX = 300
+ANALYSES = {
+    "bp": "Blood pressure by age band",
+    "prescriptions": "Prescriptions per drug per month",
+    "revenue": "Revenue per doctor per month",
+}
+BP_HEADINGS = ["Age band", "Readings", "Systolic mean", "SD"] + [f"P{p}" for p in PERCENTILES] + \
+              ["Diastolic mean", "SD"] + [f"P{p}" for p in PERCENTILES]
+PRESCRIPTION_HEADINGS = ["DIN", "Drug", "Dosage", "Month", "Prescriptions", "Units", "Refills"]
+REVENUE_HEADINGS = ["Doctor", "Name", "Month", "Bills", "Billed", "Paid", "Unpaid", "Mean bill"]
+
+
+def require():
+    if numpy is None:
+        raise RuntimeError("analytics needs numpy (pip install .[numpy])")
+
+
+def chunks(con, table, columns, where=None, params=(), dates=(), size=CHUNK_ROWS):
+    # One int64 array per column expression for each block of size rowids. A column comes
+    # back as a single comma-separated string that numpy parses, so no Python object is made
+    # per row. Expressions must never be NULL (where can exclude NULLs), since group_concat
+    # skips NULLs and the columns would no longer line up. Columns named in dates hold ISO
+    # dates or timestamps and come back as calendar keys; the rest must be integers.
+    require()
+    select = ", ".join(f"group_concat({column})" for column in columns)
+    sql = f"SELECT {select} FROM {table} WHERE rowid >= ? AND rowid < ?" + (f" AND {where}" if where else "")
+    low, high = con.execute(f"SELECT min(rowid), max(rowid) FROM {table}").fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, size):
+        texts = con.execute(sql, (start, start + size, *params)).fetchone()
+        if texts[0] is None:
+            continue
+        arrays = [calendar_keys(text) if column in dates else numpy.fromstring(text, dtype=numpy.int64, sep=",")
+                  for column, text in zip(columns, texts)]
+        if len({len(values) for values in arrays}) > 1:
+            raise ValueError(f"NULL in {', '.join(columns)} of {table}")
+        yield arrays
+
+
+def date_range(column, start, end):
+    # (where, params) for start <= column <= end on ISO text; either end may be open
+    terms, params = [], []
+    if start:
+        terms.append(f"{column} >= ?")
+        params.append(str(start))
+    if end:
+        terms.append(f"{column} < date(?, '+1 day')")
+        params.append(str(end))
+    return terms, params
+
+
+def calendar_keys(text):
+    # year * 512 + month * 32 + day for comma-separated ISO dates or timestamps, read from the
+    # digits in place. Whole years between two dates are then (later - earlier) // 512, since
+    # the remainder goes negative exactly when the later date is before the anniversary, and
+    # key // 32 numbers the months.
+    chars = numpy.frombuffer(text.encode("ascii"), numpy.uint8)
+    starts = numpy.concatenate([[0], numpy.flatnonzero(chars == ord(",")) + 1])
+    if len(chars) < starts[-1] + 10 or (chars[starts + 4] != ord("-")).any() or (chars[starts + 7] != ord("-")).any():
+        raise ValueError("dates must be ISO text")
+    digits = [chars[starts + offset].astype(numpy.int64) - ord("0") for offset in (0, 1, 2, 3, 5, 6, 8, 9)]
+    year = digits[0] * 1000 + digits[1] * 100 + digits[2] * 10 + digits[3]
+    return year * 512 + (digits[4] * 10 + digits[5]) * 32 + digits[6] * 10 + digits[7]
+
+
+class Births:
+    # Every patient's birth date as a calendar key, in Patient_Id order, for joining readings
+    # to ages with searchsorted: 12 bytes a patient
+    def __init__(self, con):
+        ids, keys = [], []
+        # Patient_Id is the rowid, so the blocks come back sorted
+        for patient, dob in chunks(con, "patient", ["Patient_Id", "Dob"], "Dob IS NOT NULL", dates={"Dob"}):
+            ids.append(patient)
+            keys.append(dob.astype(numpy.int32))
+        self.ids = numpy.concatenate(ids) if ids else numpy.empty(0, numpy.int64)
+        self.keys = numpy.concatenate(keys) if keys else numpy.empty(0, numpy.int32)
+
+    def ages(self, patients, keys):
+        # Whole years on each date, -1 where the patient is unknown
+        if not len(self.ids):
+            return numpy.full(len(patients), -1)
+        at = numpy.minimum(numpy.searchsorted(self.ids, patients), len(self.ids) - 1)
+        ages = (keys - self.keys[at]) // 512
+        ages[self.ids[at] != patients] = -1
+        return ages
+
+
+class BirthIndex:
+    # Births kept between analyses, since reading every patient's Dob is a good part of one.
+    # Any write to patient reaches it through cache.listeners and drops it.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._births = None
+
+    def changed(self, tables):
+        if tables is None or "patient" in tables:
+            with self._lock:
+                self._births = None
+
+    def get(self, con):
+        with self._lock:
+            if self._births is None:
+                self._births = Births(con)
+            return self._births
+
+
+births = BirthIndex()
+cache.listeners.append(births.changed)
+
+
+def histogram_stats(counts, percentiles=PERCENTILES):
+    # Count, mean, standard deviation and nearest-rank percentiles of values binned by integer
+    total = int(counts.sum())
+    if not total:
+        return {"count": 0, "mean": None, "sd": None, "percentiles": [None] * len(percentiles)}
+    values = numpy.arange(len(counts))
+    mean = float((counts * values).sum()) / total
+    sd = math.sqrt(float((counts * (values - mean) ** 2).sum()) / total)
+    cumulative = numpy.cumsum(counts)
+    ranks = [max(1, math.ceil(total * p / 100)) for p in percentiles]
+    return {"count": total, "mean": round(mean, 1), "sd": round(sd, 1),
+            "percentiles": [int(value) for value in numpy.searchsorted(cumulative, ranks)]}
+
+
+def band_labels(bands):
+    return [f"{low}-{high - 1}" for low, high in zip(bands, bands[1:])] + [f"{bands[-1]}+"]
+
+
+def bp_by_age(con, start=None, end=None, bands=AGE_BANDS):
+    # Systolic and diastolic distributions per age band, age taken on the day of the reading.
+    # Readings are counted into (band, mmHg) bins a block at a time; every statistic comes
+    # from the bins, so the percentiles are exact.
+    require()
+    began = time.perf_counter()
+    index = births.get(con)
+    edges = numpy.array(bands)
+    size = BP_MAX + 1
+    systolic = numpy.zeros(len(bands) * size, numpy.int64)
+    diastolic = numpy.zeros(len(bands) * size, numpy.int64)
+    terms, params = date_range("Measure_Ts", start, end)
+    where = " AND ".join(["Bp_Systolic IS NOT NULL", "Bp_Diastolic IS NOT NULL"] + terms)
+    read = 0
+    # The patient and both pressures travel as one number, which is cheaper than three columns
+    for measured, packed in chunks(con, "vitals", [
+            "Measure_Ts", "Patient_Id * 1000000 + CAST(Bp_Systolic AS INTEGER) * 1000 + CAST(Bp_Diastolic AS INTEGER)"],
+            where, params, dates={"Measure_Ts"}):
+        read += len(packed)
+        patients, pressure = numpy.divmod(packed, 1000000)
+        band = numpy.searchsorted(edges, index.ages(patients, measured), side="right") - 1
+        keep = band >= 0
+        band = band[keep] * size
+        high, low = numpy.divmod(pressure[keep], 1000)
+        systolic += numpy.bincount(band + numpy.clip(high, 0, BP_MAX), minlength=len(systolic))
+        diastolic += numpy.bincount(band + numpy.clip(low, 0, BP_MAX), minlength=len(diastolic))
+    systolic = systolic.reshape(len(bands), size)
+    diastolic = diastolic.reshape(len(bands), size)
+    rows, histograms = [], {}
+    for label, sys_counts, dia_counts in zip(band_labels(bands), systolic, diastolic):
+        high, low = histogram_stats(sys_counts), histogram_stats(dia_counts)
+        rows.append([label, high["count"], high["mean"], high["sd"], *high["percentiles"],
+                     low["mean"], low["sd"], *low["percentiles"]])
+        histograms[label] = sys_counts
+    return {"headings": BP_HEADINGS, "rows": rows, "histograms": histograms, "read": read,
+            "unmatched": read - int(systolic.sum()), "seconds": round(time.perf_counter() - began, 3)}
+
+
+class GroupTotals:
+    # Running sums per int64 key, merged a block at a time, so memory follows the number of
+    # groups rather than the number of rows
+    def __init__(self, width):
+        self.keys = numpy.empty(0, numpy.int64)
+        self.sums = numpy.zeros((width, 0))
+
+    def add(self, keys, *values):
+        self.keys, inverse = numpy.unique(numpy.concatenate([self.keys, keys]), return_inverse=True)
+        self.sums = numpy.stack([numpy.bincount(inverse, numpy.concatenate([old, new]), len(self.keys))
+                                 for old, new in zip(self.sums, values)])
+
+    def groups(self):
+        # (group, "YYYY-MM", sums as integers) in group and month order
+        group, month = numpy.divmod(self.keys, 1 << 18)
+        year, month = numpy.divmod(month, 16)
+        return zip(group.tolist(), [f"{y:04d}-{m:02d}" for y, m in zip(year.tolist(), month.tolist())],
+                   numpy.rint(self.sums).astype(numpy.int64).T.tolist())
+
+
+def month_keys(group, dates):
+    # group * 2**18 + year * 16 + month, from calendar keys
+    return group * (1 << 18) + dates // 32
+
+
+def names(con, sql, ids):
+    return {row[0]: row[1:] for row in con.execute(sql, (json.dumps(sorted(set(ids))),))}
+
+
+def prescriptions(con, start=None, end=None):
+    # Prescriptions, units dispensed and refills per DIN per month; drug names are joined to
+    # the totals, not to the rows
+    require()
+    began = time.perf_counter()
+    totals = GroupTotals(3)
+    terms, params = date_range("Appointment_Date", start, end)
+    read = 0
+    for din, date, count, refills in chunks(con, "prescription", [
+            "DIN", "Appointment_Date", "CAST(med_count AS INTEGER)", "CAST(IFNULL(refills, 0) AS INTEGER)"],
+            " AND ".join(terms), params, dates={"Appointment_Date"}):
+        read += len(din)
+        totals.add(month_keys(din, date), numpy.ones(len(din)), count, refills)
+    groups = list(totals.groups())
+    drugs = names(con, "SELECT DIN, drug_name, dosage FROM drug WHERE DIN IN (SELECT value FROM json_each(?))",
+                  [din for din, _, _ in groups])
+    rows = [[din, *drugs.get(din, (None, None)), month, *sums] for din, month, sums in groups]
+    return {"headings": PRESCRIPTION_HEADINGS, "rows": rows, "read": read,
+            "seconds": round(time.perf_counter() - began, 3)}
+
+
+def money(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def revenue(con, start=None, end=None):
+    # Bills, amount billed and how much of it is paid per doctor per month; amounts are
+    # summed as integer cents
+    require()
+    began = time.perf_counter()
+    totals = GroupTotals(3)
+    terms, params = date_range("Appointment_Date", start, end)
+    read = 0
+    for doctor, date, cents, paid in chunks(con, "bill", [
+            "Doctor_Id", "Appointment_Date", "CAST(round(amount * 100) AS INTEGER)", "status = 'Paid'"],
+            " AND ".join(terms), params, dates={"Appointment_Date"}):
+        read += len(doctor)
+        totals.add(month_keys(doctor, date), numpy.ones(len(doctor)), cents, cents * paid)
+    groups = list(totals.groups())
+    doctors = names(con, "SELECT Doctor_Id, F_Name || ' ' || L_Name FROM doctor "
+                         "WHERE Doctor_Id IN (SELECT value FROM json_each(?))", [doctor for doctor, _, _ in groups])
+    rows = [[doctor, *doctors.get(doctor, (None,)), month, bills, money(billed), money(paid), money(billed - paid),
+             money(round(billed / bills))] for doctor, month, (bills, billed, paid) in groups]
+    return {"headings": REVENUE_HEADINGS, "rows": rows, "read": read,
+            "seconds": round(time.perf_counter() - began, 3)}
+
+
+def run(con, analysis, start=None, end=None):
+    if analysis == "bp":
+        return bp_by_age(con, start, end)
+    if analysis == "prescriptions":
+        return prescriptions(con, start, end)
+    if analysis == "revenue":
+        return revenue(con, start, end)
+    raise ValueError(f"analysis must be one of {', '.join(ANALYSES)}")
+
+
+def sparkline(counts, width=40):
+    # A histogram as one line of block characters, the non-empty bins squeezed into width
+    counts = numpy.asarray(counts)
+    filled = numpy.flatnonzero(counts)
+    if not len(filled):
+        return ""
+    counts = counts[filled[0]:filled[-1] + 1]
+    bins = numpy.add.reduceat(counts, numpy.linspace(0, len(counts), min(width, len(counts)), endpoint=False).astype(int))
+    levels = " ▁▂▃▄▅▆▇█"
+    return "".join(levels[math.ceil(value / bins.max() * (len(levels) - 1))] for value in bins.tolist())
+
+
+def build(path, rows, seed=0):
+    # Only patients and vitals: datagen gives each patient two readings
+    gen = datagen.Generator(max(1, rows // datagen.VITALS_PER_PATIENT), seed)
+    return datagen.generate(path, gen.patients, seed,
+                            tables=[table for table in gen.tables() if table[0] in ("patient", "vitals")])
+
+
+def bench(con, repeat):
+    # Time and peak allocation of the BP analysis, from cold (birth dates read too) and with
+    # the birth dates already loaded
+    results = {}
+    for name in ("cold", "warm"):
+        timings, peaks = [], []
+        for _ in range(repeat):
+            if name == "cold":
+                births.changed(None)
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = bp_by_age(con)
+            timings.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        seconds = sorted(timings)[len(timings) // 2]
+        results[name] = {"seconds": round(seconds, 2), "rows_per_second": round(result["read"] / seconds),
+                         "peak_mb": round(max(peaks) / 1e6, 1)}
+    return {"rows": result["read"], "chunk_rows": CHUNK_ROWS, **results}
+
+
+def print_table(result):
+    print("\t".join(result["headings"]))
+    for row in result["rows"]:
+        print("\t".join("" if value is None else str(value) for value in row))
+    for label, counts in result.get("histograms", {}).items():
+        print(f"{label:>6} systolic {sparkline(counts)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Population statistics over vitals, prescriptions and bills.")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in ANALYSES.items():
+        cmd = sub.add_parser(name, help=text.lower())
+        cmd.add_argument("--start", help="first date included")
+        cmd.add_argument("--end", help="last date included")
+    bench_cmd = sub.add_parser("bench", help="time the BP analysis on a generated patients-and-vitals database")
+    bench_cmd.add_argument("--rows", type=int, default=10_000_000, help="vitals readings")
+    bench_cmd.add_argument("--seed", type=int, default=0)
+    bench_cmd.add_argument("--repeat", type=int, default=3)
+    bench_cmd.add_argument("--data-dir", default="bench-data")
+    args = parser.parse_args(argv)
+    if numpy is None:
+        print("analytics needs numpy (pip install .[numpy])", file=sys.stderr)
+        return 1
+    if args.command == "bench":
+        path = args.db or os.path.join(args.data_dir, f"vitals-{args.rows}-seed{args.seed}.db")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            print(f"generating {path}", file=sys.stderr)
+            build(path, args.rows, args.seed)
+        pool = db.ConnectionPool(path, 1)
+        with pool.connection() as con:
+            print(json.dumps(bench(con, args.repeat)))
+        pool.close()
+        return 0
+    if args.db:
+        db.configure(args.db)
+    with db.connection() as con:
+        result = run(con, args.command, args.start, args.end)
+    print_table(result)
+    print(f"{result['read']:,} rows in {result['seconds']}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
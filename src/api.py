@@ -0,0 +1,468 @@
+import argparse
+import asyncio
+import base64
+import datetime
+import http
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sqlite3
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import cache
+import cocare
+import conditions
+import db
+import instrument
+import journal
+import scheduler
+import schema
+import search
+import vitals
+import writer
+from pager import Pager, read_page
+from queries import QUERIES
+from runner import Job, QueryCancelled, executor
+
+HOST = os.environ.get("PATIENT_API_HOST", "127.0.0.1")
+PORT = int(os.environ.get("PATIENT_API_PORT", "8080"))
+TIMEOUT = float(os.environ.get("PATIENT_API_TIMEOUT", "30"))
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+MAX_HEAD_BYTES = 16384
+KEEP_ALIVE = 15.0
+MAX_BODY_BYTES = 4 * 1024 * 1024
+WORKERS = int(os.environ.get("PATIENT_API_WORKERS", "1"))
+TABLES = [name for name, _ in schema.TABLES]
+
+log = logging.getLogger("patientdb.api")
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_cursor(last):
+    return base64.urlsafe_b64encode(json.dumps(last).encode()).decode().rstrip("=")
+
+
+def decode_cursor(value, size):
+    # A cursor is the last row's key as a JSON list, one scalar per key column
+    if not value:
+        return None
+    try:
+        after = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    except ValueError:
+        after = None
+    if (not isinstance(after, list) or len(after) != size
+            or not all(item is None or isinstance(item, (str, int, float)) for item in after)):
+        raise HttpError(400, "after is not a valid cursor")
+    return tuple(after)
+
+
+def page_size(args):
+    try:
+        size = int(args.get("limit", PAGE_SIZE))
+    except ValueError:
+        raise HttpError(400, "limit must be a number") from None
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def page(con, op, args, pager, tables):
+    # Counting is only done for the first page unless asked for, the way the grid does it
+    after = decode_cursor(args.get("after"), len(pager.key))
+    count = args.get("count", "0" if after else "1") != "0"
+    total, rows, last, has_next = read_page(con, pager, after, count, tables, op)
+    result = {"rows": rows, "next": encode_cursor(last) if has_next else None}
+    if total is not None:
+        result["total"], result["exact"] = total
+    return result
+
+
+def list_reports(args):
+    return {"reports": [
+        {
+            "name": query.name,
+            "title": query.title,
+            "columns": query.headings,
+            "params": [{"name": param.name, "label": param.label,
+                        "default": param.default() if callable(param.default) else param.default}
+                       for param in query.params],
+        }
+        for query in QUERIES.values()
+    ]}
+
+
+def report(con, op, args, name):
+    query = QUERIES.get(name)
+    if query is None:
+        raise HttpError(404, f"no report named {name!r}")
+    params = query.bind(args)
+    pager = Pager(query.sql, query.key, params, page_size(args), query.records)
+    result = page(con, op, args, pager, query.tables)
+    return {"report": name, "title": query.format_title(args), "columns": query.headings, **result}
+
+
+_layouts = {}
+
+
+def layout(con, table):
+    # Columns as SELECT * returns them (generated columns included) and the primary key,
+    # which orders the pages so each one is an index seek
+    if table not in _layouts:
+        info = con.execute(f'PRAGMA table_xinfo("{table}")').fetchall()
+        columns = [row[1] for row in info if row[6] != 1]
+        key = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+        _layouts[table] = (columns, key)
+    return _layouts[table]
+
+
+def list_tables(args):
+    return {"tables": TABLES}
+
+
+def table(con, op, args, name):
+    if name not in TABLES:
+        raise HttpError(404, f"no table named {name!r}")
+    columns, key = layout(con, name)
+    pager = Pager(f'SELECT * FROM "{name}"', [(column, False) for column in key], (), page_size(args))
+    return {"table": name, "columns": columns, **page(con, op, args, pager, (name,))}
+
+
+def find(con, op, args):
+    limit = page_size({"limit": args.get("limit", search.LIMIT)})
+    with op.phase("execute"):
+        found = search.search(con, args.get("q", ""), limit)
+    op.rows = sum(len(rows) for rows, _, _ in found.values())
+    return {table: {"matches": matches, "ranked": ranked,
+                    "rows": [{"id": ident, "title": title, "detail": detail} for ident, title, detail, _ in rows]}
+            for table, (rows, matches, ranked) in found.items()}
+
+
+def number(args, name):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HttpError(400, f"{name} must be a number") from None
+
+
+def slots(con, op, args):
+    after = datetime.datetime.fromisoformat(args["after"]) if args.get("after") else None
+    n = number(args, "n") or 10
+    with op.phase("execute"):
+        doctors = scheduler.doctors(con, number(args, "doctor"), args.get("specialty"), args.get("language"))
+        free = scheduler.schedule.free_slots(con, doctors, min(n, MAX_PAGE_SIZE), after, number(args, "patient"))
+    op.rows = len(free)
+    return {"slots": [{"date": date, "time": at, "doctor": doctor} for date, at, doctor in free]}
+
+
+def trend(con, op, args, patient_id, metric):
+    level, sql, params = vitals.trend_query(int(patient_id), metric, vitals.moment(args.get("start", "")),
+                                            vitals.moment(args.get("end", "")))
+    pager = Pager(sql, [("time", False)], params, page_size(args))
+    return {"resolution": level, "columns": ["time", "readings", "average", "minimum", "maximum"],
+            **page(con, op, args, pager, ("vitals",))}
+
+
+def listed(args, name, convert=str):
+    try:
+        return [convert(value.strip()) for value in args.get(name, "").split(",") if value.strip()]
+    except ValueError:
+        raise HttpError(400, f"{name} must be a comma-separated list") from None
+
+
+def co_care(con, op, args):
+    with op.phase("execute"):
+        ids = cocare.find(con, listed(args, "doctors", int), listed(args, "specialties"), args.get("mode", "all"),
+                          args.get("start") or None, args.get("end") or None)
+    with op.phase("fetch"):
+        rows = cocare.patients(con, ids, page_size({"limit": args.get("limit", cocare.LIMIT)}))
+    op.rows = len(rows)
+    return {"count": len(ids), "patients": [{"id": ident, "first_name": first, "last_name": last}
+                                            for ident, first, last in rows]}
+
+
+def condition_list(con, op, args):
+    filters = {name: args.get(name) or None for name in conditions.FILTERS}
+    filters["patients"] = listed(args, "patients", int)
+    filters["severity"] = listed(args, "severity")
+    filters["isolation"] = args.get("isolation", "0") not in ("0", "false", "") or None
+    pager = conditions.pager(filters, page_size(args))
+    return {"columns": conditions.HEADINGS, **page(con, op, args, pager, conditions.TABLES)}
+
+
+def health(args):
+    return {"pid": os.getpid(), "pool": db.pool.stats(), "cache": cache.results.stats(), "writes": writes.stats(),
+            "panels": cocare.panels.stats(), "replica": follower.stats() if follower else None}
+
+
+# Writes go through writer.LocalWriter in a single process and through the writer process
+# when serving with several workers
+writes = writer.LocalWriter()
+# Set when serving a read replica that follows a primary's change journal
+follower = None
+
+
+# (pattern, handler, reads the database); database handlers run on the query executor with
+# a pooled connection, the rest answer on the event loop
+ROUTES = [
+    (re.compile(r"/reports"), list_reports, False),
+    (re.compile(r"/reports/(\w+)"), report, True),
+    (re.compile(r"/tables"), list_tables, False),
+    (re.compile(r"/tables/(\w+)"), table, True),
+    (re.compile(r"/search"), find, True),
+    (re.compile(r"/slots"), slots, True),
+    (re.compile(r"/vitals/(\d+)/(\w+)"), trend, True),
+    (re.compile(r"/cocare"), co_care, True),
+    (re.compile(r"/conditions"), condition_list, True),
+    (re.compile(r"/health"), health, False),
+]
+
+
+# (pattern, writer.WRITES name) of the POST routes; the JSON body holds the arguments
+WRITE_ROUTES = [
+    (re.compile(r"/bookings"), "book"),
+    (re.compile(r"/bookings/cancel"), "cancel"),
+    (re.compile(r"/vitals"), "vitals"),
+    (re.compile(r"/bills/paid"), "pay"),
+]
+
+
+def route_write(path):
+    for pattern, name in WRITE_ROUTES:
+        if pattern.fullmatch(path.rstrip("/") or "/"):
+            return name
+    raise HttpError(404, f"no route for POST {path}")
+
+
+def route(path):
+    for pattern, handler, reads in ROUTES:
+        match = pattern.fullmatch(path.rstrip("/") or "/")
+        if match:
+            return handler, reads, match.groups()
+    raise HttpError(404, f"no route for {path}")
+
+
+def encode(result):
+    return json.dumps(result, default=str, separators=(",", ":")).encode()
+
+
+async def write(op, path, body):
+    name = route_write(path)
+    if follower:
+        raise HttpError(405, "this server is a read replica; send writes to the primary")
+    op.name = "api.write." + name
+    try:
+        args = json.loads(body or b"{}")
+    except ValueError:
+        raise HttpError(400, "body is not valid JSON") from None
+    start = time.perf_counter()
+    future = writes.submit(name, args)
+    try:
+        result = await asyncio.wait_for(asyncio.wrap_future(future), TIMEOUT)
+    finally:
+        op.phases["write"] += time.perf_counter() - start
+    return encode(result)
+
+
+async def dispatch(method, target, body=b""):
+    # Returns (status, body, operation); the operation carries the request's phase timings
+    url = urlsplit(target)
+    args = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    op = instrument.Operation("api")
+    try:
+        if method == "POST":
+            return 200, await write(op, url.path, body), op
+        if method not in ("GET", "HEAD"):
+            raise HttpError(405, f"{method} is not supported")
+        handler, reads, groups = route(url.path)
+        op.name = "api." + handler.__name__
+        if not reads:
+            with op.phase("render"):
+                return 200, encode(handler(args)), op
+        queued = time.perf_counter()
+
+        def work(con):
+            op.phases["queue"] += time.perf_counter() - queued
+            result = handler(con, op, args, *groups)
+            # Encoded on the worker so a large page does not hold up the event loop
+            with op.phase("render"):
+                return encode(result)
+
+        timeout = QUERIES[groups[0]].timeout if handler is report and groups[0] in QUERIES else None
+        job = Job(work, timeout or TIMEOUT)
+        job.future = executor.submit(job.run)
+        return 200, await asyncio.wrap_future(job.future), op
+    except HttpError as err:
+        return err.status, encode({"error": str(err)}), op
+    except scheduler.SlotTaken as err:
+        return 409, encode({"error": str(err)}), op
+    except writer.Overloaded as err:
+        return 503, encode({"error": str(err)}), op
+    except asyncio.TimeoutError:
+        return 504, encode({"error": "write timed out"}), op
+    except ValueError as err:
+        return 400, encode({"error": str(err)}), op
+    except QueryCancelled as err:
+        return 504, encode({"error": str(err)}), op
+    except sqlite3.Error as err:
+        return 500, encode({"error": str(err)}), op
+    except Exception:
+        # Whatever the request held, the client gets a response and the connection stays usable
+        log.exception("%s %s failed", method, target)
+        return 500, encode({"error": "internal error"}), op
+
+
+def server_timing(op, started):
+    entries = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in op.phases.items()]
+    if op.cached:
+        entries.append('cache;desc="hit"')
+    entries.append(f"total;dur={(time.perf_counter() - started) * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def response(status, body, timing, keep_alive, head_only):
+    lines = [
+        f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Server-Timing: {timing}",
+        "Connection: " + ("keep-alive" if keep_alive else "close"),
+    ]
+    if status == 503:
+        lines.append("Retry-After: 1")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + (b"" if head_only else body)
+
+
+async def serve_connection(reader, writer):
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE)
+            except asyncio.LimitOverrunError:
+                writer.write(response(431, b"", "", False, True))
+                break
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                break
+            started = time.perf_counter()
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = request_line.split(" ")
+            except ValueError:
+                writer.write(response(400, b"", "", False, True))
+                break
+            headers = dict(line.lower().split(":", 1) for line in header_lines if ":" in line)
+            try:
+                length = int(headers.get("content-length", "0").strip() or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                writer.write(response(400, b"", "", False, True))
+                break
+            if length > MAX_BODY_BYTES:
+                writer.write(response(413, b"", "", False, True))
+                break
+            try:
+                request_body = await reader.readexactly(length) if length else b""
+            except asyncio.IncompleteReadError:
+                break
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").strip() != "close"
+            status, body, op = await dispatch(method, target, request_body)
+            writer.write(response(status, body, server_timing(op, started), keep_alive, method == "HEAD"))
+            await writer.drain()
+            if status == 200:
+                op.finish()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT, reuse_port=False):
+    server = await asyncio.start_server(serve_connection, host, port, limit=MAX_HEAD_BYTES, reuse_port=reuse_port)
+    address = server.sockets[0].getsockname()
+    print(f"serving on http://{address[0]}:{address[1]} (pid {os.getpid()})", file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def serve_worker(index, path, host, port, requests, inbox):
+    # One read worker: read-only connections, writes sent to the writer process, and the
+    # listening port shared with the other workers through SO_REUSEPORT
+    global writes
+    db.configure(path, read_only=True)
+    writes = writer.WriterClient(index, requests, inbox)
+    try:
+        asyncio.run(serve(host, port, reuse_port=True))
+    except KeyboardInterrupt:
+        pass
+
+
+def serve_workers(workers, host=HOST, port=PORT):
+    # Several worker processes so reads and JSON rendering are not bound by one GIL, and one
+    # writer process that group-commits every write
+    path = os.path.abspath(db.pool.path)
+    context = multiprocessing.get_context("spawn")
+    # The writer opens the database first so it is in WAL mode before any worker reads it
+    process, requests, inboxes = writer.start(path, workers, context)
+    processes = [context.Process(target=serve_worker, args=(i, path, host, port, requests, inboxes[i]),
+                                 name=f"api-{i}") for i in range(workers)]
+    for worker in processes:
+        worker.start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for worker in processes:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in processes:
+            worker.terminate()
+            worker.join()
+        # The writer finishes what is queued, then stops
+        requests.put(None)
+        process.join()
+
+
+def main(argv=None):
+    global follower
+    parser = argparse.ArgumentParser(description="Serve the reports, lookups and tables as a JSON HTTP API.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="worker processes; more than one adds a single writer process")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    parser.add_argument("--follow", metavar="PRIMARY",
+                        help="serve the database as a read replica kept current from this primary's journal")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    if args.follow:
+        if args.workers > 1:
+            parser.error("a replica is served from one process")
+        db.configure(db.pool.path, read_only=True)
+        follower = journal.Follower(args.follow, db.pool.path).start()
+    if args.workers > 1:
+        serve_workers(args.workers, args.host, args.port)
+        return 0
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+import datagen
+import db
+from pager import Pager
+from queries import QUERIES
+
+FETCH_SIZE = 1000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+    }
+
+
+def bench_query(con, query, repeat):
+    params = query.bind()
+    pager = Pager(query.sql, query.key, params)
+    first_page = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pager.fetch(con)
+        first_page.append(time.perf_counter() - start)
+    # Full read of the result in report order, streamed the way an export would
+    full = []
+    rows = 0
+    sql = "SELECT * FROM (" + pager.sql + ") ORDER BY " + pager.order_by()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cur = con.execute(sql, params)
+        rows = 0
+        while True:
+            chunk = cur.fetchmany(FETCH_SIZE)
+            if not chunk:
+                break
+            rows += len(chunk)
+        full.append(time.perf_counter() - start)
+    median = statistics.median(full)
+    return {
+        "rows": rows,
+        "first_page": summarize(first_page),
+        "full": summarize(full),
+        "rows_per_sec": round(rows / median, 1) if median else None,
+    }
+
+
+def run_scale(path, repeat):
+    pool = db.ConnectionPool(path, 1)
+    results = {}
+    with pool.connection() as con:
+        for name, query in QUERIES.items():
+            results[name] = bench_query(con, query, repeat)
+    pool.close()
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {"queries": results, "peak_rss_mb": round(peak_mb, 1)}
+
+
+def database_for(data_dir, patients, seed):
+    path = os.path.join(data_dir, f"patients-{patients}-seed{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"generating {path}", file=sys.stderr)
+        datagen.generate(path, patients, seed)
+    return path
+
+
+def compare(current, baseline):
+    # Print each query whose median first-page or full-read latency moved by more than 20%
+    for scale, result in current["results"].items():
+        old = baseline.get("results", {}).get(scale)
+        if not old:
+            continue
+        for name, stats in result["queries"].items():
+            before = old["queries"].get(name)
+            if not before:
+                continue
+            for phase in ("first_page", "full"):
+                a, b = before[phase]["p50_ms"], stats[phase]["p50_ms"]
+                if a and abs(b - a) / a > 0.2:
+                    print(f"{scale} {name} {phase}: {a:.3f}ms -> {b:.3f}ms ({(b - a) / a:+.0%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every report query at several data scales.")
+    parser.add_argument("--scales", default="10k", help=f"comma separated: {', '.join(datagen.SCALES)} or numbers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--data-dir", default="bench-data")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--label", default="", help="version label stored with the results")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_scale(args.worker, args.repeat)))
+        return 0
+
+    results = {}
+    for scale in args.scales.split(","):
+        patients = datagen.scale_size(scale)
+        path = database_for(args.data_dir, patients, args.seed)
+        # Each scale runs in a fresh process so its peak RSS is not inflated by earlier scales
+        out = subprocess.run([sys.executable, __file__, "--worker", path, "--repeat", str(args.repeat)],
+                             check=True, capture_output=True, text=True).stdout
+        results[scale] = dict(json.loads(out), patients=patients)
+        print(f"{scale}: peak RSS {results[scale]['peak_rss_mb']} MB", file=sys.stderr)
+        for name, stats in results[scale]["queries"].items():
+            print(f"  {name:18} {stats['rows']:>10,} rows  first page p50 {stats['first_page']['p50_ms']:>9.3f}ms  "
+                  f"full p50 {stats['full']['p50_ms']:>10.3f}ms", file=sys.stderr)
+
+    report = {
+        "label": args.label,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
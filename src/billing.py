@@ -0,0 +1,91 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+import cache
+import db
+from pager import Pager
+from queries import QUERIES
+
+MARK_PAID = ("UPDATE bill SET status = 'Paid' "
+             "WHERE Appointment_Date = ? AND Doctor_Id = ? AND Patient_Id = ? AND status = 'Unpaid'")
+# Payer's unpaid bills up to a date, found through idx_bill_aging
+MARK_PAID_THROUGH = "UPDATE bill SET status = 'Paid' WHERE status = 'Unpaid' AND Appointment_Date <= ? AND payer = ?"
+
+
+def aging(con, as_of=None):
+    query = QUERIES["aging"]
+    params = query.bind({"as_of": as_of})
+    rows, _, _ = Pager(query.sql, query.key, params, page_size=1000, records=query.records).fetch(con)
+    return rows
+
+
+def mark_paid(con, bills):
+    # bills are (Appointment_Date, Doctor_Id, Patient_Id) primary keys; runs inside the
+    # caller's transaction and returns how many were still unpaid
+    return con.executemany(MARK_PAID, bills).rowcount
+
+
+def mark_paid_through(con, payer, through):
+    return con.execute(MARK_PAID_THROUGH, (through, payer)).rowcount
+
+
+def pay(bills=None, payer=None, through=None):
+    # Every bill in one transaction, so the summary triggers and the cache see one change
+    start = time.perf_counter()
+    with db.connection() as con:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            paid = mark_paid(con, bills) if bills is not None else mark_paid_through(con, payer, through)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+    if paid:
+        cache.invalidate("bill")
+    return {"paid": paid, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def bill_keys(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield row["Appointment_Date"], int(row["Doctor_Id"]), int(row["Patient_Id"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bill aging by payer and batch payment.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    aging_cmd = sub.add_parser("aging", help="unpaid amounts by payer in 0-30/31-60/61-90/90+ day buckets")
+    aging_cmd.add_argument("--as-of")
+    pay_cmd = sub.add_parser("pay", help="mark bills paid in one transaction")
+    pay_cmd.add_argument("bills", nargs="?", help="CSV with Appointment_Date, Doctor_Id and Patient_Id columns")
+    pay_cmd.add_argument("--payer", help="instead of a file, every unpaid bill of this payer ...")
+    pay_cmd.add_argument("--through", help="... dated on or before this day")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    if args.command == "aging":
+        start = time.perf_counter()
+        with db.connection() as con:
+            rows = aging(con, args.as_of)
+        print(f"{'payer':<12}{'0-30':>14}{'31-60':>14}{'61-90':>14}{'90+':>14}{'bills':>10}{'total':>16}")
+        for row in rows:
+            print(f"{row.payer:<12}{row.current:>14,}{row.days_31_60:>14,}{row.days_61_90:>14,}{row.over_90:>14,}"
+                  f"{row.bills:>10,}{row.total:>16,}")
+        print(f"{(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr)
+        return 0
+    if args.bills:
+        result = pay(bills=bill_keys(args.bills))
+    elif args.payer and args.through:
+        result = pay(payer=args.payer, through=args.through)
+    else:
+        parser.error("pay needs a CSV file or --payer and --through")
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+MAX_ENTRIES = int(os.environ.get("PATIENT_CACHE_ENTRIES", "512"))
+MAX_BYTES = int(os.environ.get("PATIENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+TTL = float(os.environ.get("PATIENT_CACHE_TTL", "300"))
+
+
+def size_of(value):
+    # Rough deep size of the nested tuples/lists a page read returns
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(size_of(item) for item in value)
+    return size
+
+
+class ResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, tables, size, expires = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, tables):
+        size = size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, frozenset(t.lower() for t in tables), size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_load(self, key, tables, load):
+        # Concurrent misses on one key run a single load; the others wait for its result
+        # rather than repeating the same query on every worker.
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            pending = self._loading.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._loading[key] = Future()
+        if not owner:
+            return pending.result()
+        try:
+            value = load()
+            self.put(key, value, tables)
+        except BaseException as err:
+            pending.set_exception(err)
+            raise
+        else:
+            pending.set_result(value)
+        finally:
+            with self._lock:
+                del self._loading[key]
+        return value
+
+    def invalidate(self, *tables):
+        # Called by every write path with the tables it touched; only reports that read
+        # one of those tables are evicted.
+        tables = {t.lower() for t in tables}
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] & tables]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+results = ResultCache()
+
+# Other in-memory structures derived from tables (the schedule index) register here to
+# hear about writes; they are called with the tables written, or None for everything.
+listeners = []
+
+
+def invalidate(*tables, skip=()):
+    # skip holds the listeners that have already applied the write in place
+    results.invalidate(*tables)
+    for listener in listeners:
+        if listener not in skip:
+            listener({t.lower() for t in tables})
+
+
+def clear():
+    results.clear()
+    for listener in listeners:
+        listener(None)
@@ -0,0 +1,180 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+import cache
+import db
+import scheduler
+
+MODES = ("all", "any", "exactly")
+LIMIT = 100
+
+# appt_counts is the trigger-maintained (Doctor_Id, Patient_Id) summary of booked, so each
+# doctor's patients come back distinct and in order; decoding them as JSON is several times
+# faster than converting each id
+LOAD = "SELECT Doctor_Id, json_group_array(Patient_Id) FROM appt_counts GROUP BY Doctor_Id"
+LOAD_DOCTOR = "SELECT Patient_Id FROM appt_counts WHERE Doctor_Id = ? ORDER BY Patient_Id"
+# Date-bounded panels come straight from idx_booked_schedule (Doctor_Id, Appointment_Date, ...)
+IN_RANGE = """
+    SELECT Patient_Id FROM booked
+    WHERE Doctor_Id IN (SELECT value FROM json_each(?1))
+      AND Appointment_Date BETWEEN IFNULL(?2, '0000-01-01') AND IFNULL(?3, '9999-12-31')
+"""
+# Candidates who saw no doctor outside the allowed ones, read per patient from the primary key
+ONLY_ALLOWED = """
+    SELECT Patient_Id FROM booked
+    WHERE Patient_Id IN (SELECT value FROM json_each(?1))
+      AND Appointment_Date BETWEEN IFNULL(?3, '0000-01-01') AND IFNULL(?4, '9999-12-31')
+    GROUP BY Patient_Id
+    HAVING COUNT(CASE WHEN Doctor_Id NOT IN (SELECT value FROM json_each(?2)) THEN 1 END) = 0
+"""
+PATIENTS = """
+    SELECT Patient_Id, F_Name, L_Name FROM patient
+    WHERE Patient_Id IN (SELECT value FROM json_each(?))
+    ORDER BY Patient_Id
+"""
+
+
+class Panels:
+    # Every doctor's panel, the patients they have ever had a booking with, as a sorted
+    # array('q') of Patient_Ids: 8 bytes per doctor-patient pair, about 24MB for 3M
+    # bookings. Built from appt_counts on first use. Bookings and cancellations made
+    # through scheduler are applied in place (a cancellation re-reads that one doctor); any
+    # other write to booked reaches it through cache.listeners and reloads it.
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._panels = None
+        self._stale = set()
+        self.load_seconds = None
+
+    def changed(self, tables):
+        if tables is None or "booked" in tables:
+            with self._lock:
+                self._panels = None
+
+    def booked(self, patient_id, doctor_id, date):
+        with self._lock:
+            if self._panels is None:
+                return
+            panel = self._panels.setdefault(doctor_id, array("q"))
+            i = bisect_left(panel, patient_id)
+            if i == len(panel) or panel[i] != patient_id:
+                panel.insert(i, patient_id)
+
+    def cancelled(self, patient_id, doctor_id, date):
+        # The patient may have other bookings with the doctor, so the panel is re-read
+        with self._lock:
+            if self._panels is not None:
+                self._stale.add(doctor_id)
+
+    def ensure(self, con):
+        with self._lock:
+            if self._panels is None:
+                start = time.perf_counter()
+                self._panels = {doctor: array("q", json.loads(ids)) for doctor, ids in con.execute(LOAD)}
+                self._stale.clear()
+                self.load_seconds = time.perf_counter() - start
+            for doctor in self._stale:
+                self._panels[doctor] = array("q", [row[0] for row in con.execute(LOAD_DOCTOR, (doctor,))])
+            self._stale.clear()
+
+    def patients(self, con, doctor_ids, start=None, end=None):
+        # Union of the doctors' panels, optionally limited to bookings in [start, end]
+        if start or end:
+            return {row[0] for row in con.execute(IN_RANGE, (json.dumps(doctor_ids), start, end))}
+        with self._lock:
+            self.ensure(con)
+            found = set()
+            for doctor in doctor_ids:
+                found.update(self._panels.get(doctor, ()))
+            return found
+
+    def stats(self):
+        with self._lock:
+            if self._panels is None:
+                return {"loaded": False}
+            return {
+                "loaded": True,
+                "doctors": len(self._panels),
+                "pairs": sum(len(panel) for panel in self._panels.values()),
+                "bytes": sum(panel.itemsize * len(panel) for panel in self._panels.values()),
+                "load_ms": round(self.load_seconds * 1000, 1),
+            }
+
+
+panels = Panels()
+cache.listeners.append(panels.changed)
+scheduler.indexes.append(panels)
+
+
+def specialty_doctors(con, specialty):
+    # Every doctor of the specialty, inactive ones included, since their history still counts
+    doctors = [row[0] for row in con.execute(
+        "SELECT Doctor_Id FROM doctor WHERE Specialty = ? COLLATE NOCASE ORDER BY Doctor_Id", (specialty,))]
+    if not doctors:
+        raise ValueError(f"no doctors with specialty {specialty!r}")
+    return doctors
+
+
+def find(con, doctors=(), specialties=(), mode="all", start=None, end=None):
+    # Patients seen by all / any of the groups, where each doctor is a group of one and each
+    # specialty the group of its doctors. "exactly" is "all" and no doctor outside the
+    # groups. Returns sorted Patient_Ids.
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    groups = [[int(doctor)] for doctor in doctors] + [specialty_doctors(con, name) for name in specialties]
+    if not groups:
+        raise ValueError("give at least one doctor or specialty")
+    sets = sorted((panels.patients(con, group, start, end) for group in groups), key=len)
+    if mode == "any":
+        found = set().union(*sets)
+    else:
+        found = sets[0]
+        for other in sets[1:]:
+            found &= other
+    if mode == "exactly" and found:
+        allowed = sorted({doctor for group in groups for doctor in group})
+        found = {row[0] for row in con.execute(ONLY_ALLOWED, (json.dumps(sorted(found)), json.dumps(allowed),
+                                                               start, end))}
+    return sorted(found)
+
+
+def patients(con, ids, limit=LIMIT):
+    return con.execute(PATIENTS, (json.dumps(ids[:limit]),)).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find patients seen by all, any or exactly a set of doctors.")
+    parser.add_argument("--doctor", type=int, action="append", default=[])
+    parser.add_argument("--specialty", action="append", default=[])
+    parser.add_argument("--mode", choices=MODES, default="all")
+    parser.add_argument("--start", help="only bookings on or after this date")
+    parser.add_argument("--end", help="only bookings on or before this date")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    with db.connection() as con:
+        start = time.perf_counter()
+        panels.ensure(con)
+        loaded = time.perf_counter()
+        try:
+            ids = find(con, args.doctor, args.specialty, args.mode, args.start, args.end)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return 1
+        done = time.perf_counter()
+        for row in patients(con, ids, args.limit):
+            print(*row)
+    print(f"{len(ids)} patients; panels {(loaded - start) * 1000:.1f}ms {json.dumps(panels.stats())}, "
+          f"query {(done - loaded) * 1000:.1f}ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
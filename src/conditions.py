@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import datagen
+import db
+from pager import Pager
+from records import RecordFactory
+
+LIMIT = 100
+STATUSES = ("active", "resolved", "remission", "unknown")
+SEVERITIES = ("mild", "moderate", "severe", "critical")
+TABLES = ("conditions", "condition_details", "diagnosis", "chronic_condition", "infectious_condition",
+          "injury_condition", "mental_health_condition")
+KEY = [("Condition_Id", False)]
+
+CODE = "IFNULL(cd.Code_System, dg.Code_System) || ' ' || IFNULL(cd.Code, dg.Code)"
+# Condition_Type -> (subtype table, its attributes as one JSON object). The subtype table is
+# always aliased s.
+SUBTYPES = {
+    "chronic": ("chronic_condition", "json_object('lifestyle modifiable', s.Is_Lifestyle_Modifiable, "
+                "'long-term medication', s.Long_Term_Med_Required, 'follow-up months', s.Follow_Up_Interval_Months)"),
+    "infectious": ("infectious_condition", "json_object('pathogen', s.Pathogen_Type, 'isolation', s.Isolation_Required)"),
+    "injury": ("injury_condition", "json_object('type', s.Injury_Type, 'site', s.Body_Site, 'laterality', s.Laterality, "
+               "'cause', s.Cause, 'injured', s.Date_Of_Injury)"),
+    "mental_health": ("mental_health_condition", "json_object('category', s.Disorder_Category, 'episode', s.Episode, "
+                      "'treatment', s.Treatment_Type, 'risk factor', s.Risk_Factor)"),
+}
+TYPES = tuple(SUBTYPES)
+# One branch per Condition_Type, joined to its own subtype table only; a LEFT JOIN gated on
+# the type would still probe all four tables for every condition. Starting from diagnosis
+# lets a type or diagnosis filter read just the matching conditions from
+# idx_conditions_diagnosis, while a patient filter starts from the patient's conditions.
+BRANCH = f"""
+    SELECT c.Condition_Id, c.Patient_Id, c.Diagnosis_Name AS Diagnosis, dg.Condition_Type AS Type, {CODE} AS Code,
+           c.Onset_Date AS Onset, cd.Abatement_Date AS Abated, cd.Clinical_Status AS Status, cd.Severity,
+           cd.Doctor_Id, {{details}} AS Details
+    FROM diagnosis dg
+    JOIN conditions c ON c.Diagnosis_Name = dg.Diagnosis_Name
+    LEFT JOIN condition_details cd ON cd.Condition_Id = c.Condition_Id
+    {{subtype}}
+    WHERE {{where}}
+"""
+# Types without a subtype table still come back, with no details
+OTHER = "dg.Condition_Type NOT IN (" + ", ".join(f"'{kind}'" for kind in TYPES) + ")"
+HEADINGS = ["Condition", "Patient", "Diagnosis", "Type", "Code", "Onset", "Abated", "Status", "Severity", "Doctor",
+            "Details"]
+
+# name -> (WHERE term, how the value binds, the only type it can match). Terms are added in
+# this order, so a set of filters always produces the same statement text.
+FILTERS = {
+    "patient": ("c.Patient_Id = ?", int, None),
+    "patients": ("c.Patient_Id IN (SELECT value FROM json_each(?))", lambda ids: json.dumps([int(i) for i in ids]),
+                 None),
+    "type": (None, str, None),
+    "diagnosis": ("c.Diagnosis_Name = ?", str, None),
+    "status": ("cd.Clinical_Status = ?", str, None),
+    "severity": ("cd.Severity IN (SELECT value FROM json_each(?))", json.dumps, None),
+    "doctor": ("cd.Doctor_Id = ?", int, None),
+    "onset_from": ("c.Onset_Date >= ?", str, None),
+    "onset_to": ("c.Onset_Date <= ?", str, None),
+    "follow_up_months": ("s.Follow_Up_Interval_Months <= ?", int, "chronic"),
+    "isolation": ("s.Isolation_Required = ?", lambda required: "Y" if required else "N", "infectious"),
+    "pathogen": ("s.Pathogen_Type = ?", str, "infectious"),
+}
+LABELS = {"chronic": "Chronic", "infectious": "Infectious", "injury": "Injury", "mental_health": "Mental health"}
+
+records = RecordFactory("conditions", {"Onset": "date", "Abated": "date", "Details": "json"})
+
+
+def query(filters):
+    # (sql, params) for the conditions matching every given filter; None values are ignored
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"unknown filters: {', '.join(sorted(unknown))}")
+    terms, params = [], []
+    kinds = {None, *TYPES}
+    for name, (term, bind, kind) in FILTERS.items():
+        value = filters.get(name)
+        if value is None or value == [] or value == "":
+            continue
+        try:
+            value = bind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"bad value for {name}: {value!r}") from None
+        if name == "type":
+            if value not in TYPES:
+                raise ValueError(f"type must be one of {', '.join(TYPES)}")
+            kinds &= {value}
+            continue
+        if kind is not None:
+            kinds &= {kind}
+        terms.append(term)
+        params.append(value)
+    if not kinds:
+        raise ValueError("the filters are for different condition types")
+    branches = []
+    for kind in (*TYPES, None):
+        if kind not in kinds:
+            continue
+        if kind is None:
+            branch = BRANCH.format(details="NULL", subtype="", where=" AND ".join([OTHER] + terms))
+        else:
+            table, details = SUBTYPES[kind]
+            branch = BRANCH.format(details=details, subtype=f"LEFT JOIN {table} s ON s.Condition_Id = c.Condition_Id",
+                                   where=" AND ".join([f"dg.Condition_Type = '{kind}'"] + terms))
+        branches.append(branch)
+    return "UNION ALL".join(branches), params * len(branches)
+
+
+def pager(filters, page_size=LIMIT):
+    sql, params = query(filters)
+    return Pager(sql, KEY, params, page_size, records)
+
+
+def find(con, filters, limit=LIMIT):
+    rows, _, _ = pager(filters, limit).fetch(con)
+    return rows
+
+
+def describe(kind, details):
+    # "Chronic: follow-up months 6, ..." from the Type and Details columns
+    values = ", ".join(f"{name} {value}" for name, value in (details or {}).items() if value is not None)
+    label = LABELS.get(kind, kind)
+    return f"{label}: {values}" if values else label
+
+
+# Benchmark cases over a generated database, one statement each
+CASES = {
+    "patient": {"patient": None},
+    "cohort of 1,000": {"patients": None},
+    "active severe chronic, follow-up within 3 months": {"type": "chronic", "status": "active",
+                                                          "severity": ["severe", "critical"], "follow_up_months": 3},
+    "infectious needing isolation": {"type": "infectious", "isolation": True},
+    "active viral isolation cases since 2024": {"status": "active", "isolation": True, "pathogen": "virus",
+                                                "onset_from": "2024-01-01"},
+    "one diagnosis": {"diagnosis": None},
+}
+
+
+def build(path, count, seed=0):
+    # Only the condition tables, with count conditions: datagen gives every other patient one
+    gen = datagen.Generator(count * 2, seed)
+    return datagen.generate(path, count * 2, seed, tables=[table for table in gen.tables() if table[0] in TABLES])
+
+
+def timed(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - start)
+    return result, round(sorted(timings)[len(timings) // 2] * 1000, 2)
+
+
+def bench(con, repeat):
+    # The patients and diagnosis the cases look for are taken from the data
+    patient, diagnosis = con.execute(
+        "SELECT Patient_Id, Diagnosis_Name FROM conditions ORDER BY Condition_Id LIMIT 1 OFFSET 1000").fetchone()
+    cohort = [row[0] for row in con.execute("SELECT Patient_Id FROM conditions WHERE Condition_Id % 97 = 0 LIMIT 1000")]
+    fill = {"patient": patient, "patients": cohort, "diagnosis": diagnosis}
+    results = {}
+    for name, case in CASES.items():
+        filters = {key: fill[key] if value is None else value for key, value in case.items()}
+        sql, params = query(filters)
+        plan = [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params) if row[3].startswith("SEARCH")]
+        _, first_page = timed(repeat, lambda: pager(filters).fetch(con))
+        rows, full = timed(repeat, lambda: con.execute(sql, params).fetchall())
+        results[name] = {"rows": len(rows), "first_page_ms": first_page, "full_ms": full, "plan": plan}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find conditions with their subtype details, or benchmark the lookup.")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find_cmd = sub.add_parser("find", help="conditions matching every filter given")
+    find_cmd.add_argument("--patient", type=int)
+    find_cmd.add_argument("--type", choices=TYPES)
+    find_cmd.add_argument("--diagnosis")
+    find_cmd.add_argument("--status", choices=STATUSES)
+    find_cmd.add_argument("--severity", choices=SEVERITIES, action="append")
+    find_cmd.add_argument("--doctor", type=int)
+    find_cmd.add_argument("--onset-from")
+    find_cmd.add_argument("--onset-to")
+    find_cmd.add_argument("--follow-up-months", type=int, help="chronic conditions followed up at most this often")
+    find_cmd.add_argument("--isolation", action="store_true", default=None,
+                          help="infectious conditions requiring isolation")
+    find_cmd.add_argument("--pathogen")
+    find_cmd.add_argument("--limit", type=int, default=20)
+    bench_cmd = sub.add_parser("bench", help="time the lookup on a generated conditions-only database")
+    bench_cmd.add_argument("--conditions", type=int, default=1_000_000)
+    bench_cmd.add_argument("--seed", type=int, default=0)
+    bench_cmd.add_argument("--repeat", type=int, default=5)
+    bench_cmd.add_argument("--data-dir", default="bench-data")
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        path = args.db or os.path.join(args.data_dir, f"conditions-{args.conditions}-seed{args.seed}.db")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            print(f"generating {path}", file=sys.stderr)
+            build(path, args.conditions, args.seed)
+        pool = db.ConnectionPool(path, 1)
+        with pool.connection() as con:
+            for name, result in bench(con, args.repeat).items():
+                print(f"{name:50} {result['rows']:>8,} rows  first page {result['first_page_ms']:>8.2f}ms  "
+                      f"all {result['full_ms']:>8.2f}ms")
+                print(f"    {' / '.join(dict.fromkeys(result['plan']))}")
+        pool.close()
+        return 0
+    if args.db:
+        db.configure(args.db)
+    filters = {name: getattr(args, name) for name in FILTERS if hasattr(args, name)}
+    with db.connection() as con:
+        start = time.perf_counter()
+        try:
+            rows = find(con, filters, args.limit)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return 1
+        for row in rows:
+            print(*row[:-1], describe(row.type, row.details))
+    print(f"{len(rows)} conditions in {(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import db
+import migrations
+import schema
+
+FIRST_NAMES = ["John", "Amanda", "Sandra", "James", "Julian", "Avery", "Addison", "Robert", "Meredith", "Christina",
+               "Allison", "Anita", "Gregory", "Preston", "Olivia", "Liam", "Noah", "Emma", "Mia", "Lucas"]
+LAST_NAMES = ["Smith", "Emerson", "Jones", "Montgomery", "Wilson", "House", "Chase", "Burke", "Grey", "Yang",
+              "Cameron", "Akavan", "Nguyen", "Patel", "Brown", "Tremblay", "Roy", "Gagnon", "Lee", "Martin"]
+STREETS = ["Bathurst St.", "Sheppard Ave W", "Oakwood Ave.", "Yonge St.", "Queen St. E", "Dundas St. W"]
+SPECIALTIES = ["Gynecology", "Oncology", "Cardiology", "Immunology", "Psychology", "Dermatology", "Pediatrics", None]
+LANGUAGES = ["English", "French", "Spanish", "German", "Mandarin", "Persian", "English, Russian", None]
+REASONS = ["Annual check-up", "Follow-up", "Initial consultation", "Allergic reaction/rash", "Lab results", None]
+PROCEDURES = ["Physical", "Consult", "Imaging", "Bloodwork", "Vaccine"]
+CONDITION_TYPES = ["chronic", "infectious", "mental_health", "injury"]
+CODE_SYSTEMS = {"chronic": "ICD-10", "infectious": "ICD-10", "injury": "ICD-11", "mental_health": "DSM-5-TR"}
+
+# Appointment slots per doctor per day (30 minutes apart from 08:00)
+SLOTS = [f"{8 + i // 2:02d}:{30 * (i % 2):02d}" for i in range(16)]
+PATIENTS_PER_DOCTOR = 500
+APPOINTMENTS_PER_PATIENT = 3
+VITALS_PER_PATIENT = 2
+DIAGNOSES = 40
+DRUGS = 500
+# Appointments end on a fixed date rather than today so a seed always yields the same rows
+LAST_DAY = datetime.date(2025, 12, 31)
+
+SCALES = {"fixture": 1000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+
+
+def scale_size(value):
+    return SCALES[value] if value in SCALES else int(value)
+
+
+def coprime_stride(n):
+    stride = 1_000_003
+    while math.gcd(stride, n) != 1:
+        stride += 2
+    return stride
+
+
+class Generator:
+    # Keys are pure functions of the row index and each table draws from its own seeded
+    # stream, so the same seed and scale always produce the same database and nothing has
+    # to be kept in memory between tables.
+    def __init__(self, patients, seed=0):
+        self.patients = patients
+        self.seed = seed
+        self.doctors = max(10, patients // PATIENTS_PER_DOCTOR)
+        self.appointments = patients * APPOINTMENTS_PER_PATIENT
+        self.stride = coprime_stride(patients)
+        days = math.ceil(self.appointments / (self.doctors * len(SLOTS)))
+        self.first_day = LAST_DAY - datetime.timedelta(days=days)
+
+    def rng(self, table):
+        return random.Random(f"{self.seed}/{table}")
+
+    def patient_id(self, n):
+        return 100000000 + n
+
+    def doctor_id(self, n):
+        return 100000 + n
+
+    def appointment(self, i):
+        # Appointment i fills slot i % SLOTS of doctor (i // SLOTS) % doctors on day
+        # i // (SLOTS * doctors). A doctor/day/slot is therefore used once, and because the
+        # patient index is a bijection of i, no patient appears twice within one day.
+        per_day = len(SLOTS) * self.doctors
+        day = self.first_day + datetime.timedelta(days=i // per_day)
+        doctor = self.doctor_id((i // len(SLOTS)) % self.doctors)
+        patient = self.patient_id((i * self.stride) % self.patients)
+        return day.isoformat(), patient, doctor, SLOTS[i % len(SLOTS)]
+
+    def patient_rows(self):
+        r = self.rng("patient")
+        for n in range(self.patients):
+            first, last = r.choice(FIRST_NAMES), r.choice(LAST_NAMES)
+            dob = datetime.date(1930, 1, 1) + datetime.timedelta(days=r.randrange(34000))
+            email = f"{first.lower()}.{last.lower()}{n}@example.com" if r.random() < 0.8 else None
+            phone = f"{r.choice(['416', '905', '289', '647'])}-{r.randrange(1000):03d}-{r.randrange(10000):04d}" \
+                if r.random() < 0.9 else None
+            insurance = r.choice(["SF", "GS", "MC", "BC"]) + f"{r.randrange(10**8):08d}" if r.random() < 0.7 else None
+            yield (self.patient_id(n), first, r.choice("ABCDEFGH") if r.random() < 0.5 else None, last,
+                   r.choice("MFX"), dob.isoformat(), f"{r.randrange(1, 999)} {r.choice(STREETS)}", email, phone,
+                   insurance)
+
+    def doctor_rows(self):
+        r = self.rng("doctor")
+        for n in range(self.doctors):
+            yield (self.doctor_id(n), r.choice(FIRST_NAMES), r.choice(LAST_NAMES), r.choice("MFX"),
+                   str(4000 + n % 6000), r.choice(SPECIALTIES), r.choice(LANGUAGES),
+                   "Active" if r.random() < 0.9 else "Inactive")
+
+    def booked_rows(self):
+        r = self.rng("booked")
+        for i in range(self.appointments):
+            date, patient, doctor, slot = self.appointment(i)
+            yield date, patient, doctor, slot, r.choice(REASONS)
+
+    def bill_rows(self):
+        r = self.rng("bill")
+        for i in range(self.appointments):
+            if i % 10 >= 8:
+                continue
+            date, patient, doctor, _ = self.appointment(i)
+            yield (r.choice(["Insurance", "Patient"]), "Unpaid" if r.random() < 0.3 else "Paid",
+                   round(r.uniform(20, 900), 2), date, patient, doctor)
+
+    def procedure_rows(self):
+        r = self.rng("procedure")
+        for i in range(0, self.appointments, 5):
+            date, patient, doctor, _ = self.appointment(i)
+            yield (None, r.choice(PROCEDURES), f"Exam Room {r.randrange(1, 12)}", "Generated procedure note.",
+                   date, patient, doctor)
+
+    def drug_rows(self):
+        r = self.rng("drug")
+        for n in range(DRUGS):
+            yield 1000000000 + n, f"Drug {n:04d}", r.choice([5, 10, 20, 50, 250, 325, 500])
+
+    def prescription_rows(self):
+        r = self.rng("prescription")
+        for i in range(self.appointments):
+            if i % 10 >= 3:
+                continue
+            date, patient, doctor, _ = self.appointment(i)
+            yield (1000000000 + r.randrange(DRUGS), r.choice([14, 30, 60, 90]), r.randrange(4), r.randrange(1, 4),
+                   date, patient, doctor)
+
+    def diagnosis(self, n):
+        kind = CONDITION_TYPES[n % len(CONDITION_TYPES)]
+        return CODE_SYSTEMS[kind], f"G{n:03d}", f"Generated {kind} {n}", kind
+
+    def diagnosis_rows(self):
+        for n in range(DIAGNOSES):
+            yield self.diagnosis(n)
+
+    def condition(self, n):
+        # Every other patient has one condition. Its diagnosis and onset are arithmetic in n
+        # so the base row and its detail/subtype rows agree without sharing state.
+        diagnosis = self.diagnosis((n * 7919 + self.seed) % DIAGNOSES)
+        onset = datetime.date(2015, 1, 1) + datetime.timedelta(days=(n * 104729 + self.seed) % 3650)
+        return n + 1, self.patient_id(2 * n), diagnosis, onset.isoformat()
+
+    def condition_count(self):
+        return (self.patients + 1) // 2
+
+    def condition_rows(self):
+        for n in range(self.condition_count()):
+            condition_id, patient, diagnosis, onset = self.condition(n)
+            yield condition_id, patient, diagnosis[2], onset
+
+    def condition_detail_rows(self):
+        r = self.rng("condition_details")
+        for n in range(self.condition_count()):
+            condition_id, patient, diagnosis, onset = self.condition(n)
+            status = r.choice(["active", "active", "resolved", "remission", "unknown"])
+            abatement = onset if status == "resolved" else None
+            yield (condition_id, patient, diagnosis[0], diagnosis[1], onset, abatement, status,
+                   r.choice(["mild", "moderate", "severe", "critical"]), self.doctor_id(r.randrange(self.doctors)))
+
+    def subtype_rows(self, kind):
+        r = self.rng(kind)
+        for n in range(self.condition_count()):
+            condition_id, _, diagnosis, onset = self.condition(n)
+            if diagnosis[3] != kind:
+                continue
+            if kind == "chronic":
+                yield condition_id, r.choice("YN"), r.choice("YN"), r.choice([1, 3, 6, 12])
+            elif kind == "infectious":
+                yield condition_id, r.choice(["virus", "bacteria", "fungus", "parasite", "unknown"]), r.choice("YN")
+            elif kind == "injury":
+                yield (condition_id, r.choice(["fracture", "sprain", "laceration"]), r.choice(["arm", "leg", "head"]),
+                       r.choice(["left", "right", "bilateral", "midline", "na"]), r.choice(["fall", "sport", "vehicle"]),
+                       onset)
+            else:
+                yield (condition_id, r.choice(["Mood Disorder", "Anxiety Disorder"]),
+                       r.choice(["initial", "acute", "partial remission", "full remission", "multiple", "na"]),
+                       r.choice(["Cognitive Behavioral Therapy", "Medication"]), r.choice(["Family History", None]))
+
+    def vitals_rows(self):
+        r = self.rng("vitals")
+        for n in range(self.patients):
+            height = round(r.uniform(150, 195), 2)
+            for k in range(VITALS_PER_PATIENT):
+                ts = self.first_day - datetime.timedelta(days=30 * (k + 1))
+                yield (self.patient_id(n), ts.isoformat(), height, round(r.uniform(45, 120), 2), r.randrange(95, 170),
+                       r.randrange(55, 105), r.randrange(50, 110), r.randrange(10, 24),
+                       round(r.uniform(35.8, 38.5), 1), r.randrange(90, 101))
+
+    def tables(self):
+        return [
+            ("patient", 10, self.patient_rows),
+            ("doctor", 8, self.doctor_rows),
+            ("booked", 5, self.booked_rows),
+            ("bill", 6, self.bill_rows),
+            ("medical_procedure", 7, self.procedure_rows),
+            ("drug", 3, self.drug_rows),
+            ("prescription", 7, self.prescription_rows),
+            ("diagnosis", 4, self.diagnosis_rows),
+            ("conditions", 4, self.condition_rows),
+            ("condition_details", 9, self.condition_detail_rows),
+            ("chronic_condition", 4, lambda: self.subtype_rows("chronic")),
+            ("infectious_condition", 3, lambda: self.subtype_rows("infectious")),
+            ("injury_condition", 6, lambda: self.subtype_rows("injury")),
+            ("mental_health_condition", 5, lambda: self.subtype_rows("mental_health")),
+            ("vitals", 10, self.vitals_rows),
+        ]
+
+
+def column_list(con, table):
+    # Generated columns (vitals.BMI) are hidden from table_info and cannot be inserted
+    return [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+
+
+def generate(path, patients, seed=0, progress=None, tables=None):
+    # tables narrows the load to some of Generator.tables(); the schema is always complete
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    gen = Generator(patients, seed)
+    counts = {}
+    start = time.perf_counter()
+    pool = db.ConnectionPool(path, 1)
+    with pool.connection() as con:
+        con.execute("PRAGMA synchronous = OFF")
+        schema.create_tables(con)
+        for table, width, rows in tables or gen.tables():
+            columns = column_list(con, table)
+            assert len(columns) == width, table
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * width)})"
+            table_start = time.perf_counter()
+            con.execute("BEGIN")
+            cur = con.executemany(sql, rows())
+            con.execute("COMMIT")
+            counts[table] = cur.rowcount
+            if progress is not None:
+                progress(table, cur.rowcount, time.perf_counter() - table_start)
+        # Indexes and summary tables are built once over the loaded data rather than per row
+        migrations.migrate(con)
+        con.execute("ANALYZE")
+    pool.close()
+    return {"path": path, "patients": patients, "seed": seed, "rows": counts,
+            "seconds": round(time.perf_counter() - start, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic patient database.")
+    parser.add_argument("path")
+    parser.add_argument("--scale", default="10k", help=f"patients: {', '.join(SCALES)} or a number")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    def progress(table, rows, seconds):
+        print(f"{table}: {rows:,} rows in {seconds:.1f}s", file=sys.stderr)
+
+    print(json.dumps(generate(args.path, scale_size(args.scale), args.seed, progress)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import instrument
+
+# Path can be overridden so the app is not tied to the working directory it is started from
+DB_PATH = os.environ.get("PATIENT_DB_PATH", "data.db")
+POOL_SIZE = int(os.environ.get("PATIENT_DB_POOL_SIZE", "8"))
+CHECKOUT_TIMEOUT = 30.0
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-32000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def open_connection(path, read_only=False):
+    con = sqlite3.connect(path, check_same_thread=False, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        con.execute(pragma)
+    if read_only:
+        # Read workers leave every write to the writer process; WAL lets them read alongside it
+        con.execute("PRAGMA query_only=1")
+    instrument.attach(con)
+    return con
+
+
+class PoolExhausted(sqlite3.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, read_only=False):
+        self.path = path
+        self.size = size
+        self.read_only = read_only
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._live < self.size:
+                self._live += 1
+                grow = True
+            else:
+                grow = False
+        if grow:
+            try:
+                return open_connection(self.path, self.read_only)
+            except Exception:
+                with self._lock:
+                    self._live -= 1
+                raise
+        try:
+            return self._idle.get(timeout=CHECKOUT_TIMEOUT)
+        except queue.Empty:
+            raise PoolExhausted(f"all {self.size} connections to {self.path} stayed checked out "
+                                f"for {CHECKOUT_TIMEOUT:g}s") from None
+
+    def checkout(self):
+        start = time.perf_counter()
+        con = self._acquire()
+        instrument.sample_trace(con)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return con
+
+    def release(self, con):
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            self.discard(con)
+            return
+        self._idle.put(con)
+
+    @contextmanager
+    def connection(self):
+        con = self.checkout()
+        try:
+            yield con
+        except Exception:
+            # The statement that raised has finished, so rolling back leaves the connection
+            # as good as new; that covers caller errors and interrupted queries alike
+            self.release(con)
+            raise
+        except BaseException:
+            self.discard(con)
+            raise
+        else:
+            self.release(con)
+
+    def discard(self, con):
+        # For a connection whose state is unknown: one abandoned by KeyboardInterrupt or
+        # SystemExit part way through a step, or one that could not roll back
+        try:
+            con.close()
+        finally:
+            with self._lock:
+                self._live -= 1
+
+    def close(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(con)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": self.size,
+                "read_only": self.read_only,
+                "live": self._live,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+pool = ConnectionPool()
+
+
+def connection():
+    return pool.connection()
+
+
+def configure(path=None, size=None, read_only=False):
+    global pool
+    pool.close()
+    pool = ConnectionPool(path or DB_PATH, size or POOL_SIZE, read_only)
+    return pool
@@ -0,0 +1,236 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import secrets
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from urllib.parse import quote
+
+import db
+from pager import Pager
+from queries import QUERIES
+
+FETCH_SIZE = 1000
+ROW_GROUP = 50000
+# Exports hold patient data, so they are written outside anything the web server serves
+EXPORT_DIR = os.environ.get("PATIENT_EXPORT_DIR", "exports")
+# Flet serves the assets directory to anyone who can reach the app. A browser download is
+# moved there under a random directory name and removed after SHARE_TTL seconds, or
+# sooner when the session that made it disconnects.
+SHARE_DIR = os.path.join(os.path.dirname(__file__), "assets", "exports")
+SHARE_URL = "/exports/"
+SHARE_TTL = float(os.environ.get("PATIENT_EXPORT_TTL", "600"))
+
+# While exporting, reads skip the memory map and sorts spill to disk so a multi-million
+# row export runs in the connection's fixed page cache instead of growing the process.
+EXPORT_PRAGMAS = ("PRAGMA mmap_size = 0", "PRAGMA temp_store = FILE")
+RESTORE_PRAGMAS = [pragma for pragma in db.PRAGMAS if "mmap_size" in pragma or "temp_store" in pragma]
+
+
+def plain(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", encoding="utf-8")
+        self.columns = columns
+
+    def write(self, rows):
+        self._file.writelines(json.dumps(dict(zip(self.columns, row)), default=plain) + "\n" for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ColumnarWriter:
+    # Zip archive with one deflated JSON array per column per row group of ROW_GROUP rows,
+    # plus a manifest. Values of one column compress far better together than row by row,
+    # and a reader can pull a single column without decoding the rest.
+    def __init__(self, path, columns):
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=6)
+        self.columns = columns
+        self._buffers = [[] for _ in columns]
+        self.groups = 0
+        self.rows = 0
+
+    def write(self, rows):
+        for row in rows:
+            for buffer, value in zip(self._buffers, row):
+                buffer.append(plain(value))
+            self.rows += 1
+            if len(self._buffers[0]) >= ROW_GROUP:
+                self.flush()
+
+    def flush(self):
+        if not self._buffers[0]:
+            return
+        for i, buffer in enumerate(self._buffers):
+            self._zip.writestr(f"{self.groups:05d}/{i:03d}.json", json.dumps(buffer))
+        self._buffers = [[] for _ in self.columns]
+        self.groups += 1
+
+    def close(self):
+        self.flush()
+        manifest = {"format": "patient-columnar", "version": 1, "columns": self.columns,
+                    "row_groups": self.groups, "rows": self.rows, "row_group_size": ROW_GROUP}
+        self._zip.writestr("manifest.json", json.dumps(manifest))
+        self._zip.close()
+
+
+def read_columnar(path, columns=None):
+    # Yields rows of the named columns (all by default), one row group in memory at a time
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        wanted = [manifest["columns"].index(name) for name in (columns or manifest["columns"])]
+        for group in range(manifest["row_groups"]):
+            values = [json.loads(archive.read(f"{group:05d}/{i:03d}.json")) for i in wanted]
+            yield from zip(*values)
+
+
+FORMATS = {
+    "csv": (".csv", CsvWriter),
+    "jsonl": (".jsonl", JsonlWriter),
+    "columnar": (".colz", ColumnarWriter),
+}
+
+
+def export(con, sql, params, path, fmt, progress=None):
+    writer_class = FORMATS[fmt][1]
+    start = time.perf_counter()
+    rows = 0
+    for pragma in EXPORT_PRAGMAS:
+        con.execute(pragma)
+    try:
+        cur = con.execute(sql, params)
+        writer = writer_class(path, [d[0] for d in cur.description])
+        try:
+            while True:
+                chunk = cur.fetchmany(FETCH_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                rows += len(chunk)
+                if progress is not None:
+                    progress(rows, time.perf_counter() - start)
+        finally:
+            writer.close()
+            cur.close()
+    finally:
+        for pragma in RESTORE_PRAGMAS:
+            con.execute(pragma)
+    elapsed = time.perf_counter() - start
+    return {
+        "path": path,
+        "rows": rows,
+        "bytes": os.path.getsize(path),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def file_name(name, fmt):
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return f"{re.sub(r'[^A-Za-z0-9_-]+', '_', name)}-{stamp}{FORMATS[fmt][0]}"
+
+
+def export_query(name, sql, params=(), fmt="csv", order_by=None, path=None, progress=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if path is None:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, file_name(name, fmt))
+    if order_by:
+        sql = "SELECT * FROM (" + sql.strip().rstrip(";") + ") ORDER BY " + order_by
+    with db.connection() as con:
+        return export(con, sql, params, path, fmt, progress)
+
+
+def share(path):
+    # Returns (folder, url); the file is gone from path afterwards
+    sweep()
+    token = secrets.token_urlsafe(32)
+    folder = os.path.join(SHARE_DIR, token)
+    os.makedirs(folder)
+    name = os.path.basename(path)
+    shutil.move(path, os.path.join(folder, name))
+    timer = threading.Timer(SHARE_TTL, unshare, (folder,))
+    timer.daemon = True
+    timer.start()
+    return folder, SHARE_URL + token + "/" + quote(name)
+
+
+def unshare(folder):
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def sweep():
+    # Shares left behind by a process that stopped before its timers ran
+    if not os.path.isdir(SHARE_DIR):
+        return
+    cutoff = time.time() - SHARE_TTL
+    for entry in os.scandir(SHARE_DIR):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            unshare(entry.path)
+
+
+def tables(con):
+    return [row[0] for row in con.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' "
+        "AND name NOT LIKE '%_fts%' ORDER BY name")]
+
+
+def export_table(table, fmt="csv", path=None, progress=None):
+    with db.connection() as con:
+        if table not in tables(con):
+            raise ValueError(f"no table or view named {table!r}")
+    return export_query(table, f'SELECT * FROM "{table}"', (), fmt, path=path, progress=progress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a report or table to CSV, JSONL or columnar file.")
+    parser.add_argument("source", help="report name (" + ", ".join(QUERIES) + ") or table name")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--out", help=f"output file (default: a timestamped file in {EXPORT_DIR})")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="report parameter")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+
+    def progress(rows, elapsed):
+        print(f"\r{rows:,} rows, {rows / elapsed if elapsed else 0:,.0f} rows/sec", end="", file=sys.stderr)
+
+    if args.source in QUERIES:
+        query = QUERIES[args.source]
+        values = dict(param.split("=", 1) for param in args.param)
+        order_by = Pager(query.sql, query.key).order_by()
+        result = export_query(query.name, query.sql, query.bind(values), args.format, order_by, args.out, progress)
+    else:
+        result = export_table(args.source, args.format, args.out, progress)
+    print(file=sys.stderr)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import flet as ft
+
+import db
+import instrument
+from pager import Pager, read_page
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def cell_text(value):
+    return ft.Text("" if value is None else str(value))
+
+
+class ResultGrid(ft.Column):
+    def __init__(self, headings, sql, key, params=(), page_size=50, runner=None, timeout=None, tables=(),
+                 name="grid", records=None):
+        super().__init__()
+        self.name = name
+        self.headings = headings
+        self.pager = Pager(sql, key, params, page_size, records)
+        self.runner = runner
+        self.timeout = timeout
+        self.tables = tables
+        self.starts = [None]
+        self.has_next = False
+        self.total = (0, True)
+        self.table = ft.DataTable([ft.DataColumn(ft.Text(text)) for text in headings], [])
+        self.status = ft.Text(italic=True)
+        self.prev_button = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, on_click=self.prev_page)
+        self.next_button = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, on_click=self.next_page)
+        self.size_picker = ft.Dropdown(
+            label="Rows per page",
+            width=150,
+            value=str(page_size),
+            options=[ft.dropdown.Option(str(n)) for n in PAGE_SIZES],
+            on_change=self.change_size,
+        )
+        self.progress = ft.ProgressBar(visible=False)
+        self.error = ft.Text(color=ft.Colors.ERROR, visible=False)
+        self.controls = [
+            self.progress,
+            self.error,
+            self.table,
+            ft.Row([self.prev_button, self.status, self.next_button, self.size_picker]),
+        ]
+
+    def read(self, con, count):
+        op = instrument.Operation(self.name)
+        # A slow page's plan is captured while the connection is still checked out and
+        # logged once the page renders
+        total, rows, last, has_next = read_page(con, self.pager, self.starts[-1], count, self.tables, op)
+        return total or self.total, rows, last, has_next, op
+
+    def load(self, count=True):
+        # Without a runner the page is read inline; with one the read happens on a worker
+        # thread and the grid shows a progress bar until it lands.
+        if self.runner is None:
+            with db.connection() as con:
+                result = self.read(con, count)
+            self.loaded(result)
+            return
+        self.progress.visible = True
+        self.error.visible = False
+        self.prev_button.disabled = True
+        self.next_button.disabled = True
+        if self.page:
+            self.update()
+        self.runner.submit(lambda con: self.read(con, count), self.loaded, self.failed, self.timeout)
+
+    def loaded(self, result):
+        self.total, rows, last, self.has_next, op = result
+        with op.phase("render"):
+            self.progress.visible = False
+            self.show(rows, last)
+            if self.page:
+                self.update()
+        op.finish()
+
+    def failed(self, err):
+        self.progress.visible = False
+        self.error.value = str(err)
+        self.error.visible = True
+        self.prev_button.disabled = len(self.starts) == 1
+        if self.page:
+            self.update()
+
+    def show(self, rows, last):
+        self.last = last
+        self.table.rows = [ft.DataRow(cells=[ft.DataCell(cell_text(att)) for att in row]) for row in rows]
+        first = (len(self.starts) - 1) * self.pager.page_size
+        n, exact = self.total
+        total = f"{n:,}" if exact else f"~{n:,}+"
+        if rows:
+            self.status.value = f"Rows {first + 1:,}-{first + len(rows):,} of {total}"
+        else:
+            self.status.value = f"No rows ({total})"
+        self.prev_button.disabled = len(self.starts) == 1
+        self.next_button.disabled = not self.has_next
+
+    def next_page(self, e):
+        if not self.has_next:
+            return
+        self.starts.append(self.last)
+        self.load(count=False)
+
+    def prev_page(self, e):
+        if len(self.starts) == 1:
+            return
+        self.starts.pop()
+        self.load(count=False)
+
+    def change_size(self, e):
+        self.pager.page_size = int(self.size_picker.value)
+        self.starts = [None]
+        self.load(count=False)
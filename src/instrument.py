@@ -0,0 +1,180 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+SLOW_MS = float(os.environ.get("PATIENT_SLOW_MS", "200"))
+SLOW_LOG = os.environ.get("PATIENT_SLOW_LOG", "slow_queries.log")
+TOP_N = 20
+HISTORY = 500
+# SQLite calls the progress handler every PROGRESS_STEPS virtual machine instructions
+PROGRESS_STEPS = 10000
+TRACE_SAMPLE = int(os.environ.get("PATIENT_TRACE_SAMPLE", "100"))
+# Statements kept from each traced checkout, so a traced bulk load adds a few entries
+TRACE_STATEMENTS = 5
+BUCKETS_MS = [1, 5, 20, 100, 500, 2000]
+
+slow_log = logging.getLogger("patientdb.slow")
+slow_log.propagate = False
+
+_local = threading.local()
+_lock = threading.Lock()
+_slowest = []
+_history = defaultdict(lambda: deque(maxlen=HISTORY))
+_statements = deque(maxlen=50)
+_checkouts = 0
+
+
+def bucket_label(i):
+    if i == 0:
+        return f"<{BUCKETS_MS[0]}ms"
+    if i == len(BUCKETS_MS):
+        return f">={BUCKETS_MS[-1]}ms"
+    return f"{BUCKETS_MS[i - 1]}-{BUCKETS_MS[i]}ms"
+
+
+class Operation:
+    # One user-visible operation (a grid page load) split into count, execute, fetch and render phases
+    def __init__(self, name):
+        self.name = name
+        self.phases = defaultdict(float)
+        self.rows = 0
+        self.vm_steps = 0
+        self.cached = False
+        self.sql = None
+        self.params = None
+        self.plan = None
+        self.started = time.time()
+
+    @contextmanager
+    def phase(self, phase):
+        previous = getattr(_local, "operation", None)
+        _local.operation = self
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] += time.perf_counter() - start
+            _local.operation = previous
+
+    def db_ms(self):
+        return (self.phases["count"] + self.phases["execute"] + self.phases["fetch"]) * 1000
+
+    def total_ms(self):
+        return sum(self.phases.values()) * 1000
+
+    def is_slow(self):
+        return self.db_ms() >= SLOW_MS
+
+    def finish(self):
+        record(self)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "total_ms": round(self.total_ms(), 3),
+            "count_ms": round(self.phases["count"] * 1000, 3),
+            "execute_ms": round(self.phases["execute"] * 1000, 3),
+            "fetch_ms": round(self.phases["fetch"] * 1000, 3),
+            "render_ms": round(self.phases["render"] * 1000, 3),
+            "rows": self.rows,
+            "vm_steps": self.vm_steps,
+            "cached": self.cached,
+        }
+
+
+def explain(con, sql, params):
+    return [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def record(op):
+    total = op.total_ms()
+    with _lock:
+        _history[op.name].append(total)
+        entry = (total, id(op), op)
+        if len(_slowest) < TOP_N:
+            heapq.heappush(_slowest, entry)
+        elif total > _slowest[0][0]:
+            heapq.heapreplace(_slowest, entry)
+    if op.plan is not None:
+        _log_slow(op)
+
+
+def _log_slow(op):
+    if not slow_log.handlers:
+        handler = RotatingFileHandler(SLOW_LOG, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.INFO)
+    timings = op.as_dict()
+    slow_log.info(
+        "%s total=%.1fms count=%.1fms execute=%.1fms fetch=%.1fms render=%.1fms rows=%d vm_steps=%d\n  sql: %s\n  params: %r\n  plan:\n%s",
+        op.name, timings["total_ms"], timings["count_ms"], timings["execute_ms"], timings["fetch_ms"], timings["render_ms"], op.rows,
+        op.vm_steps, " ".join(op.sql.split()), op.params, "\n".join("    " + line for line in op.plan),
+    )
+
+
+def _progress():
+    # Attribute VM work to whichever operation is running on this thread
+    op = getattr(_local, "operation", None)
+    if op is not None:
+        op.vm_steps += PROGRESS_STEPS
+    return 0
+
+
+def attach(con):
+    con.set_progress_handler(_progress, PROGRESS_STEPS)
+
+
+def sample_trace(con):
+    # Called at each pool checkout. A trace callback runs in Python for every statement,
+    # which doubles the cost of an executemany, so only one checkout in TRACE_SAMPLE has
+    # one and the rest run without.
+    global _checkouts
+    if TRACE_SAMPLE <= 0:
+        return
+    with _lock:
+        _checkouts += 1
+        sampled = _checkouts % TRACE_SAMPLE == 0
+    if not sampled:
+        con.set_trace_callback(None)
+        return
+    left = [TRACE_STATEMENTS]
+
+    def trace(statement):
+        if left[0]:
+            left[0] -= 1
+            _statements.append((time.time(), " ".join(statement.split())[:300]))
+
+    con.set_trace_callback(trace)
+
+
+def slowest(n=TOP_N):
+    with _lock:
+        return [op.as_dict() for _, _, op in sorted(_slowest, reverse=True)[:n]]
+
+
+def histograms():
+    with _lock:
+        result = {}
+        for name, samples in _history.items():
+            counts = [0] * (len(BUCKETS_MS) + 1)
+            for ms in samples:
+                counts[next((i for i, edge in enumerate(BUCKETS_MS) if ms < edge), len(BUCKETS_MS))] += 1
+            result[name] = counts
+        return result
+
+
+def sampled_statements():
+    return list(_statements)
+
+
+def reset():
+    with _lock:
+        _slowest.clear()
+        _history.clear()
+        _statements.clear()
@@ -0,0 +1,439 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import cache
+import db
+import schema
+import vitals
+
+FETCH_SIZE = 5000
+FOLLOW_INTERVAL = float(os.environ.get("PATIENT_FOLLOW_INTERVAL", "1.0"))
+
+
+def table_columns():
+    # (columns, primary key columns) of every base table, read from the schema itself so the
+    # triggers and the replay statements cannot drift from it. Generated columns (vitals.BMI)
+    # are left out: the replica computes them.
+    con = sqlite3.connect(":memory:")
+    columns = {}
+    for table, sql in schema.TABLES:
+        con.execute(sql)
+        info = list(con.execute(f"PRAGMA table_info({table})"))
+        key = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+        columns[table] = ([row[1] for row in info], key)
+    con.close()
+    return columns
+
+
+COLUMNS = table_columns()
+
+# Append-only: one row per inserted, updated or deleted base-table row, numbered in commit
+# order. Key is the old primary key of an update or delete, Row the new values of an insert
+# or update, both as JSON arrays in COLUMNS order. AUTOINCREMENT keeps sequence numbers from
+# being reused once the journal is trimmed.
+JOURNAL = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        Seq  INTEGER PRIMARY KEY AUTOINCREMENT,
+        Tbl  TEXT NOT NULL,
+        Op   TEXT NOT NULL,
+        Key  TEXT,
+        Row  TEXT
+    )
+"""
+
+
+def values(row, names):
+    return "json_array(" + ", ".join(f"{row}.{name}" for name in names) + ")"
+
+
+def triggers():
+    statements = []
+    for table, (columns, key) in COLUMNS.items():
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_journal_ins AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO change_log (Tbl, Op, Row) VALUES ('{table}', 'I', {values('NEW', columns)}); END",
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_journal_upd AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO change_log (Tbl, Op, Key, Row) VALUES ('{table}', 'U', {values('OLD', key)}, "
+            f"{values('NEW', columns)}); END",
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_journal_del AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO change_log (Tbl, Op, Key) VALUES ('{table}', 'D', {values('OLD', key)}); END",
+        ]
+    return statements
+
+
+TRIGGERS = triggers()
+SCHEMA = [JOURNAL] + TRIGGERS
+DROP_TRIGGERS = [f"DROP TRIGGER IF EXISTS trg_{table}_journal_{op}" for table in COLUMNS for op in ("ins", "upd", "del")]
+
+
+def replay_statements():
+    # (table, op) -> statement that repeats the change on a copy. Updates stay updates, so
+    # the copy's own summary and search triggers see what the primary's saw.
+    statements = {}
+    for table, (columns, key) in COLUMNS.items():
+        where = " AND ".join(f"{name} = ?" for name in key)
+        statements[table, "I"] = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        statements[table, "U"] = f"UPDATE {table} SET {', '.join(f'{name} = ?' for name in columns)} WHERE {where}"
+        statements[table, "D"] = f"DELETE FROM {table} WHERE {where}"
+    return statements
+
+
+REPLAY = replay_statements()
+
+# Copies (replicas and backups) record how far into the primary's journal they are
+POSITION = "CREATE TABLE IF NOT EXISTS journal_position (Seq INTEGER NOT NULL)"
+
+
+class JournalGap(Exception):
+    pass
+
+
+def last_seq(con):
+    # The highest sequence number ever issued, even if those entries were trimmed since
+    row = con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def first_seq(con):
+    row = con.execute("SELECT MIN(Seq) FROM change_log").fetchone()
+    return row[0] if row[0] is not None else last_seq(con) + 1
+
+
+def position(con):
+    return con.execute("SELECT Seq FROM journal_position").fetchone()[0]
+
+
+def changes(con, after, through):
+    # (seq, table, op, key, row) in order, streamed; key and row are lists
+    if after + 1 < first_seq(con) and after < through:
+        raise JournalGap(f"changes after {after} were trimmed from the journal (it starts at {first_seq(con)})")
+    cur = con.execute("SELECT Seq, Tbl, Op, Key, Row FROM change_log WHERE Seq > ? AND Seq <= ? ORDER BY Seq",
+                      (after, through))
+    while True:
+        chunk = cur.fetchmany(FETCH_SIZE)
+        if not chunk:
+            break
+        for seq, table, op, key, row in chunk:
+            yield seq, table, op, json.loads(key) if key else None, json.loads(row) if row else None
+
+
+def apply(con, stream, through):
+    # Replays changes on a copy in one transaction and moves its position to through.
+    # Consecutive changes of the same kind go to one executemany. Vitals rollups are kept by
+    # the application rather than by triggers, so new readings are rolled up at the end the
+    # way an ingest batch is. Returns (count, tables).
+    count = 0
+    tables = set()
+    batch_kind, batch = None, []
+    first_reading = None
+
+    def flush():
+        if batch:
+            con.executemany(REPLAY[batch_kind], batch)
+            batch.clear()
+
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        expected = position(con) + 1
+        for seq, table, op, key, row in stream:
+            if seq < expected:
+                continue
+            if (table, op) != batch_kind:
+                flush()
+                batch_kind = (table, op)
+                tables.add(table)
+                if batch_kind == ("vitals", "I") and first_reading is None:
+                    first_reading = vitals.next_rowid(con)
+            batch.append((row or []) + (key or []))
+            count += 1
+            if len(batch) >= FETCH_SIZE:
+                flush()
+        flush()
+        if first_reading is not None:
+            vitals.roll_up(con, first_reading)
+        con.execute("UPDATE journal_position SET Seq = ?", (through,))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return count, tables
+
+
+def make_copy(con, path):
+    # Online backup of the primary, then turned into a copy: the journal is emptied, its
+    # triggers are dropped (a copy only replays the primary's journal) and the position is
+    # the last change the backup includes. Returns that position.
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    target = sqlite3.connect(partial)
+    try:
+        con.backup(target)
+        seq = last_seq(target)
+        target.execute("BEGIN")
+        target.execute("DELETE FROM change_log")
+        for sql in DROP_TRIGGERS:
+            target.execute(sql)
+        target.execute(POSITION)
+        target.execute("DELETE FROM journal_position")
+        target.execute("INSERT INTO journal_position VALUES (?)", (seq,))
+        target.execute("COMMIT")
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+    os.replace(partial, path)
+    return seq
+
+
+def sync(primary, replica):
+    # Brings the replica up to the primary's latest committed change
+    start = time.perf_counter()
+    through = last_seq(primary)
+    after = position(replica)
+    if through == after:
+        return {"from": after, "to": through, "changes": 0, "tables": [], "seconds": 0.0, "changes_per_sec": None}
+    count, tables = apply(replica, changes(primary, after, through), through)
+    return {"from": after, "to": through, "changes": count, "tables": sorted(tables),
+            "seconds": round(time.perf_counter() - start, 3),
+            "changes_per_sec": round(count / (time.perf_counter() - start)) if count else None}
+
+
+class Follower:
+    # Keeps a replica current from a thread of the process serving it. Each sync evicts the
+    # cached reads of the tables it changed, the way a local write would.
+    def __init__(self, primary_path, replica_path, interval=FOLLOW_INTERVAL):
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.interval = interval
+        self.position = None
+        self.last = None
+        self.error = None
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="journal-follower", daemon=True).start()
+        return self
+
+    def run(self):
+        primary = sqlite3.connect(f"file:{self.primary_path}?mode=ro", uri=True, check_same_thread=False)
+        replica = db.open_connection(self.replica_path)
+        try:
+            while not self._stop.is_set():
+                try:
+                    result = sync(primary, replica)
+                    self.position, self.error = result["to"], None
+                    if result["changes"]:
+                        self.last = result
+                        cache.invalidate(*result["tables"])
+                except (sqlite3.Error, JournalGap) as err:
+                    self.error = str(err)
+                self._stop.wait(self.interval)
+        finally:
+            primary.close()
+            replica.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"primary": self.primary_path, "position": self.position, "last_sync": self.last, "error": self.error}
+
+
+def digest(con, table):
+    # (rows, sha256) of a table read in primary key order
+    columns, key = COLUMNS[table]
+    h = hashlib.sha256()
+    rows = 0
+    cur = con.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(key)}")
+    while True:
+        chunk = cur.fetchmany(FETCH_SIZE)
+        if not chunk:
+            break
+        rows += len(chunk)
+        h.update(repr(chunk).encode())
+    return rows, h.hexdigest()
+
+
+def check(primary, replica):
+    # Compares every base table at one journal position: the primary is read in a single
+    # snapshot and the replica is brought up to exactly that snapshot first
+    primary.execute("BEGIN")
+    try:
+        synced = sync(primary, replica)
+        results = []
+        for table in COLUMNS:
+            (rows, want), (have_rows, have) = digest(primary, table), digest(replica, table)
+            results.append({"table": table, "rows": rows, "replica_rows": have_rows, "match": want == have})
+    finally:
+        primary.execute("COMMIT")
+    return {"seq": synced["to"], "synced": synced["changes"], "tables": results}
+
+
+def backups(directory):
+    # (full backups, incrementals) in the directory as sorted (from, to, path) tuples
+    fulls, increments = [], []
+    for path in glob.glob(os.path.join(directory, "*")):
+        name = os.path.basename(path)
+        match = re.fullmatch(r"full-(\d+)\.db", name)
+        if match:
+            fulls.append((0, int(match[1]), path))
+        match = re.fullmatch(r"changes-(\d+)-(\d+)\.jsonl\.gz", name)
+        if match:
+            increments.append((int(match[1]), int(match[2]), path))
+    return sorted(fulls, key=lambda entry: entry[1]), sorted(increments)
+
+
+def backup(con, directory, full=False):
+    # A full backup when asked or when there is none, otherwise the changes since the last
+    # backup as gzipped JSON lines
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    fulls, increments = backups(directory)
+    if full or not fulls:
+        partial = os.path.join(directory, "full.partial")
+        seq = make_copy(con, partial)
+        path = os.path.join(directory, f"full-{seq}.db")
+        os.replace(partial, path)
+        return {"kind": "full", "path": path, "to": seq, "bytes": os.path.getsize(path),
+                "seconds": round(time.perf_counter() - start, 3)}
+    after = max([fulls[-1][1]] + [to for _, to, _ in increments])
+    con.execute("BEGIN")
+    try:
+        through = last_seq(con)
+        if through == after:
+            return {"kind": "none", "to": after}
+        partial = os.path.join(directory, "changes.partial")
+        count = 0
+        with gzip.open(partial, "wt", encoding="utf-8") as f:
+            for change in changes(con, after, through):
+                f.write(json.dumps(change, separators=(",", ":")) + "\n")
+                count += 1
+    finally:
+        con.execute("COMMIT")
+    path = os.path.join(directory, f"changes-{after}-{through}.jsonl.gz")
+    os.replace(partial, path)
+    return {"kind": "incremental", "path": path, "from": after, "to": through, "changes": count,
+            "bytes": os.path.getsize(path), "seconds": round(time.perf_counter() - start, 3)}
+
+
+def read_changes(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield tuple(json.loads(line))
+
+
+def restore(directory, target):
+    # The latest full backup plus every incremental after it, then the journal triggers are
+    # put back so the restored file can serve as a primary and keeps numbering from there
+    fulls, increments = backups(directory)
+    if not fulls:
+        raise FileNotFoundError(f"no full backup in {directory}")
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} already exists")
+    start = time.perf_counter()
+    partial = target + ".partial"
+    shutil.copyfile(fulls[-1][2], partial)
+    con = db.open_connection(partial)
+    try:
+        seq = position(con)
+        applied = 0
+        for after, through, path in increments:
+            if through <= seq:
+                continue
+            if after > seq:
+                raise JournalGap(f"missing changes {seq + 1}-{after}")
+            count, _ = apply(con, read_changes(path), through)
+            applied += count
+            seq = through
+        con.execute("BEGIN")
+        for sql in TRIGGERS:
+            con.execute(sql)
+        con.execute("DROP TABLE journal_position")
+        con.execute("DELETE FROM sqlite_sequence WHERE name = 'change_log'")
+        con.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (seq,))
+        con.execute("COMMIT")
+        con.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        con.close()
+    os.replace(partial, target)
+    return {"target": target, "to": seq, "changes": applied, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def trim(con, through):
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        removed = con.execute("DELETE FROM change_log WHERE Seq <= ?", (through,)).rowcount
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return {"removed": removed}
+
+
+def status(con):
+    count, size = con.execute("SELECT COUNT(*), SUM(LENGTH(Tbl) + IFNULL(LENGTH(Key), 0) + IFNULL(LENGTH(Row), 0)) FROM change_log").fetchone()
+    return {"first": first_seq(con), "last": last_seq(con), "entries": count, "bytes": size or 0}
+
+
+def run(args):
+    if args.command == "restore":
+        return restore(args.directory, args.target)
+    with db.connection() as con:
+        if args.command == "status":
+            return status(con)
+        if args.command == "backup":
+            return backup(con, args.directory, args.full)
+        if args.command == "trim":
+            return trim(con, args.through)
+        if args.action == "init":
+            start = time.perf_counter()
+            return {"path": args.path, "to": make_copy(con, args.path), "seconds": round(time.perf_counter() - start, 3)}
+        replica = db.open_connection(args.path)
+        try:
+            return sync(con, replica) if args.action == "sync" else check(con, replica)
+        finally:
+            replica.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Change journal: incremental backups and read replicas.")
+    parser.add_argument("--db", help="primary database path (defaults to PATIENT_DB_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="journal size and sequence range")
+    replica_cmd = sub.add_parser("replica", help="create or update a read replica")
+    replica_cmd.add_argument("action", choices=["init", "sync", "check"])
+    replica_cmd.add_argument("path")
+    backup_cmd = sub.add_parser("backup", help="full or incremental backup into a directory")
+    backup_cmd.add_argument("directory")
+    backup_cmd.add_argument("--full", action="store_true")
+    restore_cmd = sub.add_parser("restore", help="rebuild a database from a backup directory")
+    restore_cmd.add_argument("directory")
+    restore_cmd.add_argument("target")
+    trim_cmd = sub.add_parser("trim", help="drop journal entries every copy has already applied")
+    trim_cmd.add_argument("--through", type=int, required=True)
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    try:
+        result = run(args)
+    except (JournalGap, FileNotFoundError, FileExistsError) as err:
+        print(f"{type(err).__name__}: {err}", file=sys.stderr)
+        return 1
+    print(json.dumps(result))
+    if args.command == "replica" and args.action == "check":
+        return 0 if all(table["match"] for table in result["tables"]) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
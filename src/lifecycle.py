@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import cache
+import db
+import migrations
+import schema
+
+TEMPLATE_PATH = os.environ.get("PATIENT_TEMPLATE_PATH", "template.db")
+
+
+def create(con):
+    # Base tables and every migration in one transaction. Existing tables are kept, so this
+    # also finishes a database that was only partly created.
+    version = migrations.schema_version(con)
+    statements = schema.create_statements()
+    for number, _, migration in migrations.MIGRATIONS:
+        if number > version:
+            statements += migration
+    statements.append(f"PRAGMA user_version = {migrations.LATEST}")
+    schema.run_all(con, statements)
+    cache.clear()
+
+
+def user_objects(con, kind, virtual=None):
+    sql = "SELECT name FROM sqlite_master WHERE type = ? AND name NOT LIKE 'sqlite_%'"
+    if virtual is not None:
+        sql += " AND sql " + ("" if virtual else "NOT ") + "LIKE 'CREATE VIRTUAL%'"
+    return [row[0] for row in con.execute(sql, (kind,))]
+
+
+def drop(con):
+    # Everything the app created, whatever state it was left in, in one transaction: views,
+    # then virtual tables (their shadow tables go with them), then derived tables, then the
+    # base tables children first. Indexes and triggers go with their tables.
+    con.execute("BEGIN")
+    try:
+        for name in user_objects(con, "view"):
+            con.execute(f'DROP VIEW IF EXISTS "{name}"')
+        for name in user_objects(con, "table", virtual=True):
+            con.execute(f'DROP TABLE IF EXISTS "{name}"')
+        base = {name for name, _ in schema.TABLES}
+        for name in user_objects(con, "table", virtual=False):
+            if name not in base:
+                con.execute(f'DROP TABLE IF EXISTS "{name}"')
+        for sql in schema.drop_statements():
+            con.execute(sql)
+        con.execute("PRAGMA user_version = 0")
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    cache.clear()
+
+
+def snapshot(template=TEMPLATE_PATH):
+    # Consistent copy of the live database through the online backup API, taken while other
+    # connections keep working. The template is switched out of WAL so it is a single file.
+    start = time.perf_counter()
+    partial = template + ".partial"
+    with db.connection() as con:
+        target = sqlite3.connect(partial)
+        try:
+            con.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+    os.replace(partial, template)
+    return {"template": template, "bytes": os.path.getsize(template), "seconds": round(time.perf_counter() - start, 3)}
+
+
+def reset(template=TEMPLATE_PATH, copy=False):
+    # Restores the live database from a snapshot instead of re-running DDL and inserts.
+    # By default the pages are written through the backup API into an open connection, which
+    # is safe while this or any other process has the database open. copy=True replaces the
+    # file itself, which is faster for large fixtures but only safe when nothing else has it
+    # open; this process's pool is closed and reopened around it.
+    if not os.path.exists(template):
+        raise FileNotFoundError(f"no snapshot at {template}")
+    start = time.perf_counter()
+    if copy:
+        path, size = db.pool.path, db.pool.size
+        db.pool.close()
+        if db.pool.stats()["live"]:
+            db.configure(path, size)
+            raise RuntimeError("connections are still checked out; reset without copy instead")
+        partial = path + ".partial"
+        shutil.copyfile(template, partial)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        # Freeing a large file's blocks takes longer than copying it, so the old file is
+        # moved aside and deleted off the caller's thread
+        stale = path + ".stale"
+        if os.path.exists(path):
+            os.replace(path, stale)
+            threading.Thread(target=os.remove, args=(stale,), name="reset-cleanup").start()
+        os.replace(partial, path)
+        db.configure(path, size)
+    else:
+        source = sqlite3.connect(f"file:{template}?mode=ro", uri=True)
+        try:
+            with db.connection() as con:
+                source.backup(con)
+        finally:
+            source.close()
+    cache.clear()
+    return {"template": template, "method": "copy" if copy else "backup",
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create, drop, snapshot or reset the whole schema.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="create every table and apply every migration in one transaction")
+    sub.add_parser("drop", help="drop every table, view and index in one transaction")
+    snapshot_cmd = sub.add_parser("snapshot", help="save the database as a template")
+    snapshot_cmd.add_argument("template", nargs="?", default=TEMPLATE_PATH)
+    reset_cmd = sub.add_parser("reset", help="restore the database from a template")
+    reset_cmd.add_argument("template", nargs="?", default=TEMPLATE_PATH)
+    reset_cmd.add_argument("--copy", action="store_true",
+                           help="replace the database file (only when no other process has it open)")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    if args.command == "create":
+        with db.connection() as con:
+            create(con)
+    elif args.command == "drop":
+        with db.connection() as con:
+            drop(con)
+    elif args.command == "snapshot":
+        print(json.dumps(snapshot(args.template)))
+    else:
+        print(json.dumps(reset(args.template, args.copy)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
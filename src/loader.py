@@ -0,0 +1,285 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+import cache
+import db
+import vitals
+
+CHUNK_SIZE = 5000
+
+
+def required(convert):
+    def check(value):
+        if value is None:
+            raise ValueError("is required")
+        return convert(value)
+    return check
+
+
+def optional(convert):
+    def check(value):
+        return None if value is None else convert(value)
+    return check
+
+
+def integer(value):
+    return int(value)
+
+
+def number(value):
+    return float(value)
+
+
+def text(max_len):
+    def check(value):
+        value = str(value)
+        if len(value) > max_len:
+            raise ValueError(f"is longer than {max_len} characters")
+        return value
+    return check
+
+
+def one_of(*choices):
+    def check(value):
+        if value not in choices:
+            raise ValueError(f"must be one of {', '.join(choices)}")
+        return value
+    return check
+
+
+def matches(pattern, description):
+    regex = re.compile(pattern)
+    def check(value):
+        value = str(value)
+        if not regex.fullmatch(value):
+            raise ValueError(f"must look like {description}")
+        return value
+    return check
+
+
+def at_least(minimum):
+    def check(value):
+        value = int(value)
+        if value < minimum:
+            raise ValueError(f"must be at least {minimum}")
+        return value
+    return check
+
+
+date = matches(r"\d{4}-\d{2}-\d{2}", "YYYY-MM-DD")
+timestamp = matches(r"\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?", "YYYY-MM-DD[ HH:MM[:SS]]")
+
+# Mirrors the NOT NULL and CHECK constraints in create_tables so bad rows are rejected
+# individually before they reach SQLite.
+TABLES = {
+    "patient": {
+        "Patient_Id": required(integer),
+        "F_Name": required(text(15)),
+        "M_Initial": optional(text(1)),
+        "L_Name": required(text(15)),
+        "Sex": optional(one_of("M", "F", "X")),
+        "Dob": required(date),
+        "Address": optional(text(50)),
+        "Email": optional(matches(r".*@.*\..*", "name@domain.tld")),
+        "Phone_Num": optional(matches(r".{3}-.{3}-.{4}", "###-###-####")),
+        "Insurance": optional(text(50)),
+    },
+    "doctor": {
+        "Doctor_Id": required(at_least(10000)),
+        "F_Name": required(text(15)),
+        "L_Name": required(text(15)),
+        "Sex": optional(one_of("M", "F", "X")),
+        "Extension": optional(text(6)),
+        "Specialty": optional(text(50)),
+        "Lang": optional(text(50)),
+        "Status": optional(one_of("Active", "Inactive")),
+    },
+    "booked": {
+        "Appointment_Date": required(date),
+        "Patient_Id": required(integer),
+        "Doctor_Id": required(integer),
+        "Appointment_Time": required(matches(r"..:..", "HH:MM")),
+        "Reason": optional(text(50)),
+    },
+    "bill": {
+        "payer": required(text(255)),
+        "status": required(text(6)),
+        "amount": required(number),
+        "Appointment_Date": required(date),
+        "Patient_Id": required(integer),
+        "Doctor_Id": required(integer),
+    },
+    "vitals": {
+        "Patient_Id": required(integer),
+        "Measure_Ts": required(timestamp),
+        "Height_Cm": optional(number),
+        "Weight_Kg": optional(number),
+        "Bp_Systolic": optional(integer),
+        "Bp_Diastolic": optional(integer),
+        "Heart_Rate": optional(integer),
+        "Resp_Rate": optional(integer),
+        "Temp_C": optional(number),
+        "SpO2": optional(integer),
+    },
+}
+
+
+def read_rows(path):
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+
+def validate(table, raw):
+    columns = TABLES[table]
+    lookup = {key.lower(): value for key, value in raw.items() if key is not None}
+    values = []
+    for column, check in columns.items():
+        value = lookup.get(column.lower())
+        if value == "":
+            value = None
+        try:
+            values.append(check(value))
+        except (TypeError, ValueError) as err:
+            raise ValueError(f"{column} {err}") from None
+    return values
+
+
+class RejectWriter:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def write(self, raw, reason):
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+        record = dict(raw)
+        record["_error"] = reason
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def insert_chunk(con, sql, chunk, rejects):
+    # Fast path is one executemany per chunk; if any row trips a constraint the chunk is
+    # replayed row by row inside a savepoint so only the offending rows are rejected.
+    con.execute("SAVEPOINT chunk")
+    try:
+        con.executemany(sql, [values for _, values in chunk])
+        con.execute("RELEASE chunk")
+        return len(chunk)
+    except sqlite3.IntegrityError:
+        con.execute("ROLLBACK TO chunk")
+    loaded = 0
+    for raw, values in chunk:
+        try:
+            con.execute(sql, values)
+            loaded += 1
+        except sqlite3.IntegrityError as err:
+            rejects.write(raw, str(err))
+    con.execute("RELEASE chunk")
+    return loaded
+
+
+def reject_orphans(con, table, first_rowid, rejects):
+    # The app's connections do not enforce foreign keys, so they are checked here once
+    # after the whole file is in, not per row. Only rows from this load are considered so
+    # existing data is never touched.
+    columns = list(TABLES[table])
+    orphans = {}
+    for _, rowid, parent, _ in con.execute(f"PRAGMA foreign_key_check({table})").fetchall():
+        if rowid >= first_rowid:
+            orphans.setdefault(rowid, []).append(parent)
+    for rowid, parents in orphans.items():
+        row = con.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE rowid = ?", (rowid,)).fetchone()
+        rejects.write(dict(zip(columns, row)), "no matching " + ", ".join(parents))
+        con.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+    return len(orphans)
+
+
+def load(path, table, reject_path=None, chunk_size=CHUNK_SIZE, progress=None):
+    if table not in TABLES:
+        raise ValueError(f"cannot load table {table!r}; expected one of {', '.join(TABLES)}")
+    columns = list(TABLES[table])
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    rejects = RejectWriter(reject_path or os.path.splitext(path)[0] + ".rejects.jsonl")
+    loaded = 0
+    start = time.perf_counter()
+    rows = read_rows(path)
+    try:
+        with db.connection() as con:
+            con.execute("BEGIN")
+            try:
+                first_rowid = con.execute(f"SELECT IFNULL(MAX(rowid), 0) + 1 FROM {table}").fetchone()[0]
+                while True:
+                    chunk = []
+                    for raw in islice(rows, chunk_size):
+                        try:
+                            chunk.append((raw, validate(table, raw)))
+                        except ValueError as err:
+                            rejects.write(raw, str(err))
+                    if not chunk:
+                        break
+                    loaded += insert_chunk(con, sql, chunk, rejects)
+                    if progress is not None:
+                        elapsed = time.perf_counter() - start
+                        progress(loaded, rejects.count, loaded / elapsed if elapsed else 0.0)
+                loaded -= reject_orphans(con, table, first_rowid, rejects)
+                if table == "vitals":
+                    vitals.roll_up(con, first_rowid)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+    finally:
+        rejects.close()
+        cache.invalidate(table)
+    elapsed = time.perf_counter() - start
+    return {
+        "table": table,
+        "loaded": loaded,
+        "rejected": rejects.count,
+        "reject_file": rejects.path if rejects.count else None,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(loaded / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load CSV or JSONL rows into a table.")
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("path")
+    parser.add_argument("--reject", help="file for rejected rows (default: <input>.rejects.jsonl)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+
+    def progress(loaded, rejected, rate):
+        print(f"\r{loaded:,} loaded, {rejected:,} rejected, {rate:,.0f} rows/sec", end="", file=sys.stderr)
+
+    result = load(args.path, args.table, args.reject, args.chunk, progress)
+    print(file=sys.stderr)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
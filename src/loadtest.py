@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import quote, urlsplit
+
+from bench import percentile
+
+# (weight, label, path) of the requests each simulated client picks from; table reads
+# follow their next cursor for a few pages the way a user pages through a grid
+MIX = [
+    (4, "report", "/reports/num_patients"),
+    (4, "report", "/reports/num_appt"),
+    (2, "report", "/reports/avg_unpaid"),
+    (2, "report", "/reports/insurance"),
+    (4, "lookup", "/reports/schedule?doctor_id={doctor}&date=2025-10-25"),
+    (4, "lookup", "/reports/prescriptions?patient_id={patient}"),
+    (6, "search", "/search?q={name}"),
+    (2, "slots", "/slots?doctor={doctor}&n=5"),
+    (4, "table", "/tables/patient?limit=50"),
+    (2, "table", "/tables/booked?limit=50"),
+]
+# Writes POST these paths; --writes sets their share of all requests. Bookings land on
+# random future slots, so some are refused with 409 when the slot is already taken.
+WRITE_MIX = [
+    (1, "book", "/bookings"),
+    (2, "vitals", "/vitals"),
+]
+WRITE_YEAR = 2030
+NAMES = ["jo", "joh", "john", "john smi", "sm", "smith", "ali", "alison pat", "card", "pat", "li", "burke"]
+PAGES_PER_TABLE = 5
+
+
+async def request(reader, writer, host, path, body=None):
+    if body is None:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    else:
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ")[1])
+    headers = dict(line.lower().split(": ", 1) for line in head[1:] if ": " in line)
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+def db_ms(timing):
+    # Time spent in SQLite according to the server's Server-Timing header
+    total = 0.0
+    for entry in timing.split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name in ("count", "execute", "fetch"):
+            total += float(duration)
+    return total
+
+
+def write_body(label, rng):
+    day = datetime.date(WRITE_YEAR, 1, 1) + datetime.timedelta(days=rng.randrange(365))
+    patient = rng.randint(100000000, 100000999)
+    if label == "book":
+        return {"patient": patient, "doctor": rng.randint(100000, 100049), "date": day.isoformat(),
+                "time": f"{rng.randint(8, 16):02d}:{rng.choice((0, 30)):02d}", "reason": "Load test"}
+    moment = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(seconds=rng.randrange(86400))
+    return {"readings": [{"Patient_Id": patient, "Measure_Ts": moment.isoformat(" "), "Heart_Rate": rng.randint(50, 110),
+                          "SpO2": rng.randint(92, 100)}]}
+
+
+async def client(url, deadline, results, rng, writes):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    weights = [weight for weight, _, _ in MIX]
+    write_weights = [weight for weight, _, _ in WRITE_MIX]
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < writes:
+                _, label, path = rng.choices(WRITE_MIX, write_weights)[0]
+                body = json.dumps(write_body(label, rng)).encode()
+                start = time.perf_counter()
+                status, headers, _ = await request(reader, writer, parts.netloc, path, body)
+                results[label].append((time.perf_counter() - start, status, 0.0))
+                continue
+            _, label, path = rng.choices(MIX, weights)[0]
+            path = path.format(doctor=rng.randint(100000, 100049), patient=rng.randint(100000000, 100000999),
+                               name=quote(rng.choice(NAMES)))
+            pages = PAGES_PER_TABLE if label == "table" else 1
+            for _ in range(pages):
+                start = time.perf_counter()
+                status, headers, body = await request(reader, writer, parts.netloc, path)
+                elapsed = time.perf_counter() - start
+                results[label].append((elapsed, status, db_ms(headers.get("server-timing", ""))))
+                cursor = json.loads(body).get("next") if label == "table" and status == 200 else None
+                if not cursor:
+                    break
+                path = path.split("&after=")[0] + "&after=" + cursor
+    finally:
+        writer.close()
+
+
+async def run(url, clients, seconds, seed, writes=0.0):
+    results = defaultdict(list)
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url, deadline, results, random.Random(seed + i), writes) for i in range(clients)))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    summary = {}
+    everything = []
+    for label, samples in sorted(results.items()):
+        everything.extend(samples)
+        summary[label] = stats(samples, elapsed)
+    summary["all"] = stats(everything, elapsed)
+    return summary
+
+
+def stats(samples, elapsed):
+    latencies = [sample[0] for sample in samples]
+    return {
+        "requests": len(samples),
+        # 409 is a booking refused because the slot was taken and 503 a write shed by
+        # backpressure; both are answers, not failures
+        "errors": sum(1 for sample in samples if sample[1] not in (200, 409, 503)),
+        "shed": sum(1 for sample in samples if sample[1] == 503),
+        "rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "db_p50_ms": round(percentile([sample[2] for sample in samples], 50), 2),
+    }
+
+
+def start_server(db_path, port, workers=1):
+    # Runs api.py against db_path and waits until every worker answers
+    env = dict(os.environ, PATIENT_TRACE_SAMPLE="0")
+    command = [sys.executable, os.path.join(os.path.dirname(__file__), "api.py"), "--port", str(port),
+               "--workers", str(workers)]
+    if db_path:
+        command += ["--db", db_path]
+    server = subprocess.Popen(command, env=env, stderr=subprocess.PIPE, text=True)
+    for _ in range(workers):
+        server.stderr.readline()
+    return server
+
+
+def print_summary(summary):
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'shed':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'db p50':>9}")
+    for label, row in summary.items():
+        print(f"{label:<10}{row['requests']:>10}{row['errors']:>8}{row['shed']:>7}{row['rps']:>9}{row['p50_ms']:>9}"
+              f"{row['p95_ms']:>9}{row['p99_ms']:>9}{row['db_p50_ms']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the JSON API with concurrent keep-alive clients.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--writes", type=float, default=0.0, help="share of requests that are writes, 0 to 1")
+    parser.add_argument("--start", action="store_true", help="start a local api.py on the --url port first")
+    parser.add_argument("--workers", default="1",
+                        help="with --start, comma-separated worker counts to run one after another, e.g. 1,4")
+    parser.add_argument("--db", help="database for the server started by --start")
+    args = parser.parse_args(argv)
+    errors = 0
+    totals = {}
+    for workers in [int(value) for value in args.workers.split(",")] if args.start else [None]:
+        server = start_server(args.db, urlsplit(args.url).port or 80, workers) if args.start else None
+        try:
+            results, elapsed = asyncio.run(run(args.url, args.clients, args.seconds, args.seed, args.writes))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        summary = summarize(results, elapsed)
+        if workers is not None:
+            print(f"-- {workers} worker{'s' if workers > 1 else ''}")
+            totals[workers] = summary["all"]
+        print_summary(summary)
+        errors += summary["all"]["errors"]
+    if len(totals) > 1:
+        base = next(iter(totals.values()))["rps"]
+        for workers, row in totals.items():
+            print(f"{workers} workers: {row['rps']} req/s ({row['rps'] / base:.2f}x), p99 {row['p99_ms']}ms")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,399 +1,115 @@
 import flet as ft
+import os
 import sqlite3
+import threading
+import time
+
+import cache
+import db
+from router import Router, Screen
 
 
 def main(page: ft.Page):
-    # connect_db()
+    # Past the pool, cache and router, modules are imported where they are used: importing
+    # this file loads none of them and each screen loads its own when first opened
+    import migrations
+    with db.connection() as con:
+        migrations.migrate(con)
 
     page.title = "Patient Health Records DBMS"
     page.scroll=ft.ScrollMode.AUTO
     page.window.height = 600
     page.window.width = 400
-    main_menu(page)
+    router = Router(page, SCREENS)
+    page.session.set("router", router)
+    # Download folders this session's exports were shared from, removed when it disconnects
+    page.session.set("exports", [])
+    page.on_disconnect = unshare_exports
+    router.go("main")
+
+def unshare_exports(e):
+    folders = e.page.session.get("exports")
+    if folders:
+        import export
+        while folders:
+            export.unshare(folders.pop())
 
-def main_menu(page: ft.Page):
+def main_menu(page: ft.Page, router: Router):
+    import lifecycle
+    import loader
+    import schema
     update_text = ft.Text(value="Please select an option...", italic=True)
     def create_tables(e):
-        con = sqlite3.connect("data.db")
-        cur = con.cursor()
-        cur.execute("""
-                CREATE TABLE patient (
-                    Patient_Id    INTEGER     PRIMARY KEY,
-                    F_Name        VARCHAR2(15)   NOT NULL,
-                    M_Initial     CHAR(1),
-                    L_Name        VARCHAR2(15)   NOT NULL,
-                    Sex           CHAR(1) CHECK (Sex IN ('M', 'F', 'X')),
-                    Dob           DATE           NOT NULL,
-                    Address       VARCHAR2(50),
-                    Email         VARCHAR2(30) CHECK (Email LIKE '%@%.%'),
-                    Phone_Num     VARCHAR2(12) CHECK (Phone_Num LIKE '___-___-____'),
-                    Insurance     VARCHAR2(50)
-                );
-                    """)
-        cur.execute("""
-                    CREATE TABLE doctor (
-                    Doctor_Id    INTEGER      PRIMARY KEY CHECK (Doctor_Id >= 10000),
-                    F_Name       VARCHAR2(15)   NOT NULL,
-                    L_Name       VARCHAR2(15)   NOT NULL,
-                    Sex          CHAR(1) CHECK (Sex IN ('M', 'F', 'X')),
-                    Extension    VARCHAR2(6),
-                    Specialty    VARCHAR2(50),
-                    Lang         VARCHAR2(50),
-                    Status       VARCHAR2(8)    DEFAULT 'Active' CHECK (Status IN ('Active', 'Inactive'))
-                );
-                """)
-        cur.execute("""
-                CREATE TABLE booked (
-                    Appointment_Date    DATE          NOT NULL,
-                    Patient_Id          INTEGER   NOT NULL,
-                    Doctor_Id           INTEGER   NOT NULL,
-                    Appointment_Time    VARCHAR2(5)   NOT NULL CHECK(Appointment_Time LIKE '__:__'),
-                    Reason              VARCHAR2(50),
-                    CONSTRAINT pk_booked PRIMARY KEY (Patient_Id, Appointment_Date, Appointment_Time),
-                    CONSTRAINT fk_booked_pid FOREIGN KEY (Patient_Id) REFERENCES patient(Patient_Id),
-                    CONSTRAINT fk_booked_did FOREIGN KEY (Doctor_Id) REFERENCES doctor(Doctor_Id),
-                    CONSTRAINT ck_multiday UNIQUE (Patient_Id, Doctor_Id, Appointment_Date),
-                    CONSTRAINT ck_double_book_patient UNIQUE (Appointment_Date, Patient_Id, Appointment_Time),
-                    CONSTRAINT ck_double_book_doctor UNIQUE (Appointment_Date, Doctor_Id, Appointment_Time)
-                );
-                """)
-        cur.execute("""
-                CREATE TABLE bill (
-                    payer              VARCHAR2(255) NOT NULL,
-                    status             VARCHAR2(6)   NOT NULL,
-                    amount             NUMBER(10,2)  NOT NULL,
-                    Appointment_Date   DATE          NOT NULL,
-                    Patient_Id         INTEGER     NOT NULL,
-                    Doctor_Id          INTEGER     NOT NULL,
-                    CONSTRAINT pk_bill PRIMARY KEY (Appointment_Date, Doctor_Id, Patient_Id),
-                    CONSTRAINT fk_bill_booked FOREIGN KEY (Appointment_Date, Patient_Id, Doctor_Id) 
-                        REFERENCES booked(Appointment_Date, Patient_Id, Doctor_Id)
-                );
-                    """)
-        cur.execute("""
-                CREATE TABLE medical_procedure (
-                    filepath           VARCHAR2(255),
-                    procedure_type     VARCHAR2(9)   NOT NULL,
-                    location           VARCHAR2(20)   NOT NULL,
-                    procedure_summary  VARCHAR2(255),
-                    Appointment_Date   DATE          NOT NULL,
-                    Patient_Id         INTEGER   NOT NULL,
-                    Doctor_Id          INTEGER   NOT NULL,
-                    CONSTRAINT pk_medical_procedure PRIMARY KEY (procedure_type, Appointment_Date, Doctor_Id, Patient_Id),
-                    CONSTRAINT fk_medical_procedure_booked FOREIGN KEY (Appointment_Date, Patient_Id, Doctor_Id) 
-                        REFERENCES booked(Appointment_Date, Patient_Id, Doctor_Id)
-                );
-                    """)
-        cur.execute("""
-                CREATE TABLE drug (
-                    DIN             NUMBER(10)      NOT NULL,
-                    drug_name       VARCHAR2(30)    NOT NULL,
-                    dosage          NUMBER(10, 2)   NOT NULL,
-                    CONSTRAINT pk_drug PRIMARY KEY (DIN)
-                );
-            """)
-        cur.execute("""
-                CREATE TABLE prescription (
-                    DIN               NUMBER(10)    NOT NULL,
-                    med_count         NUMBER(5)     NOT NULL,
-                    refills           NUMBER(5)     DEFAULT 0,
-                    frequency         NUMBER(5)     NOT NULL,
-                    Appointment_Date  DATE          NOT NULL,
-                    Patient_Id        INTEGER     NOT NULL,
-                    Doctor_Id         INTEGER     NOT NULL,
-                    CONSTRAINT pk_prescription PRIMARY KEY (DIN, Appointment_Date, Doctor_Id, Patient_Id),
-                    CONSTRAINT fk_prescription_booked FOREIGN KEY (Appointment_Date, Patient_Id, Doctor_Id) 
-                        REFERENCES booked(Appointment_Date, Patient_Id, Doctor_Id),
-                    CONSTRAINT fk_din FOREIGN KEY (DIN) REFERENCES drug(DIN)
-                );
-                    """)
-        
-        cur.execute("""
-                CREATE TABLE diagnosis (
-                    Code_System       VARCHAR2(10)  NOT NULL,
-                    Code              VARCHAR2(10)  NOT NULL,
-                    Diagnosis_Name    VARCHAR2(30)  NOT NULL UNIQUE,
-                    Condition_Type    VARCHAR2(15)  NOT NULL,
-                    CONSTRAINT pk_code PRIMARY KEY (Code_System, Code),
-                    CONSTRAINT ck_code_system CHECK (Code_System IN ('DSM-5-TR', 'ICD-10', 'ICD-11'))
-                );
-                    """)
-        
-        cur.execute("""
-                CREATE TABLE conditions (
-                    Condition_Id    INTEGER PRIMARY KEY,
-                    Patient_Id      INTEGER    NOT NULL,
-                    Diagnosis_Name  VARCHAR2(30) NOT NULL,
-                    Onset_Date      DATE         NOT NULL,
-                    CONSTRAINT fk_conditions_patient FOREIGN KEY (Patient_Id) REFERENCES patient(Patient_Id),
-                    CONSTRAINT fk_conditions_diagnosis FOREIGN KEY (Diagnosis_Name) REFERENCES code(Diagnosis_Name),
-                    CONSTRAINT ck_duplicates1 UNIQUE (Patient_Id, Diagnosis_Name, Onset_Date),
-                    CONSTRAINT ck_duplicates2 UNIQUE (Patient_Id, Condition_Id, Onset_Date)
-                );
-                    """)
-        cur.execute("""
-                CREATE TABLE condition_details (
-                    Condition_Id      INTEGER   NOT NULL,
-                    Patient_Id        INTEGER   NOT NULL,
-                    Code_System       VARCHAR2(10),
-                    Code              VARCHAR2(10),
-                    Onset_Date        DATE,
-                    Abatement_Date    DATE,
-                    Clinical_Status   VARCHAR2(12)  DEFAULT 'active',
-                    Severity          VARCHAR2(10),
-                    Doctor_Id         INTEGER,
-                    CONSTRAINT pk_condition_dets PRIMARY KEY (Condition_Id),
-                    CONSTRAINT fk_condition_dets_base1 FOREIGN KEY (Condition_Id) REFERENCES conditions(Condition_Id),
-                    CONSTRAINT fk_condition_dets_base FOREIGN KEY (Patient_Id, Condition_Id, Onset_Date) REFERENCES conditions(Patient_Id, Condition_Id, Onset_Date),
-                    CONSTRAINT fk_condition_dets_code FOREIGN KEY (Code_System, Code) REFERENCES code(Code_System, Code),
-                    CONSTRAINT fk_condition_dets_doctor FOREIGN KEY (Doctor_Id) REFERENCES doctor(Doctor_Id),
-                    CONSTRAINT ck_conditions_status CHECK (Clinical_Status IN ('active','resolved','remission','unknown')),
-                    CONSTRAINT ck_conditions_severity CHECK (Severity IN ('mild','moderate','severe','critical'))
-                );
-                    """)
-        cur.execute("""
-            CREATE TABLE chronic_condition (
-                Condition_Id                  INTEGER NOT NULL,
-                Is_Lifestyle_Modifiable       CHAR(1),
-                Long_Term_Med_Required        CHAR(1),
-                Follow_Up_Interval_Months     NUMBER(3),
-                CONSTRAINT pk_chronic_condition PRIMARY KEY (Condition_Id),
-                CONSTRAINT fk_chronic_condition_base FOREIGN KEY (Condition_Id) 
-                    REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
-                CONSTRAINT ck_chronic_yn_check CHECK (
-                    (Is_Lifestyle_Modifiable IN ('Y','N') OR Is_Lifestyle_Modifiable IS NULL)
-                    AND (Long_Term_Med_Required IN ('Y','N') OR Long_Term_Med_Required IS NULL)
-                ),
-                CONSTRAINT ck_chronic_fu_check CHECK (Follow_Up_Interval_Months IS NULL OR Follow_Up_Interval_Months >= 0)
-            );
-            """)
-
-        cur.execute("""
-            CREATE TABLE infectious_condition (
-                Condition_Id        INTEGER NOT NULL,
-                Pathogen_Type       VARCHAR2(20),
-                Isolation_Required  CHAR(1),
-                CONSTRAINT pk_infectious_condition PRIMARY KEY (Condition_Id),
-                CONSTRAINT fk_infectious_condition_base FOREIGN KEY (Condition_Id) 
-                    REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
-                CONSTRAINT ck_infectious_pathogen CHECK (
-                    Pathogen_Type IN ('virus','bacteria','fungus','parasite','unknown') 
-                    OR Pathogen_Type IS NULL
-                ),
-                CONSTRAINT ck_infectious_yn_check CHECK (
-                    (Isolation_Required IN ('Y','N') OR Isolation_Required IS NULL)
-                )
-            );
-        """)
-    
-        cur.execute("""
-            CREATE TABLE injury_condition (
-                Condition_Id    INTEGER  NOT NULL,
-                Injury_Type     VARCHAR2(20),
-                Body_Site       VARCHAR2(120),
-                Laterality      VARCHAR2(10),
-                Cause           VARCHAR2(20),
-                Date_Of_Injury  DATE,
-                CONSTRAINT pk_injury_condition PRIMARY KEY (Condition_Id),
-                CONSTRAINT fk_injury_condition_base FOREIGN KEY (Condition_Id) 
-                    REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
-                CONSTRAINT ck_injury_laterality CHECK (
-                    Laterality IN ('left','right','bilateral','midline','na') 
-                    OR Laterality IS NULL
-                )
-            );
-        """)
-
-        cur.execute("""
-            CREATE TABLE mental_health_condition (
-                Condition_Id        INTEGER  NOT NULL,
-                Disorder_Category   VARCHAR2(20),
-                Episode             VARCHAR2(20),
-                Treatment_Type      VARCHAR2(30),
-                Risk_Factor         VARCHAR2(50),
-                CONSTRAINT pk_mental_health_condition PRIMARY KEY (Condition_Id),
-                CONSTRAINT fk_mh_condition_base FOREIGN KEY (Condition_Id) 
-                    REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
-                CONSTRAINT ck_mental_episode CHECK (
-                    Episode IN ('initial', 'acute', 'partial remission', 'full remission', 'multiple', 'na') 
-                    OR Episode IS NULL
-                )
-            );
-        """)
-
-        cur.execute("""
-            CREATE TABLE vitals (
-                Patient_Id     INTEGER NOT NULL,
-                Measure_Ts     DATE DEFAULT SYSDATE NOT NULL,
-                Height_Cm      NUMBER(5,2),
-                Weight_Kg      NUMBER(5,2),
-                Bp_Systolic    NUMBER(3),
-                Bp_Diastolic   NUMBER(3),
-                Heart_Rate     NUMBER(3),
-                Resp_Rate      NUMBER(3),
-                Temp_C         NUMBER(4,1),
-                SpO2           NUMBER(3),
-                BMI            NUMBER(5,2) GENERATED ALWAYS AS (
-                    CASE 
-                        WHEN Height_Cm IS NOT NULL AND Height_Cm > 0 AND Weight_Kg IS NOT NULL 
-                        THEN ROUND(Weight_Kg / POWER(Height_Cm/100, 2), 2)
-                        ELSE NULL
-                    END
-                ) VIRTUAL,
-                CONSTRAINT pk_vitals PRIMARY KEY (Patient_Id, Measure_Ts),
-                CONSTRAINT fk_vitals_patient FOREIGN KEY (Patient_Id) REFERENCES patient(Patient_Id)
-            );
-                """)
-        con.commit()
-        con.close()
+        with db.connection() as con:
+            lifecycle.create(con)
         update_text.value = "Tables created!"
         page.update()
     def drop_tables(e):
-        con = sqlite3.connect("data.db")
-        con.execute("DROP TABLE patient")
-        con.execute("DROP TABLE doctor")
-        con.execute("DROP TABLE booked")
-        con.execute("DROP TABLE bill")
-        con.execute("DROP TABLE medical_procedure")
-        con.execute("DROP TABLE drug")
-        con.execute("DROP TABLE prescription")
-        con.execute("DROP TABLE diagnosis")
-        con.execute("DROP TABLE conditions")
-        con.execute("DROP TABLE condition_details")
-        con.execute("DROP TABLE chronic_condition")
-        con.execute("DROP TABLE infectious_condition")
-        con.execute("DROP TABLE injury_condition")
-        con.execute("DROP TABLE mental_health_condition")
-        con.execute("DROP TABLE vitals")
-        con.commit()
-        con.close()
+        with db.connection() as con:
+            lifecycle.drop(con)
         update_text.value = "Tables dropped!"
         page.update()
+    def save_snapshot(e):
+        try:
+            result = lifecycle.snapshot()
+        except (OSError, sqlite3.Error) as err:
+            update_text.value = f"Snapshot failed: {err}"
+        else:
+            update_text.value = f"Snapshot saved to {result['template']} in {result['seconds']}s"
+        page.update()
+    def reset_snapshot(e):
+        try:
+            result = lifecycle.reset()
+        except (OSError, sqlite3.Error) as err:
+            update_text.value = f"Reset failed: {err}"
+        else:
+            update_text.value = f"Reset from {result['template']} in {result['seconds']}s"
+        page.update()
     def populate_tables(e):
-        con = sqlite3.connect("data.db")
-        con.executescript("""
-                          BEGIN;
-                          INSERT INTO patient VALUES (100000001, 'John', 'A', 'Smith', 'M', date("1990-12-01"), '22 Bathurst St.', 'jsmith@gmail.com', '416-991-2231', 'SF12345678');
-                          INSERT INTO patient VALUES (100000002, 'Amanada', NULL, 'Smith', 'F', date("1988-07-16"), '22 Bathurst St.', 'asmith@gmail.com', '416-991-2231', 'SF12345678');
-                            INSERT INTO patient VALUES (100000003, 'Sandra', 'F', 'Emerson', 'F', date("2001-09-01"), '119 Sheppard Ave W', 'sandra4432@hotmail.com', '905-999-0121', NULL);
-                            INSERT INTO patient VALUES (100000004, 'James', 'E', 'Emerson', 'M', date("2024-09-15"), '119 Sheppard Ave W', NULL, '905-999-0121', NULL);
-                            INSERT INTO patient VALUES (100000005, 'Julian', NULL, 'Emerson', 'M', date("1999-10-02"), '119 Sheppard Ave W', 'julianemerson@gmail.com', '289-991-2646', NULL);
-                            INSERT INTO patient VALUES (100000006, 'Avery', 'A', 'Jones', 'X', date("1989-03-31"), '898 Oakwood Ave.', NULL, NULL, 'GS987654321');
-                          INSERT INTO doctor VALUES (100001, 'Addison', 'Montgomery', 'F', '4512', 'Gynecology', 'English', 'Active');
-                            INSERT INTO doctor VALUES (100002, 'James', 'Wilson', 'M', '4513', 'Oncology', NULL, 'Active');
-                            INSERT INTO doctor VALUES (100003, 'Gregory', 'House', 'M', '4514', NULL, 'Spanish', 'Inactive');
-                            INSERT INTO doctor VALUES (100004, 'Robert', 'Chase', 'M', '4515', NULL, 'German', 'Active');
-                            INSERT INTO doctor VALUES (100005, 'Preston', 'Burke', 'M', '4516', 'Cardiology', 'English', 'Active');
-                            INSERT INTO doctor VALUES (100006, 'Meredith', 'Grey', 'F', '4517', NULL, 'English, Russian', 'Active');
-                            INSERT INTO doctor VALUES (100007, 'Christina', 'Yang', 'F', '4517', 'Cardiology', 'Mandarin', 'Active');
-                            INSERT INTO doctor VALUES (100008, 'Allison', 'Cameron', 'F', '4518', 'Immunology', 'English', 'Active');
-                            INSERT INTO doctor VALUES (100009, 'Anita', 'Akavan', 'F', '4599', 'Psychology', 'Persian', 'Active');
-                          INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
-                            VALUES (date("2025-10-25"), 100000001, 100001, '10:00', 'Annual check-up');
-                            INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
-                            VALUES (date("2025-11-05"), 100000002, 100008, '14:30', 'Allergic reaction/rash');
-                            INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
-                            VALUES (date("2025-12-10"), 100000005, 100005, '09:15', 'Cardiology follow-up');
-                            INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
-                            VALUES (date("2025-11-16"), 100000003, 100009, '11:00', 'Initial consultation');
-                            INSERT INTO bill (payer, status, amount, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES ('Insurance', 'Paid', 125.50, date("2025-10-25"), 100000001, 100001);
-                            INSERT INTO bill (payer, status, amount, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES ('Patient', 'Unpaid', 75.00, date("2025-11-05"), 100000002, 100008);
-                            INSERT INTO bill (payer, status, amount, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES ('Insurance', 'Unpaid', 250.75, date("2025-11-16"), 100000003, 100009);
-                            INSERT INTO medical_procedure (procedure_type, location, procedure_summary, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES ('Physical', 'Exam Room 1', 'Standard physical exam with blood draw.', date("2025-10-25"), 100000001, 100001);
-                            INSERT INTO medical_procedure (procedure_type, location, procedure_summary, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES ('Dermatology', 'Exam Room 3', 'Skin scraping to test for fungal infection.', date("2025-11-05"), 100000002, 100008);
-                            INSERT INTO medical_procedure (procedure_type, location, procedure_summary, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES ('Consult', 'Office 2', 'Initial mental health assessment. Discussed history and treatment goals.', date(2025-11-16), 100000003, 100009);
-                          INSERT INTO drug (DIN, drug_name, dosage) VALUES (1234567890, 'Amoxicillin', 500);
-                            INSERT INTO drug (DIN, drug_name, dosage) VALUES (2345678901, 'Lipitor', 20);
-                            INSERT INTO drug (DIN, drug_name, dosage) VALUES (3456789012, 'Zoloft', 50);
-                            INSERT INTO drug (DIN, drug_name, dosage) VALUES (4567890123, 'Acetaminophen', 325);
-                            INSERT INTO prescription (DIN, med_count, refills, frequency, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES (2345678901, 30, 3, 1, date("2025-10-25"), 100000001, 100001);
-                            INSERT INTO prescription (DIN, med_count, refills, frequency, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES (1234567890, 14, 0, 2, date("2025-11-05"), 100000002, 100008);
-                            INSERT INTO prescription (DIN, med_count, refills, frequency, Appointment_Date, Patient_Id, Doctor_Id)
-                            VALUES (3456789012, 60, 1, 1, date("2025-11-16"), 100000003, 100009);
-                          INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
-                            VALUES ('ICD-10', 'I10', 'Essential Hypertension', 'chronic');
-                            INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
-                            VALUES ('ICD-10', 'J02.9', 'Acute Pharyngitis', 'infectious');
-                            INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
-                            VALUES ('DSM-5-TR', '300.4', 'Persistent Depressive Disorder', 'mental_health');
-                            INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
-                            VALUES ('ICD-10', 'S82.30', 'Fracture of Tibia', 'injury');
-                            INSERT INTO conditions (Patient_Id, Diagnosis_Name, Onset_Date)
-                            VALUES (100000001, 'Essential Hypertension', date("2024-05-10"));
-                            INSERT INTO conditions (Patient_Id, Diagnosis_Name, Onset_Date)
-                            VALUES (100000002, 'Acute Pharyngitis', date("2025-11-01"));
-                            INSERT INTO conditions (Patient_Id, Diagnosis_Name, Onset_Date)
-                            VALUES (100000003, 'Persistent Depressive Disorder', date("2023-01-20"));
-                            INSERT INTO condition_details (Condition_Id, Patient_Id, Code_System, Code, Onset_Date, Clinical_Status, Severity, Doctor_Id)
-                            VALUES (100000, 100000001, 'ICD-10', 'I10', date("2024-05-10"), 'active', 'moderate', 100001);
-                            INSERT INTO condition_details (Condition_Id, Patient_Id, Code_System, Code, Onset_Date, Abatement_Date, Clinical_Status, Severity, Doctor_Id)
-                            VALUES (100001, 100000002, 'ICD-10', 'J02.9', date("2025-11-01"), date("2025-11-15"), 'resolved', 'mild', 100008);
-                            INSERT INTO condition_details (Condition_Id, Patient_Id, Code_System, Code, Onset_Date, Clinical_Status, Severity, Doctor_Id)
-                            VALUES (100002, 100000003, 'DSM-5-TR', '300.4', date("2023-01-20"), 'active', 'moderate', 100009);
-                            INSERT INTO chronic_condition (Condition_Id, Is_Lifestyle_Modifiable, Long_Term_Med_Required, Follow_Up_Interval_Months)
-                            VALUES (100000, 'Y', 'Y', 6);
-                            INSERT INTO infectious_condition (Condition_Id, Pathogen_Type, Isolation_Required)
-                            VALUES (100001, 'virus', 'N');
-                            INSERT INTO mental_health_condition (Condition_Id, Disorder_Category, Episode, Treatment_Type, Risk_Factor)
-                            VALUES (100002, 'Mood Disorder', 'multiple', 'Cognitive Behavioral Therapy', 'Family History');
-                            INSERT INTO vitals (Patient_Id, Measure_Ts, Height_Cm, Weight_Kg, Bp_Systolic, Bp_Diastolic, Heart_Rate, Resp_Rate, Temp_C, SpO2)
-                            VALUES (100000001, date("2025-11-16"), 175.00, 80.50, 145, 95, 75, 16, 36.8, 98);
-                            INSERT INTO vitals (Patient_Id, Measure_Ts, Height_Cm, Weight_Kg, Bp_Systolic, Bp_Diastolic, Heart_Rate, Resp_Rate, Temp_C, SpO2)
-                            VALUES (100000002, date("2025-11-05"), 162.00, 65.00, 120, 80, 85, 18, 37.2, 97);
-                            INSERT INTO vitals (Patient_Id, Measure_Ts, Height_Cm, Weight_Kg, Bp_Systolic, Bp_Diastolic, Heart_Rate, Resp_Rate, Temp_C, SpO2)
-                            VALUES (100000003, date("2025-11-16"), 168.00, 58.00, 110, 70, 68, 15, 36.5, 99);
-                          COMMIT;
-                          """)
-        con.close()
+        with db.connection() as con:
+            schema.populate_tables(con)
+        cache.clear()
         update_text.value = "Tables populated!"
         page.update()
     def create_views(e):
-        con = sqlite3.connect('data.db')
-        con.executescript("""
-                          BEGIN;
-                            CREATE VIEW overdue_bills (Patient, Appt_Date, Amount) AS SELECT Patient_Id, Appointment_Date, Amount FROM bill
-                            WHERE Status = 'Unpaid' AND ((date('now') - Appointment_Date) > 3) ORDER BY Patient_Id, Appointment_Date;
-
-                            CREATE VIEW day_schedule_100001 (Patient, Time, Reason) AS SELECT Patient_Id, Appointment_Time, Reason FROM booked
-                            WHERE Doctor_Id=100001 AND Appointment_Date=date("2025-10-25") ORDER BY Appointment_Time;
-
-                            CREATE VIEW prescription_history (Pres_Date, Drug, DIN, Drug_Count, Dosage_Mg, Refills, Frequency, Doctor) AS
-                            SELECT Appointment_Date, Drug_Name, prescription.DIN, Med_Count, Dosage, Refills, Frequency, doctor.L_Name FROM prescription, doctor, drug
-                            WHERE Patient_Id=100000002
-                            AND doctor.Doctor_Id = prescription.Doctor_Id
-                            AND prescription.DIN = drug.DIN
-                            ORDER BY Appointment_Date;
-                          COMMIT;
-                          """)
-        con.close()
+        with db.connection() as con:
+            schema.create_views(con)
         update_text.value = "Views created!"
         page.update()
     def drop_views(e):
-        con = sqlite3.connect("data.db")
-        con.executescript("""
-                          BEGIN;
-                          DROP VIEW overdue_bills;
-
-                          DROP VIEW day_schedule_100001;
-
-                          DROP VIEW prescription_history;
-                          COMMIT;
-                          """)
-        con.close()
+        with db.connection() as con:
+            schema.drop_views(con)
         update_text.value = "Views dropped!"
         page.update()
-    def table_queries(e):
-        go_table_queries(page)
-    def view_queries(e):
-        go_view_queries(page)
+    def import_file(e):
+        if not import_path.value or not import_table.value:
+            update_text.value = "Choose a table and a CSV/JSONL file to import."
+            page.update()
+            return
+        def run():
+            def progress(loaded, rejected, rate):
+                update_text.value = f"Importing... {loaded:,} loaded, {rejected:,} rejected ({rate:,.0f} rows/sec)"
+                page.update()
+            try:
+                result = loader.load(import_path.value, import_table.value, progress=progress)
+            except (OSError, ValueError, sqlite3.Error) as err:
+                update_text.value = f"Import failed: {err}"
+            else:
+                update_text.value = (f"Imported {result['loaded']:,} rows into {result['table']} "
+                                     f"({result['rows_per_sec']:,.0f} rows/sec), {result['rejected']:,} rejected")
+                if result["reject_file"]:
+                    update_text.value += f" - see {result['reject_file']}"
+            page.update()
+        update_text.value = "Importing..."
+        page.update()
+        page.run_thread(run)
+    def export_source():
+        if not export_table.value:
+            raise ValueError("Choose a table to export.")
+        return export_table.value, f'SELECT * FROM "{export_table.value}"', (), None
+    import_table = ft.Dropdown(label="Table", width=150, options=[ft.dropdown.Option(name) for name in loader.TABLES])
+    import_path = ft.TextField(label="CSV or JSONL file", expand=True)
+    export_table = ft.Dropdown(label="Table", width=150, options=[ft.dropdown.Option(name) for name, _ in schema.TABLES])
     content = ft.SafeArea(
             ft.Column(
                 [
@@ -405,6 +121,8 @@ def main_menu(page: ft.Page):
                             ft.FilledButton(text="Create Tables", on_click=create_tables),
                             ft.FilledButton(text="Populate Tables", on_click=populate_tables),
                             ft.FilledButton(text="Drop Tables", on_click=drop_tables),
+                            ft.FilledButton(text="Save Snapshot", on_click=save_snapshot),
+                            ft.FilledButton(text="Reset to Snapshot", on_click=reset_snapshot),
                         ]
                     ),
                     ft.Text("Views", weight=ft.FontWeight.BOLD),
@@ -414,136 +132,125 @@ def main_menu(page: ft.Page):
                             ft.FilledButton(text="Drop Views", on_click=drop_views)
                         ]
                     ),
+                    ft.Text("Import", weight=ft.FontWeight.BOLD),
+                    ft.Row(
+                        [
+                            import_table,
+                            import_path,
+                            ft.FilledButton(text="Import", on_click=import_file)
+                        ]
+                    ),
+                    ft.Text("Export", weight=ft.FontWeight.BOLD),
+                    ft.Row([export_table, export_row(page, export_source)]),
                     ft.Text("Queries", weight=ft.FontWeight.BOLD),
                     ft.Row(
                         [
-                            ft.FilledButton(text="Table Options", on_click=table_queries),
-                            ft.FilledButton(text="View Options", on_click=view_queries) 
+                            ft.FilledButton(text="Table Options", on_click=lambda e: router.go("table_queries")),
+                            ft.FilledButton(text="View Options", on_click=lambda e: router.go("view_queries")),
+                            ft.FilledButton(text="Vitals Trends", on_click=lambda e: router.go("vitals")),
+                            ft.FilledButton(text="Search", on_click=lambda e: router.go("search")),
+                            ft.FilledButton(text="Book Appointment", on_click=lambda e: router.go("schedule")),
+                            ft.FilledButton(text="Patient 360", on_click=lambda e: router.go("patient360")),
+                            ft.FilledButton(text="Co-care", on_click=lambda e: router.go("cocare")),
+                            ft.FilledButton(text="Conditions", on_click=lambda e: router.go("conditions")),
+                            ft.FilledButton(text="Analytics", on_click=lambda e: router.go("analytics"))
+                        ]
+                    ),
+                    ft.Text("Admin", weight=ft.FontWeight.BOLD),
+                    ft.Row(
+                        [
+                            ft.FilledButton(text="Cache & Connections", on_click=lambda e: router.go("admin")),
+                            ft.FilledButton(text="Diagnostics", on_click=lambda e: router.go("diagnostics"))
                         ]
                     )
                 ]
             )
         )
-    page.controls = [content]
-    page.update()
+    return Screen(content)
+
+def export_row(page: ft.Page, source):
+    import export
+    # source() returns (name, sql, params, order_by) for whatever is on screen when Export is pressed
+    def run(e):
+        try:
+            name, sql, params, order_by = source()
+        except ValueError as err:
+            status.value = str(err)
+            page.update()
+            return
+        fmt = format_picker.value
+        def work():
+            shown = [0.0]
+            def progress(rows, elapsed):
+                if elapsed - shown[0] >= 0.5:
+                    shown[0] = elapsed
+                    status.value = f"Exporting... {rows:,} rows ({rows / elapsed:,.0f} rows/sec)"
+                    page.update()
+            try:
+                result = export.export_query(name, sql, params, fmt, order_by, progress=progress)
+            except (OSError, ValueError, sqlite3.Error) as err:
+                status.value = f"Export failed: {err}"
+            else:
+                status.value = f"Exported {result['rows']:,} rows ({result['bytes']:,} bytes) in {result['seconds']}s"
+                if page.web:
+                    try:
+                        folder, link.url = export.share(result["path"])
+                    except OSError as err:
+                        status.value = f"Export failed: {err}"
+                    else:
+                        page.session.get("exports").append(folder)
+                        link.text = os.path.basename(result["path"])
+                        link.visible = True
+                else:
+                    status.value += f" to {result['path']}"
+            export_button.disabled = False
+            page.update()
+        export_button.disabled = True
+        link.visible = False
+        status.value = "Exporting..."
+        page.update()
+        page.run_thread(work)
+    format_picker = ft.Dropdown(label="Format", width=130, value="csv",
+                                options=[ft.dropdown.Option(fmt) for fmt in export.FORMATS])
+    export_button = ft.FilledButton(text="Export", on_click=run)
+    status = ft.Text(italic=True)
+    link = ft.TextButton(visible=False)
+    return ft.Row([format_picker, export_button, status, link])
 
-def go_table_queries(page: ft.Page):
+def go_table_queries(page: ft.Page, router: Router):
+    from queries import QUERIES
+    from runner import QueryRunner
+    runner = QueryRunner()
     def back(e):
+        runner.cancel()
         page.window.height = 600
         page.window.width = 400
-        page.controls = [content]
+        results.visible = False
+        menu.visible = True
         page.update()
     def avg_unpaid(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("SELECT patient_id AS patient, AVG(amount) AS average FROM bill WHERE status='Unpaid' GROUP BY patient_id;")
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient ID', 'Average Unpaid Amount']
-        page.controls = [ft.Text("Average Unpaid Bill", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        make_table(QUERIES["avg_unpaid"])
     def insurance(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("""
-            SELECT patient_id, f_name, l_name, insurance
-            FROM patient
-            WHERE insurance IS NULL
-            UNION
-                SELECT patient_id, f_name, l_name, insurance
-                    FROM patient
-                    WHERE insurance LIKE 'SF%';
-                          """)
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient ID', 'First Name', 'Last Name', 'Insurance']
-        page.controls = [ft.Text("Insurance", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        make_table(QUERIES["insurance"])
     def no_prescriptions(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("""
-                    SELECT patient_id AS id, f_name AS first_name, l_name AS last_name
-                    FROM patient
-                    WHERE patient_id IN (
-                        SELECT patient_id FROM booked
-                    )
-                    AND patient_id NOT IN (
-                        SELECT patient_id FROM prescription
-                    )
-                    ORDER BY patient_id;
-                """)
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient ID', 'First Name', 'Last Name']
-        page.controls = [ft.Text("No Prescriptions", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        make_table(QUERIES["no_prescriptions"])
     def num_appt(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("""
-            SELECT DISTINCT doctor_id AS doctor, patient_id AS patient, COUNT(patient_id) AS count FROM booked GROUP BY patient_id, doctor_id ORDER BY doctor_id, patient_id;
-                          """)
-        data = res.fetchall()
-        con.close()
-        headings = ['Doctor ID', 'Patient ID', 'Count']
-        page.controls = [ft.Text("Number of Appointments", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        make_table(QUERIES["num_appt"])
     def num_doctors(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("""
-            SELECT patient_id AS patients, COUNT(DISTINCT doctor_id) AS doctors FROM booked GROUP BY patient_id ORDER BY patient_id;
-                          """)
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient ID', 'Doctor Count']
-        page.controls = [ft.Text("Number of Doctors (by Patient)", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        make_table(QUERIES["num_doctors"])
     def num_patients(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("""
-            SELECT doctor_id AS doctor, COUNT(DISTINCT patient_id) as patients FROM booked GROUP BY doctor_id ORDER BY patients DESC, doctor_id ASC;
-                          """)
-        data = res.fetchall()
-        con.close()
-        headings = ['Doctor ID', 'Patient Count']
-        page.controls = [ft.Text("Number of Patients (by Doctor)", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        make_table(QUERIES["num_patients"])
     def multi_docs(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("""
-            SELECT DISTINCT p.patient_id AS id, f_name AS first_name, l_name AS last_name
-                FROM patient p, booked b
-                WHERE EXISTS
-                    (SELECT b1.patient_id
-                    FROM booked b1, booked b2
-                    WHERE b1.doctor_id = '100002'
-                    AND b1.patient_id = p.patient_id
-                    AND b2.doctor_id = '100004'
-                    AND b2.patient_id = b1.patient_id)
-                ORDER BY p.patient_id;
-                          """)
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient ID', 'First Name', 'Last Name']
-        page.controls = [ft.Text("Insurance", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
-    def make_table(headings, data):
+        make_table(QUERIES["multi_docs"])
+    def make_table(query, values=None):
         page.window.width = 1000
         page.window.height = 600
-        columns = []
-        rows = []
-        for text in headings:
-            columns.append(ft.DataColumn(ft.Text(text)))
-        for tuple in data:
-            cells = []
-            for att in tuple:
-                cells.append(ft.DataCell(ft.Text(att)))
-            rows.append(ft.DataRow(cells=cells))
-        table = ft.DataTable(columns, rows)
-        page.controls.append(table)
-        page.controls.append(back_button)
-        page.update()
-    def go_main(e):
-        main_menu(page)
+        table = show_table(page, results, query, values, runner, back)
+        menu.visible = False
+        page.update()
+        table.load()
 
-    content = ft.SafeArea(
+    menu = ft.SafeArea(
             ft.Column(
                 [
                     ft.Text("Table Query Menu", size=40, weight=ft.FontWeight.BOLD),
@@ -554,76 +261,622 @@ def go_table_queries(page: ft.Page):
                     ft.FilledButton(text="Number of doctors by patient", on_click=num_doctors),
                     ft.FilledButton(text="Number of patients by doctor", on_click=num_patients),
                     ft.FilledButton(text="Patients that see multiple doctors", on_click=multi_docs),
-                    ft.OutlinedButton(text="Return to main menu", on_click=go_main)
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
                 ]
             )
         )
-    back_button = ft.OutlinedButton(text="Return to menu", on_click=back)
-    page.controls = [content]
-    page.update()
+    results = ft.Column(visible=False)
+    return Screen(ft.Column([menu, results]), width=400, height=600, leave=runner.cancel)
+
+def show_table(page: ft.Page, results, query, values, runner, back):
+    # A report's grid replaces whatever the results column showed; the caller loads the
+    # returned grid once it is on the page
+    from grid import ResultGrid
+    table = ResultGrid(query.headings, query.sql, query.key, query.bind(values), runner=runner,
+                       timeout=query.timeout, tables=query.tables, name=query.name, records=query.records)
+    results.controls = [ft.Text(query.format_title(values), size=40, weight=ft.FontWeight.BOLD), table,
+                        export_row(page, lambda: (query.name, table.pager.sql, table.pager.params,
+                                                  table.pager.order_by())),
+                        ft.OutlinedButton(text="Return to menu", on_click=back)]
+    results.visible = True
+    return table
 
-def go_view_queries(page: ft.Page):
+def go_view_queries(page: ft.Page, router: Router):
+    from queries import QUERIES
+    from runner import QueryRunner
+    runner = QueryRunner()
     def back(e):
+        runner.cancel()
         page.window.height = 600
         page.window.width = 400
-        page.controls = [content]
+        results.visible = False
+        menu.visible = True
         page.update()
-    def go_main(e):
-        main_menu(page)
-    def make_table(headings, data):
+    def make_table(query, values=None):
         page.window.width = 1000
         page.window.height = 600
-        columns = []
-        rows = []
-        for text in headings:
-            columns.append(ft.DataColumn(ft.Text(text)))
-        for tuple in data:
-            cells = []
-            for att in tuple:
-                cells.append(ft.DataCell(ft.Text(att)))
-            rows.append(ft.DataRow(cells=cells))
-        table = ft.DataTable(columns, rows)
-        page.controls.append(table)
-        page.controls.append(back_button)
+        table = show_table(page, results, query, values, runner, back)
+        menu.visible = False
         page.update()
+        table.load()
+    def param_fields(query):
+        row = []
+        for param in query.params:
+            default = param.default() if callable(param.default) else param.default
+            field = ft.TextField(label=param.label, value=str(default), width=160, dense=True)
+            fields[(query.name, param.name)] = field
+            row.append(field)
+        return row
+    def run_view(query):
+        values = {param.name: fields[(query.name, param.name)].value for param in query.params}
+        try:
+            query.parse(values)
+        except ValueError as err:
+            update_text.value = str(err)
+            page.update()
+            return
+        update_text.value = ""
+        make_table(query, values)
     def prescriptions(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("SELECT * FROM prescription_history")
-        data = res.fetchall()
-        con.close()
-        headings = ['Date', 'Drug', 'DIN', 'Count', 'Dosage (mg)', 'Refills', 'Frequency', 'Prescribed by ...']
-        page.controls = [ft.Text("Prescription History", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        run_view(QUERIES["prescriptions"])
     def schedule(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("SELECT * FROM day_schedule_100001")
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient', 'Time', 'Reason']
-        page.controls = [ft.Text("Doctor #100001's Schedule (Oct 25, 2025)", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        run_view(QUERIES["schedule"])
     def unpaid(e):
-        con = sqlite3.connect("data.db")
-        res = con.execute("SELECT * FROM overdue_bills")
-        data = res.fetchall()
-        con.close()
-        headings = ['Patient', 'Appointment Date', 'Amount']
-        page.controls = [ft.Text("Overdue Bills", size=40, weight=ft.FontWeight.BOLD)]
-        make_table(headings, data)
+        run_view(QUERIES["unpaid"])
+    def aging(e):
+        run_view(QUERIES["aging"])
 
-    content = ft.SafeArea(
+    fields = {}
+    update_text = ft.Text(italic=True)
+    menu = ft.SafeArea(
             ft.Column(
                 [
                     ft.Text("View Query Menu", size=40, weight=ft.FontWeight.BOLD),
-                    ft.FilledButton(text="Prescription history", on_click=prescriptions),
-                    ft.FilledButton(text="Doctor schedule", on_click=schedule),
-                    ft.FilledButton(text="Unpaid, overdue bills", on_click=unpaid),
-                    ft.OutlinedButton(text="Return to main menu", on_click=go_main)
+                    update_text,
+                    ft.Row(param_fields(QUERIES["prescriptions"]) + [ft.FilledButton(text="Prescription history", on_click=prescriptions)]),
+                    ft.Row(param_fields(QUERIES["schedule"]) + [ft.FilledButton(text="Doctor schedule", on_click=schedule)]),
+                    ft.Row(param_fields(QUERIES["unpaid"]) + [ft.FilledButton(text="Unpaid, overdue bills", on_click=unpaid)]),
+                    ft.Row(param_fields(QUERIES["aging"]) + [ft.FilledButton(text="Bill aging by payer", on_click=aging)]),
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    results = ft.Column(visible=False)
+    return Screen(ft.Column([menu, results]), width=400, height=600, leave=runner.cancel)
+
+def go_vitals(page: ft.Page, router: Router):
+    import vitals
+    from grid import ResultGrid
+    from runner import QueryRunner
+    runner = QueryRunner()
+    def show(e):
+        try:
+            patient_id = int(patient_field.value)
+            start = vitals.moment(start_field.value)
+            end = vitals.moment(end_field.value)
+            level, sql, params = vitals.trend_query(patient_id, metric_picker.value, start, end)
+        except ValueError as err:
+            update_text.value = str(err)
+            page.update()
+            return
+        runner.cancel()
+        page.window.width = 1000
+        update_text.value = f"{metric_picker.value} for patient {patient_id}, {level} resolution"
+        grid = ResultGrid(["Time", "Readings", "Average", "Minimum", "Maximum"], sql, [("time", False)], params,
+                          runner=runner, tables=("vitals",), name="vitals_trend")
+        results.content = grid
+        page.update()
+        grid.load()
+
+    update_text = ft.Text(italic=True)
+    patient_field = ft.TextField(label="Patient ID", value="100000001", width=160, dense=True)
+    metric_picker = ft.Dropdown(label="Metric", width=160, value="Heart_Rate",
+                                options=[ft.dropdown.Option(metric) for metric in vitals.METRICS])
+    start_field = ft.TextField(label="From (YYYY-MM-DD[ HH:MM])", value="2025-11-01", width=200, dense=True)
+    end_field = ft.TextField(label="To (YYYY-MM-DD[ HH:MM])", value="2025-12-01", width=200, dense=True)
+    results = ft.Container()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Vitals Trends", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Row([patient_field, metric_picker, start_field, end_field,
+                            ft.FilledButton(text="Show trend", on_click=show)]),
+                    update_text,
+                    results,
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    return Screen(content, leave=runner.cancel)
+
+def go_search(page: ft.Page, router: Router):
+    import search
+    from runner import QueryRunner
+    runner = QueryRunner(timeout=5.0)
+    state = {"timer": None, "generation": 0}
+    def changed(e):
+        # Wait for a pause in typing, then run only the latest text; older searches still
+        # in flight are interrupted and their results dropped
+        if state["timer"]:
+            state["timer"].cancel()
+        state["generation"] += 1
+        timer = threading.Timer(search.DEBOUNCE, run, [state["generation"], query_field.value])
+        timer.daemon = True
+        state["timer"] = timer
+        timer.start()
+    def run(generation, text):
+        runner.cancel()
+        runner.submit(lambda con: search.search(con, text), lambda found: show(generation, found),
+                      lambda err: failed(generation, err))
+    def show(generation, found):
+        if generation != state["generation"]:
+            return
+        controls = []
+        for table, (rows, matches, ranked) in found.items():
+            if not rows:
+                continue
+            count = f"{matches:,}" if ranked else f"{matches:,}+"
+            controls.append(ft.Text(f"{table.capitalize()} ({count} matches)", weight=ft.FontWeight.BOLD))
+            controls.extend(ft.ListTile(title=ft.Text(title), subtitle=ft.Text(f"{ident}  {detail}"), dense=True)
+                            for ident, title, detail, _ in rows)
+        if not controls:
+            controls.append(ft.Text("No matches" if found else "Type at least two letters", italic=True))
+        results.controls = controls
+        page.update()
+    def failed(generation, err):
+        if generation != state["generation"]:
+            return
+        results.controls = [ft.Text(str(err), color=ft.Colors.ERROR)]
+        page.update()
+    def leave():
+        if state["timer"]:
+            state["timer"].cancel()
+        runner.cancel()
+
+    query_field = ft.TextField(label="Name, email, phone, address, specialty, diagnosis or code",
+                               autofocus=True, on_change=changed)
+    results = ft.Column()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Search", size=40, weight=ft.FontWeight.BOLD),
+                    query_field,
+                    results,
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    return Screen(content, leave=leave)
+
+def go_schedule(page: ft.Page, router: Router):
+    import scheduler
+    from runner import QueryRunner
+    runner = QueryRunner()
+    def number(field):
+        return int(field.value) if field.value and field.value.strip() else None
+    def find(e=None, note=None):
+        try:
+            patient_id, doctor_id = number(patient_field), number(doctor_field)
+        except ValueError:
+            update_text.value = "Patient and doctor IDs must be numbers"
+            page.update()
+            return
+        specialty, language = specialty_field.value.strip(), language_field.value.strip()
+        def work(con):
+            return scheduler.schedule.free_slots(
+                con, scheduler.doctors(con, doctor_id, specialty, language), int(count_picker.value), patient_id=patient_id)
+        update_text.value = "Searching..."
+        page.update()
+        runner.submit(work, lambda slots: show(slots, patient_id, note), failed)
+    def show(slots, patient_id, note):
+        update_text.value = note or (f"{len(slots)} free slots" if slots else "No free slots in the next 60 days")
+        slot_list.controls = [
+            ft.Row([ft.Text(f"{date}  {at}  doctor {doctor}", width=260),
+                    ft.FilledButton(text="Book", disabled=patient_id is None,
+                                    on_click=lambda e, slot=(patient_id, doctor, date, at): book(slot))])
+            for date, at, doctor in slots
+        ]
+        page.update()
+    def failed(err):
+        update_text.value = str(err)
+        page.update()
+    def book(slot):
+        patient_id, doctor, date, at = slot
+        try:
+            scheduler.schedule.book(patient_id, doctor, date, at, reason_field.value or None)
+        except (scheduler.SlotTaken, sqlite3.Error) as err:
+            update_text.value = f"Could not book: {err}"
+            page.update()
+            return
+        find(note=f"Booked patient {patient_id} with doctor {doctor} on {date} at {at}")
+
+    update_text = ft.Text(italic=True)
+    patient_field = ft.TextField(label="Patient ID", width=140, dense=True)
+    doctor_field = ft.TextField(label="Doctor ID", width=120, dense=True)
+    specialty_field = ft.TextField(label="Specialty", width=140, dense=True)
+    language_field = ft.TextField(label="Language", width=120, dense=True)
+    count_picker = ft.Dropdown(label="Slots", width=90, value="10",
+                               options=[ft.dropdown.Option(str(n)) for n in (5, 10, 25, 50)])
+    reason_field = ft.TextField(label="Reason", width=200, dense=True)
+    slot_list = ft.Column()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Book Appointment", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Row([patient_field, doctor_field, specialty_field, language_field, count_picker]),
+                    ft.Row([reason_field, ft.FilledButton(text="Find free slots", on_click=find)]),
+                    update_text,
+                    slot_list,
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    return Screen(content, width=1000, leave=runner.cancel)
+
+def go_cocare(page: ft.Page, router: Router):
+    import cocare
+    from runner import QueryRunner
+    runner = QueryRunner()
+    def listed(field, convert=str):
+        return [convert(value.strip()) for value in (field.value or "").split(",") if value.strip()]
+    def find(e):
+        try:
+            doctors = listed(doctors_field, int)
+        except ValueError:
+            update_text.value = "Doctor IDs must be numbers, separated by commas"
+            page.update()
+            return
+        specialties = listed(specialties_field)
+        start, end = start_field.value.strip() or None, end_field.value.strip() or None
+        def work(con):
+            began = time.perf_counter()
+            ids = cocare.find(con, doctors, specialties, mode_picker.value, start, end)
+            return ids, cocare.patients(con, ids), time.perf_counter() - began
+        runner.cancel()
+        update_text.value = "Searching..."
+        page.update()
+        runner.submit(work, show, failed)
+    def show(found):
+        ids, rows, seconds = found
+        more = f", first {len(rows)} shown" if len(ids) > len(rows) else ""
+        update_text.value = f"{len(ids):,} patients in {seconds * 1000:.0f}ms{more}"
+        results.rows = [ft.DataRow(cells=[ft.DataCell(ft.Text(str(value))) for value in row]) for row in rows]
+        page.update()
+    def failed(err):
+        update_text.value = str(err)
+        page.update()
+
+    update_text = ft.Text(italic=True)
+    doctors_field = ft.TextField(label="Doctor IDs", value="100002, 100004", width=200, dense=True)
+    specialties_field = ft.TextField(label="Specialties", width=220, dense=True)
+    mode_picker = ft.Dropdown(label="Seen by", width=120, value="all",
+                              options=[ft.dropdown.Option(mode) for mode in cocare.MODES])
+    start_field = ft.TextField(label="From", width=130, dense=True)
+    end_field = ft.TextField(label="To", width=130, dense=True)
+    results = ft.DataTable([ft.DataColumn(ft.Text(text)) for text in ("Patient ID", "First Name", "Last Name")])
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Co-care", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Row([doctors_field, specialties_field, mode_picker]),
+                    ft.Row([start_field, end_field, ft.FilledButton(text="Find patients", on_click=find)]),
+                    update_text,
+                    results,
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    return Screen(content, width=1000, leave=runner.cancel)
+
+def go_conditions(page: ft.Page, router: Router):
+    import conditions
+    from runner import QueryRunner
+    runner = QueryRunner()
+    def find(e):
+        try:
+            patient = int(patient_field.value) if patient_field.value.strip() else None
+            follow_up = int(follow_up_field.value) if follow_up_field.value.strip() else None
+        except ValueError:
+            update_text.value = "Patient ID and follow-up months must be numbers"
+            page.update()
+            return
+        filters = {
+            "patient": patient,
+            "type": type_picker.value or None,
+            "diagnosis": diagnosis_field.value.strip() or None,
+            "status": status_picker.value or None,
+            "severity": [severity_picker.value] if severity_picker.value else None,
+            "follow_up_months": follow_up,
+            "isolation": isolation_box.value or None,
+        }
+        def work(con):
+            began = time.perf_counter()
+            return conditions.find(con, filters), time.perf_counter() - began
+        runner.cancel()
+        update_text.value = "Searching..."
+        page.update()
+        runner.submit(work, show, failed)
+    def show(found):
+        rows, seconds = found
+        more = f", first {len(rows)} shown" if len(rows) == conditions.LIMIT else ""
+        update_text.value = f"{len(rows):,} conditions in {seconds * 1000:.0f}ms{more}"
+        results.rows = [ft.DataRow(cells=[ft.DataCell(ft.Text("" if value is None else str(value)))
+                                          for value in row[:-1] + (conditions.describe(row.type, row.details),)])
+                        for row in rows]
+        page.update()
+    def failed(err):
+        update_text.value = str(err)
+        page.update()
+    def picker(label, values, width):
+        return ft.Dropdown(label=label, width=width, value="",
+                           options=[ft.dropdown.Option("", "Any")] + [ft.dropdown.Option(value) for value in values])
+
+    update_text = ft.Text(italic=True)
+    patient_field = ft.TextField(label="Patient ID", width=150, dense=True)
+    diagnosis_field = ft.TextField(label="Diagnosis", width=220, dense=True)
+    type_picker = picker("Type", conditions.TYPES, 160)
+    status_picker = picker("Status", conditions.STATUSES, 130)
+    severity_picker = picker("Severity", conditions.SEVERITIES, 130)
+    follow_up_field = ft.TextField(label="Follow-up within (months)", width=200, dense=True)
+    isolation_box = ft.Checkbox(label="Needs isolation")
+    results = ft.DataTable([ft.DataColumn(ft.Text(text)) for text in conditions.HEADINGS])
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Conditions", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Row([patient_field, diagnosis_field, type_picker]),
+                    ft.Row([status_picker, severity_picker, follow_up_field, isolation_box]),
+                    ft.FilledButton(text="Find conditions", on_click=find),
+                    update_text,
+                    ft.Row([results], scroll=ft.ScrollMode.AUTO),
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    return Screen(content, width=1200, leave=runner.cancel)
+
+def go_analytics(page: ft.Page, router: Router):
+    import analytics
+    from runner import QueryRunner
+    # Population statistics run in the background; a 10M-reading table takes seconds
+    runner = QueryRunner(timeout=None)
+    def run(e):
+        analysis = analysis_picker.value
+        start, end = start_field.value.strip() or None, end_field.value.strip() or None
+        runner.cancel()
+        update_text.value = f"Running {analytics.ANALYSES[analysis].lower()}..."
+        histograms.controls = []
+        page.update()
+        runner.submit(lambda con: analytics.run(con, analysis, start, end), show, failed)
+    def show(result):
+        more = ", first 500 shown" if len(result["rows"]) > 500 else ""
+        update_text.value = f"{result['read']:,} rows in {result['seconds']}s, {len(result['rows']):,} groups{more}"
+        results.columns = [ft.DataColumn(ft.Text(text)) for text in result["headings"]]
+        results.rows = [ft.DataRow(cells=[ft.DataCell(ft.Text("" if value is None else str(value))) for value in row])
+                        for row in result["rows"][:500]]
+        histograms.controls = [ft.Text(f"{label:>6}  {analytics.sparkline(counts)}", font_family="monospace")
+                               for label, counts in result.get("histograms", {}).items()]
+        if histograms.controls:
+            histograms.controls.insert(0, ft.Text("Systolic distribution by age band", weight=ft.FontWeight.BOLD))
+        page.update()
+    def failed(err):
+        update_text.value = str(err)
+        page.update()
+
+    analysis_picker = ft.Dropdown(label="Analysis", width=300, value="bp",
+                                  options=[ft.dropdown.Option(key, text) for key, text in analytics.ANALYSES.items()])
+    start_field = ft.TextField(label="From (YYYY-MM-DD)", width=170, dense=True)
+    end_field = ft.TextField(label="To (YYYY-MM-DD)", width=170, dense=True)
+    update_text = ft.Text(italic=True)
+    results = ft.DataTable([ft.DataColumn(ft.Text(text)) for text in analytics.BP_HEADINGS])
+    histograms = ft.Column()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Analytics", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Row([analysis_picker, start_field, end_field, ft.FilledButton(text="Run", on_click=run)]),
+                    update_text,
+                    histograms,
+                    ft.Row([results], scroll=ft.ScrollMode.AUTO),
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
                 ]
             )
         )
-    back_button = ft.OutlinedButton(text="Return to menu", on_click=back)
-    page.controls = [content]
-    page.update()
+    return Screen(content, width=1200, leave=runner.cancel)
+
+def go_patient360(page: ft.Page, router: Router):
+    import patient360
+    from runner import QueryRunner
+    runner = QueryRunner()
+    state = {"patient_id": None}
+    def open_patient(e):
+        try:
+            patient_id = int(patient_field.value)
+        except ValueError:
+            update_text.value = "Patient ID must be a number"
+            page.update()
+            return
+        runner.cancel()
+        state["patient_id"] = patient_id
+        started = time.perf_counter()
+        update_text.value = "Loading..."
+        page.update()
+        runner.submit(lambda con: patient360.header(con, patient_id),
+                      lambda found: show_header(patient_id, found, started), failed)
+    def show_header(patient_id, found, started):
+        if patient_id != state["patient_id"]:
+            return
+        if found is None:
+            update_text.value = f"No patient {patient_id}"
+            details_text.value = ""
+            sections.controls = []
+            page.update()
+            return
+        name = " ".join(part for part in (found["first_name"], found["initial"], found["last_name"]) if part)
+        update_text.value = f"{name} (#{patient_id}), opened in {(time.perf_counter() - started) * 1000:.0f}ms"
+        details_text.value = "  |  ".join([
+            f"Born {found['dob']}", f"Sex {found['sex'] or '-'}", found["address"] or "No address",
+            found["email"] or "No email", found["phone"] or "No phone", f"Insurance {found['insurance'] or 'none'}",
+            f"Unpaid {found['unpaid'] or 0:,.2f}",
+        ])
+        sections.controls = [section_tile(patient_id, section, found["counts"][section.name])
+                             for section in patient360.SECTIONS]
+        page.update()
+    def section_tile(patient_id, section, count):
+        # Sections load the first time they are expanded
+        shown = f"{count:,}" if count <= patient360.COUNT_CAP else f"{patient360.COUNT_CAP:,}+"
+        tile = ft.ExpansionTile(title=ft.Text(f"{section.title} ({shown})"), controls=[ft.ProgressBar()],
+                                maintain_state=True)
+        def expanded(e):
+            if e.data != "true" or tile.data:
+                return
+            tile.data = "loaded"
+            runner.submit(lambda con: patient360.section(con, patient_id, section.name),
+                          lambda rows: show_section(tile, section, rows),
+                          lambda err: show_section(tile, section, err))
+        tile.on_change = expanded
+        return tile
+    def show_section(tile, section, rows):
+        if isinstance(rows, Exception):
+            tile.data = None
+            tile.controls = [ft.Text(str(rows), color=ft.Colors.ERROR)]
+        elif not rows:
+            tile.controls = [ft.Text("None recorded", italic=True)]
+        else:
+            tile.controls = [ft.DataTable(
+                [ft.DataColumn(ft.Text(text)) for text in section.headings],
+                [ft.DataRow(cells=[ft.DataCell(ft.Text("" if value is None else str(value))) for value in row])
+                 for row in rows],
+            )]
+        page.update()
+    def failed(err):
+        update_text.value = str(err)
+        page.update()
+
+    patient_field = ft.TextField(label="Patient ID", value="100000001", width=160, dense=True, on_submit=open_patient)
+    update_text = ft.Text(italic=True)
+    details_text = ft.Text()
+    sections = ft.Column()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Patient 360", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Row([patient_field, ft.FilledButton(text="Open", on_click=open_patient)]),
+                    update_text,
+                    details_text,
+                    sections,
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    return Screen(content, width=1000, leave=runner.cancel)
+
+def go_admin(page: ft.Page, router: Router):
+    def stats_table(stats):
+        rows = [ft.DataRow(cells=[ft.DataCell(ft.Text(name)), ft.DataCell(ft.Text(str(value)))])
+                for name, value in stats.items()]
+        return ft.DataTable([ft.DataColumn(ft.Text("Statistic")), ft.DataColumn(ft.Text("Value"))], rows)
+    def fill():
+        cache_section.content = stats_table(cache.results.stats())
+        pool_section.content = stats_table(db.pool.stats())
+    def refresh(e=None):
+        fill()
+        page.update()
+    def clear_cache(e):
+        cache.clear()
+        refresh()
+
+    cache_section = ft.Container()
+    pool_section = ft.Container()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Admin", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Text("Result cache", weight=ft.FontWeight.BOLD),
+                    cache_section,
+                    ft.Text("Connection pool", weight=ft.FontWeight.BOLD),
+                    pool_section,
+                    ft.Row(
+                        [
+                            ft.FilledButton(text="Refresh", on_click=refresh),
+                            ft.FilledButton(text="Clear cache", on_click=clear_cache)
+                        ]
+                    ),
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ]
+            )
+        )
+    fill()
+    return Screen(content, enter=fill)
+
+def go_diagnostics(page: ft.Page, router: Router):
+    import instrument
+    def text_table(headings, rows):
+        return ft.DataTable([ft.DataColumn(ft.Text(text)) for text in headings],
+                            [ft.DataRow(cells=[ft.DataCell(ft.Text(str(value))) for value in row]) for row in rows])
+    def fill():
+        slowest = instrument.slowest()
+        slowest_section.content = text_table(
+            ["Handler", "Total ms", "Count ms", "Execute ms", "Fetch ms", "Render ms", "Rows", "VM steps", "Cached"],
+            [[op["name"], op["total_ms"], op["count_ms"], op["execute_ms"], op["fetch_ms"], op["render_ms"],
+              op["rows"], op["vm_steps"], op["cached"]] for op in slowest],
+        )
+        histograms = instrument.histograms()
+        labels = [instrument.bucket_label(i) for i in range(len(instrument.BUCKETS_MS) + 1)]
+        histogram_section.content = text_table(["Handler"] + labels,
+                                               [[name] + counts for name, counts in sorted(histograms.items())])
+        statements_section.content = text_table(["Sampled statement"],
+                                                [[sql] for _, sql in reversed(instrument.sampled_statements())])
+    def refresh(e=None):
+        fill()
+        page.update()
+    def reset(e):
+        instrument.reset()
+        refresh()
+
+    slowest_section = ft.Container()
+    histogram_section = ft.Container()
+    statements_section = ft.Container()
+    content = ft.SafeArea(
+            ft.Column(
+                [
+                    ft.Text("Diagnostics", size=40, weight=ft.FontWeight.BOLD),
+                    ft.Text(f"Slowest operations (slow query log: {instrument.SLOW_LOG}, "
+                            f"threshold {instrument.SLOW_MS:g}ms)", weight=ft.FontWeight.BOLD),
+                    slowest_section,
+                    ft.Text("Latency by handler", weight=ft.FontWeight.BOLD),
+                    histogram_section,
+                    ft.Text("Recently traced statements (sampled)", weight=ft.FontWeight.BOLD),
+                    statements_section,
+                    ft.Row(
+                        [
+                            ft.FilledButton(text="Refresh", on_click=refresh),
+                            ft.FilledButton(text="Reset", on_click=reset)
+                        ]
+                    ),
+                    ft.OutlinedButton(text="Return to main menu", on_click=lambda e: router.go("main"))
+                ],
+                scroll=ft.ScrollMode.AUTO
+            )
+        )
+    fill()
+    return Screen(content, enter=fill)
+
+
+SCREENS = {
+    "main": main_menu,
+    "table_queries": go_table_queries,
+    "view_queries": go_view_queries,
+    "vitals": go_vitals,
+    "search": go_search,
+    "schedule": go_schedule,
+    "cocare": go_cocare,
+    "conditions": go_conditions,
+    "analytics": go_analytics,
+    "patient360": go_patient360,
+    "admin": go_admin,
+    "diagnostics": go_diagnostics,
+}
 
-ft.app(main)
+if __name__ == "__main__":
+    ft.app(main)
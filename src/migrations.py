@@ -0,0 +1,125 @@
+import argparse
+import re
+import sys
+
+import db
+import journal
+import queries
+import schema
+import search
+import summaries
+import vitals
+from pager import Pager
+
+# Each migration is (version, description, statements). The applied version is kept in
+# PRAGMA user_version so existing databases only run the migrations they are missing.
+MIGRATIONS = [
+    (1, "indexes for hot query predicates", [
+        # Partial index over unpaid bills only: serves avg_unpaid and overdue_bills without touching paid rows
+        "CREATE INDEX IF NOT EXISTS idx_bill_unpaid ON bill (Patient_Id, Appointment_Date, amount) WHERE status = 'Unpaid'",
+        "CREATE INDEX IF NOT EXISTS idx_booked_schedule ON booked (Doctor_Id, Appointment_Date, Appointment_Time, Patient_Id, Reason)",
+        "CREATE INDEX IF NOT EXISTS idx_booked_doctor_patient ON booked (Doctor_Id, Patient_Id)",
+        "CREATE INDEX IF NOT EXISTS idx_prescription_patient ON prescription (Patient_Id, Appointment_Date)",
+        # LIKE is case-insensitive, so only a NOCASE index can serve the insurance prefix search
+        "CREATE INDEX IF NOT EXISTS idx_patient_insurance ON patient (Insurance COLLATE NOCASE)",
+    ]),
+    (2, "trigger-maintained report summary tables", summaries.SCHEMA + summaries.REBUILD),
+    (3, "stored vitals BMI and hourly/daily vitals rollups", vitals.SCHEMA + vitals.REBUILD),
+    (4, "full-text search indexes over patient, doctor and diagnosis", search.SCHEMA + search.REBUILD),
+    (5, "per-patient index for the Patient 360 procedures section", [
+        "CREATE INDEX IF NOT EXISTS idx_medical_procedure_patient ON medical_procedure (Patient_Id, Appointment_Date)",
+    ]),
+    (6, "bill aging index and day-based overdue_bills view", [
+        # Unpaid bills only, by date: aging and overdue reads scale with what is still owed
+        "CREATE INDEX IF NOT EXISTS idx_bill_aging ON bill (Appointment_Date, payer, amount) WHERE status = 'Unpaid'",
+        "DROP VIEW IF EXISTS overdue_bills",
+        schema.OVERDUE_BILLS_VIEW,
+    ]),
+    (7, "indexes for condition lookups by diagnosis, status and subtype attributes", [
+        "CREATE INDEX IF NOT EXISTS idx_conditions_diagnosis ON conditions (Diagnosis_Name, Onset_Date)",
+        "CREATE INDEX IF NOT EXISTS idx_condition_details_status ON condition_details (Clinical_Status, Severity)",
+        "CREATE INDEX IF NOT EXISTS idx_chronic_follow_up ON chronic_condition (Follow_Up_Interval_Months)",
+        "CREATE INDEX IF NOT EXISTS idx_infectious_isolation ON infectious_condition (Isolation_Required, Pathogen_Type)",
+    ]),
+    (8, "change journal of every base table for incremental backups and replicas", journal.SCHEMA),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def schema_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def has_schema(con):
+    res = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient'")
+    return res.fetchone() is not None
+
+
+def migrate(con, target=LATEST):
+    version = schema_version(con)
+    if not has_schema(con):
+        return version
+    for number, description, statements in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        con.execute("BEGIN")
+        try:
+            for sql in statements:
+                schema.execute(con, sql)
+            con.execute(f"PRAGMA user_version = {number}")
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        version = number
+    return version
+
+
+def reset_version(con):
+    con.execute("PRAGMA user_version = 0")
+
+
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW|\(subquery)(\S+)")
+
+
+def full_scans(con, query):
+    pager = Pager(query.sql, query.key, query.bind())
+    sql = "SELECT * FROM (" + pager.sql + ") ORDER BY " + pager.order_by()
+    scans = []
+    for row in con.execute("EXPLAIN QUERY PLAN " + sql, pager.params):
+        detail = row[3]
+        match = FULL_SCAN.match(detail)
+        # Summary tables hold one row per group, so walking them is the intended plan
+        if match and "INDEX" not in detail and match.group(1) not in summaries.TABLES:
+            scans.append(detail)
+    return scans
+
+
+def check_plans(con):
+    return {query.name: full_scans(con, query) for query in queries.QUERIES.values()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply schema migrations or check query plans.")
+    parser.add_argument("command", choices=["migrate", "status", "check"])
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    with db.connection() as con:
+        if args.command == "migrate":
+            print(f"schema version {migrate(con)} (latest {LATEST})")
+        elif args.command == "status":
+            print(f"schema version {schema_version(con)} (latest {LATEST})")
+        else:
+            failed = False
+            for name, scans in check_plans(con).items():
+                print(f"{name}: {'FULL SCAN ' + '; '.join(scans) if scans else 'ok'}")
+                failed = failed or bool(scans)
+            return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import cache
+import instrument
+
+COUNT_CAP = 10000
+
+
+class Pager:
+    # Keyset pagination over an arbitrary SELECT: each page seeks past the last key seen
+    # instead of using OFFSET. When an index matches the key, page N costs the same as
+    # page 1; a key with mixed directions can only be written as an OR of terms, which
+    # SQLite answers by scanning, so later pages get slower there.
+    # key is a list of (column, descending) pairs that must uniquely order the result,
+    # normally the primary key of the rows returned; a page that ends inside a run of equal
+    # keys would skip the rest of the run, so fetch raises instead.
+    def __init__(self, sql, key, params=(), page_size=50, records=None):
+        self.sql = sql.strip().rstrip(";")
+        self.key = key
+        self.params = tuple(params)
+        self.page_size = page_size
+        # Optional records.RecordFactory that types the rows of each page
+        self.records = records
+
+    def order_by(self):
+        return ", ".join(col + (" DESC" if desc else "") for col, desc in self.key)
+
+    def seek(self, after):
+        directions = {desc for _, desc in self.key}
+        if len(directions) == 1:
+            # A row value comparison is a single range on an index over the key columns
+            columns = ", ".join(col for col, _ in self.key)
+            marks = ", ".join("?" * len(self.key))
+            return f"({columns}) {'<' if directions.pop() else '>'} ({marks})", list(after)
+        terms = []
+        params = []
+        for i, (col, desc) in enumerate(self.key):
+            parts = [prev + " = ?" for prev, _ in self.key[:i]]
+            parts.append(col + (" < ?" if desc else " > ?"))
+            terms.append("(" + " AND ".join(parts) + ")")
+            params.extend(after[:i + 1])
+        return " OR ".join(terms), params
+
+    def page_query(self, after=None):
+        query = "SELECT * FROM (" + self.sql + ")"
+        params = list(self.params)
+        if after is not None:
+            where, seek_params = self.seek(after)
+            query += " WHERE " + where
+            params.extend(seek_params)
+        query += " ORDER BY " + self.order_by() + " LIMIT ?"
+        params.append(self.page_size + 1)
+        return query, params
+
+    def fetch(self, con, after=None, op=None):
+        op = op or instrument.Operation(None)
+        query, params = self.page_query(after)
+        with op.phase("execute"):
+            cur = con.execute(query, params)
+        with op.phase("fetch"):
+            rows = cur.fetchmany(self.page_size + 1)
+        names = [d[0] for d in cur.description]
+        cur.close()
+        has_next = len(rows) > self.page_size
+        columns = [name.lower() for name in names]
+        positions = [columns.index(col.lower()) for col, _ in self.key]
+        if has_next:
+            # The extra row sharing the page's last key means the next seek would skip it
+            shown, extra = (tuple(row[p] for p in positions) for row in rows[-2:])
+            if shown == extra:
+                raise RuntimeError(f"page key ({self.order_by()}) is not unique: {shown!r} repeats")
+        rows = rows[:self.page_size]
+        # The seek key is taken before conversion so it binds back as the stored values
+        last = tuple(rows[-1][p] for p in positions) if rows else None
+        if self.records is not None:
+            rows = self.records.rows(names, rows)
+        return rows, last, has_next
+
+    def count(self, con, cap=COUNT_CAP, op=None):
+        # Counting stops at cap so a huge result only costs a bounded scan
+        op = op or instrument.Operation(None)
+        with op.phase("count"):
+            res = con.execute("SELECT COUNT(*) FROM (SELECT 1 FROM (" + self.sql + ") LIMIT ?)",
+                              list(self.params) + [cap + 1])
+            n = res.fetchone()[0]
+        return min(n, cap), n <= cap
+
+
+def cached(tables, key, load):
+    # Only reads that declare their source tables are cached, since otherwise a write
+    # could never invalidate them
+    if not tables:
+        return load()
+    return cache.results.get_or_load(key, tables, load)
+
+
+def read_page(con, pager, after=None, count=True, tables=(), op=None):
+    # One page of a report: (total, rows, last, has_next) where total is (n, exact), or
+    # None when count is false. Page reads and counts are cached by statement and params.
+    op = op or instrument.Operation(None)
+    total = None
+    if count:
+        key = ("count", pager.sql, pager.params)
+        total = cached(tables, key, lambda: pager.count(con, op=op))
+    key = ("page", pager.sql, pager.params, after, pager.page_size)
+    rows, last, has_next = cached(tables, key, lambda: pager.fetch(con, after, op))
+    op.cached = not op.phases
+    op.rows = len(rows)
+    if not op.cached and op.is_slow():
+        op.sql, op.params = pager.page_query(after)
+        op.plan = instrument.explain(con, op.sql, op.params)
+    return total, rows, last, has_next
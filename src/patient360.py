@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cache
+import db
+from records import RecordFactory
+
+RECENT_PATIENTS = int(os.environ.get("PATIENT_360_RECENT", "50"))
+# Vitals can hold years of monitor readings, so the screen shows the latest ones and the
+# Vitals Trends screen covers the rest
+VITALS_SHOWN = 50
+COUNT_CAP = 10000
+
+
+class Section:
+    def __init__(self, name, title, headings, sql, tables, types=None):
+        self.name = name
+        self.title = title
+        self.headings = headings
+        self.sql = sql
+        self.tables = tables
+        self.records = RecordFactory(name, types)
+
+
+# Each section is one indexed query on Patient_Id; conditions add one batched lookup of
+# their subtype details
+SECTIONS = [
+    Section(
+        "appointments",
+        "Appointments & Bills",
+        ["Date", "Time", "Doctor", "Reason", "Amount", "Status", "Payer"],
+        """
+            SELECT b.Appointment_Date AS Date, b.Appointment_Time AS Time, 'Dr. ' || d.L_Name AS Doctor, b.Reason,
+                   bill.amount AS Amount, bill.status AS Status, bill.payer AS Payer
+            FROM booked b
+            LEFT JOIN doctor d ON d.Doctor_Id = b.Doctor_Id
+            LEFT JOIN bill ON bill.Appointment_Date = b.Appointment_Date AND bill.Doctor_Id = b.Doctor_Id
+                          AND bill.Patient_Id = b.Patient_Id
+            WHERE b.Patient_Id = ?
+            ORDER BY b.Appointment_Date DESC, b.Appointment_Time DESC
+        """,
+        ("booked", "bill", "doctor"),
+        {"Date": "date", "Amount": "money"},
+    ),
+    Section(
+        "procedures",
+        "Procedures",
+        ["Date", "Type", "Location", "Summary", "Doctor", "File"],
+        """
+            SELECT m.Appointment_Date AS Date, m.procedure_type AS Type, m.location AS Location,
+                   m.procedure_summary AS Summary, 'Dr. ' || d.L_Name AS Doctor, m.filepath AS File
+            FROM medical_procedure m
+            LEFT JOIN doctor d ON d.Doctor_Id = m.Doctor_Id
+            WHERE m.Patient_Id = ?
+            ORDER BY m.Appointment_Date DESC
+        """,
+        ("medical_procedure", "doctor"),
+        {"Date": "date"},
+    ),
+    Section(
+        "prescriptions",
+        "Prescriptions",
+        ["Date", "Drug", "DIN", "Count", "Dosage (mg)", "Refills", "Frequency", "Doctor"],
+        """
+            SELECT p.Appointment_Date AS Date, drug.drug_name AS Drug, p.DIN, p.med_count AS Count,
+                   drug.dosage AS Dosage, p.refills AS Refills, p.frequency AS Frequency, 'Dr. ' || d.L_Name AS Doctor
+            FROM prescription p
+            JOIN drug ON drug.DIN = p.DIN
+            LEFT JOIN doctor d ON d.Doctor_Id = p.Doctor_Id
+            WHERE p.Patient_Id = ?
+            ORDER BY p.Appointment_Date DESC
+        """,
+        ("prescription", "drug", "doctor"),
+        {"Date": "date"},
+    ),
+    Section(
+        "conditions",
+        "Conditions",
+        ["Onset", "Diagnosis", "Code", "Status", "Severity", "Abated", "Details"],
+        """
+            SELECT c.Onset_Date AS Onset, c.Diagnosis_Name AS Diagnosis,
+                   IFNULL(cd.Code_System, dg.Code_System) || ' ' || IFNULL(cd.Code, dg.Code) AS Code,
+                   cd.Clinical_Status AS Status, cd.Severity, cd.Abatement_Date AS Abated, c.Condition_Id AS Details
+            FROM conditions c
+            LEFT JOIN condition_details cd ON cd.Condition_Id = c.Condition_Id
+            LEFT JOIN diagnosis dg ON dg.Diagnosis_Name = c.Diagnosis_Name
+            WHERE c.Patient_Id = ?
+            ORDER BY c.Onset_Date DESC
+        """,
+        ("conditions", "condition_details", "diagnosis", "chronic_condition", "infectious_condition",
+         "injury_condition", "mental_health_condition"),
+        {"Onset": "date", "Abated": "date"},
+    ),
+    Section(
+        "vitals",
+        f"Vitals (latest {VITALS_SHOWN})",
+        ["Time", "Height (cm)", "Weight (kg)", "BMI", "BP", "Heart rate", "Resp. rate", "Temp (C)", "SpO2"],
+        f"""
+            SELECT Measure_Ts AS Time, Height_Cm, Weight_Kg, BMI, Bp_Systolic || '/' || Bp_Diastolic AS BP,
+                   Heart_Rate, Resp_Rate, Temp_C, SpO2
+            FROM vitals
+            WHERE Patient_Id = ?
+            ORDER BY Measure_Ts DESC
+            LIMIT {VITALS_SHOWN}
+        """,
+        ("vitals",),
+    ),
+]
+SECTIONS_BY_NAME = {section.name: section for section in SECTIONS}
+
+# The four subtype tables answered in one statement for a whole list of Condition_Ids,
+# passed as a JSON array so the statement text never changes
+SUBTYPES = """
+    SELECT Condition_Id, 'Chronic', json_object('lifestyle modifiable', Is_Lifestyle_Modifiable,
+           'long-term medication', Long_Term_Med_Required, 'follow-up months', Follow_Up_Interval_Months)
+    FROM chronic_condition WHERE Condition_Id IN (SELECT value FROM json_each(?1))
+    UNION ALL
+    SELECT Condition_Id, 'Infectious', json_object('pathogen', Pathogen_Type, 'isolation', Isolation_Required)
+    FROM infectious_condition WHERE Condition_Id IN (SELECT value FROM json_each(?1))
+    UNION ALL
+    SELECT Condition_Id, 'Injury', json_object('type', Injury_Type, 'site', Body_Site, 'laterality', Laterality,
+           'cause', Cause, 'injured', Date_Of_Injury)
+    FROM injury_condition WHERE Condition_Id IN (SELECT value FROM json_each(?1))
+    UNION ALL
+    SELECT Condition_Id, 'Mental health', json_object('category', Disorder_Category, 'episode', Episode,
+           'treatment', Treatment_Type, 'risk factor', Risk_Factor)
+    FROM mental_health_condition WHERE Condition_Id IN (SELECT value FROM json_each(?1))
+"""
+
+# Patient row plus the size of every section, from index ranges, in one round trip
+HEADER = f"""
+    SELECT p.Patient_Id, p.F_Name, p.M_Initial, p.L_Name, p.Sex, p.Dob, p.Address, p.Email, p.Phone_Num, p.Insurance,
+           (SELECT COUNT(*) FROM booked WHERE Patient_Id = p.Patient_Id),
+           (SELECT COUNT(*) FROM medical_procedure WHERE Patient_Id = p.Patient_Id),
+           (SELECT COUNT(*) FROM prescription WHERE Patient_Id = p.Patient_Id),
+           (SELECT COUNT(*) FROM conditions WHERE Patient_Id = p.Patient_Id),
+           (SELECT COUNT(*) FROM (SELECT 1 FROM vitals WHERE Patient_Id = p.Patient_Id LIMIT {COUNT_CAP + 1})),
+           (SELECT SUM(amount) FROM bill WHERE Patient_Id = p.Patient_Id AND status = 'Unpaid')
+    FROM patient p
+    WHERE p.Patient_Id = ?
+"""
+HEADER_FIELDS = ["patient_id", "first_name", "initial", "last_name", "sex", "dob", "address", "email", "phone",
+                 "insurance"]
+HEADER_TABLES = tuple({table for section in SECTIONS for table in section.tables} | {"patient"})
+
+# Recently opened patients, one entry per loaded section. A write to any table a section
+# reads evicts it, the same as the report cache.
+recent = cache.ResultCache(max_entries=RECENT_PATIENTS * (len(SECTIONS) + 1))
+
+
+def changed(tables):
+    if tables is None:
+        recent.clear()
+    else:
+        recent.invalidate(*tables)
+
+
+cache.listeners.append(changed)
+
+
+def read_header(con, patient_id):
+    row = con.execute(HEADER, (patient_id,)).fetchone()
+    if row is None:
+        return None
+    header = dict(zip(HEADER_FIELDS, row))
+    header["counts"] = dict(zip([section.name for section in SECTIONS], row[len(HEADER_FIELDS):-1]))
+    header["unpaid"] = row[-1]
+    return header
+
+
+def subtype_details(con, condition_ids):
+    details = {}
+    for condition_id, kind, values in con.execute(SUBTYPES, (json.dumps(condition_ids),)):
+        values = ", ".join(f"{name} {value}" for name, value in json.loads(values).items() if value is not None)
+        details[condition_id] = f"{kind}: {values}" if values else kind
+    return details
+
+
+def read_section(con, patient_id, name):
+    section = SECTIONS_BY_NAME[name]
+    cur = con.execute(section.sql, (patient_id,))
+    rows = cur.fetchall()
+    columns = [d[0] for d in cur.description]
+    if name == "conditions" and rows:
+        details = subtype_details(con, [row[-1] for row in rows])
+        rows = [row[:-1] + (details.get(row[-1], ""),) for row in rows]
+    return section.records.rows(columns, rows)
+
+
+def header(con, patient_id):
+    return recent.get_or_load(("header", patient_id), HEADER_TABLES, lambda: read_header(con, patient_id))
+
+
+def section(con, patient_id, name):
+    tables = SECTIONS_BY_NAME[name].tables
+    return recent.get_or_load((name, patient_id), tables, lambda: read_section(con, patient_id, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load one patient's full record and time each section.")
+    parser.add_argument("patient_id", type=int)
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    with db.connection() as con:
+        start = time.perf_counter()
+        found = header(con, args.patient_id)
+        print(f"header: {(time.perf_counter() - start) * 1000:.1f}ms")
+        if found is None:
+            print(f"no patient {args.patient_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(found, default=str))
+        for name in SECTIONS_BY_NAME:
+            section_start = time.perf_counter()
+            rows = section(con, args.patient_id, name)
+            print(f"{name}: {len(rows)} rows in {(time.perf_counter() - section_start) * 1000:.1f}ms")
+        print(f"total: {(time.perf_counter() - start) * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import datetime
+
+from records import RecordFactory
+
+
+def date(value):
+    return datetime.date.fromisoformat(str(value).strip()).isoformat()
+
+
+def today():
+    return datetime.date.today().isoformat()
+
+
+class Param:
+    def __init__(self, name, label, convert=str, default=None):
+        self.name = name
+        self.label = label
+        self.convert = convert
+        self.default = default
+
+    def parse(self, value):
+        if value is None or str(value).strip() == "":
+            value = self.default() if callable(self.default) else self.default
+        try:
+            return self.convert(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{self.label} is not valid") from None
+
+
+class Query:
+    # sql uses positional ? placeholders bound in the order of params, so the statement
+    # text never changes between calls and stays in each connection's statement cache.
+    def __init__(self, name, title, headings, sql, key, params=(), timeout=None, tables=(), types=None):
+        self.name = name
+        self.title = title
+        self.headings = headings
+        self.sql = sql
+        self.key = key
+        self.params = params
+        self.timeout = timeout
+        # Tables the result depends on; a write to any of them evicts cached pages
+        self.tables = tables
+        # Column name -> records.CONVERTERS kind for DATE and money columns
+        self.records = RecordFactory(name, types)
+
+    def parse(self, values=None):
+        values = values or {}
+        return {param.name: param.parse(values.get(param.name)) for param in self.params}
+
+    def bind(self, values=None):
+        parsed = self.parse(values)
+        return tuple(parsed[param.name] for param in self.params)
+
+    def format_title(self, values=None):
+        return self.title.format(**self.parse(values))
+
+
+TABLE_QUERIES = [
+    Query(
+        "avg_unpaid",
+        "Average Unpaid Bill",
+        ['Patient ID', 'Average Unpaid Amount'],
+        "SELECT Patient_Id AS patient, Unpaid_Sum / Unpaid_Count AS average FROM unpaid_totals",
+        [("patient", False)],
+        tables=("bill",),
+        types={"average": "money"},
+    ),
+    Query(
+        "insurance",
+        "Insurance",
+        ['Patient ID', 'First Name', 'Last Name', 'Insurance'],
+        """
+            SELECT patient_id, f_name, l_name, insurance
+            FROM patient
+            WHERE insurance IS NULL
+            UNION
+                SELECT patient_id, f_name, l_name, insurance
+                    FROM patient
+                    WHERE insurance LIKE 'SF%'
+        """,
+        [("patient_id", False)],
+        tables=("patient",),
+    ),
+    Query(
+        "no_prescriptions",
+        "No Prescriptions",
+        ['Patient ID', 'First Name', 'Last Name'],
+        """
+            SELECT patient_id AS id, f_name AS first_name, l_name AS last_name
+            FROM patient
+            WHERE patient_id IN (
+                SELECT patient_id FROM booked
+            )
+            AND patient_id NOT IN (
+                SELECT patient_id FROM prescription
+            )
+        """,
+        [("id", False)],
+        tables=("patient", "booked", "prescription"),
+    ),
+    Query(
+        "num_appt",
+        "Number of Appointments",
+        ['Doctor ID', 'Patient ID', 'Count'],
+        "SELECT Doctor_Id AS doctor, Patient_Id AS patient, Appointments AS count FROM appt_counts",
+        [("doctor", False), ("patient", False)],
+        tables=("booked",),
+    ),
+    Query(
+        "num_doctors",
+        "Number of Doctors (by Patient)",
+        ['Patient ID', 'Doctor Count'],
+        "SELECT Patient_Id AS patients, Doctors AS doctors FROM patient_doctor_counts",
+        [("patients", False)],
+        tables=("booked",),
+    ),
+    Query(
+        "num_patients",
+        "Number of Patients (by Doctor)",
+        ['Doctor ID', 'Patient Count'],
+        "SELECT Doctor_Id AS doctor, Patients AS patients FROM doctor_patient_counts",
+        [("patients", True), ("doctor", False)],
+        timeout=60,
+        tables=("booked",),
+    ),
+    Query(
+        "multi_docs",
+        "Patients Seeing Doctors #{doctor_a} and #{doctor_b}",
+        ['Patient ID', 'First Name', 'Last Name'],
+        # Both doctors' panels come from idx_booked_doctor_patient; cocare.py answers the
+        # general any/all/exactly form over more doctors, specialties and date ranges
+        """
+            SELECT p.patient_id AS id, f_name AS first_name, l_name AS last_name
+            FROM patient p
+            WHERE p.patient_id IN (
+                SELECT Patient_Id FROM booked WHERE Doctor_Id = ?
+                INTERSECT
+                SELECT Patient_Id FROM booked WHERE Doctor_Id = ?
+            )
+        """,
+        [("id", False)],
+        [Param("doctor_a", "Doctor ID", int, 100002), Param("doctor_b", "Doctor ID", int, 100004)],
+        tables=("patient", "booked"),
+    ),
+]
+
+VIEW_QUERIES = [
+    Query(
+        "prescriptions",
+        "Prescription History (Patient #{patient_id})",
+        ['Date', 'Drug', 'DIN', 'Count', 'Dosage (mg)', 'Refills', 'Frequency', 'Prescribed by ...', 'Doctor ID'],
+        """
+            SELECT prescription.Appointment_Date AS Pres_Date, drug.Drug_Name AS Drug, prescription.DIN AS DIN,
+                   Med_Count AS Drug_Count, Dosage AS Dosage_Mg, Refills, Frequency, doctor.L_Name AS Doctor,
+                   prescription.Doctor_Id AS Doctor_Id
+            FROM prescription
+            JOIN doctor ON doctor.Doctor_Id = prescription.Doctor_Id
+            JOIN drug ON drug.DIN = prescription.DIN
+            WHERE prescription.Patient_Id = ?
+        """,
+        [("Pres_Date", False), ("DIN", False), ("Doctor_Id", False)],
+        [Param("patient_id", "Patient ID", int, 100000002)],
+        tables=("prescription", "doctor", "drug"),
+        types={"Pres_Date": "date"},
+    ),
+    Query(
+        "schedule",
+        "Doctor #{doctor_id}'s Schedule ({date})",
+        ['Patient', 'Time', 'Reason'],
+        """
+            SELECT Patient_Id AS Patient, Appointment_Time AS Time, Reason
+            FROM booked
+            WHERE Doctor_Id = ? AND Appointment_Date = ?
+        """,
+        [("Time", False), ("Patient", False)],
+        [Param("doctor_id", "Doctor ID", int, 100001), Param("date", "Date", date, "2025-10-25")],
+        tables=("booked",),
+    ),
+    Query(
+        "unpaid",
+        "Overdue Bills (as of {as_of})",
+        ['Patient', 'Appointment Date', 'Doctor', 'Amount', 'Days Outstanding'],
+        # More than 3 days outstanding, written as a date range so it is answered from the
+        # unpaid-bill indexes; subtracting the text dates themselves only subtracted years
+        """
+            SELECT Patient_Id AS Patient, Appointment_Date AS Appt_Date, Doctor_Id AS Doctor, Amount,
+                   CAST(julianday(?1) - julianday(Appointment_Date) AS INTEGER) AS Days
+            FROM bill
+            WHERE Status = 'Unpaid' AND Appointment_Date < date(?1, '-3 days')
+        """,
+        [("Patient", False), ("Appt_Date", False), ("Doctor", False)],
+        [Param("as_of", "As of", date, today)],
+        tables=("bill",),
+        types={"Appt_Date": "date", "Amount": "money"},
+    ),
+    Query(
+        "aging",
+        "Bill Aging by Payer (as of {as_of})",
+        ['Payer', '0-30 days', '31-60 days', '61-90 days', '90+ days', 'Bills', 'Total'],
+        # Reads only idx_bill_aging, which holds the unpaid bills and nothing else
+        """
+            SELECT payer AS Payer,
+                   TOTAL(CASE WHEN Days <= 30 THEN amount END) AS Current,
+                   TOTAL(CASE WHEN Days BETWEEN 31 AND 60 THEN amount END) AS Days_31_60,
+                   TOTAL(CASE WHEN Days BETWEEN 61 AND 90 THEN amount END) AS Days_61_90,
+                   TOTAL(CASE WHEN Days > 90 THEN amount END) AS Over_90,
+                   COUNT(*) AS Bills, TOTAL(amount) AS Total
+            FROM (
+                SELECT payer, amount, CAST(julianday(?1) - julianday(Appointment_Date) AS INTEGER) AS Days
+                FROM bill
+                WHERE status = 'Unpaid' AND Appointment_Date <= ?1
+            )
+            GROUP BY payer
+        """,
+        [("Payer", False)],
+        [Param("as_of", "As of", date, today)],
+        tables=("bill",),
+        types={"Current": "money", "Days_31_60": "money", "Days_61_90": "money", "Over_90": "money",
+               "Total": "money"},
+    ),
+]
+
+QUERIES = {query.name: query for query in TABLE_QUERIES + VIEW_QUERIES}
@@ -0,0 +1,150 @@
+import datetime
+import json
+import keyword
+import math
+import re
+from array import array
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+CENTS = Decimal("0.01")
+FETCH_SIZE = 1000
+NAN = float("nan")
+
+
+def to_date(value):
+    # DATE columns hold ISO text; a timestamp keeps only its date part
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def to_money(value):
+    # NUMBER(10,2) has NUMERIC affinity, so 175.00 comes back as the integer 175 and 80.5
+    # as a float; both become exact two-place Decimals
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(CENTS, ROUND_HALF_UP)
+
+
+def to_cents(value):
+    return None if value is None else int(to_money(value) * 100)
+
+
+def to_json(value):
+    return None if value is None else json.loads(value)
+
+
+CONVERTERS = {"date": to_date, "money": to_money, "json": to_json}
+
+
+def field_name(column):
+    name = re.sub(r"\W", "_", column).lower()
+    return name + "_" if keyword.iskeyword(name) or not name or name[0].isdigit() else name
+
+
+class RecordFactory:
+    # Turns result tuples into typed records: a tuple subclass with __slots__ = () and a named
+    # field per column, so a row costs no more memory than the tuple it replaces and still
+    # works wherever rows are indexed, cached or serialised. types maps column names
+    # (case-insensitive) to a CONVERTERS kind.
+    def __init__(self, name, types=None):
+        self.name = name
+        self.types = {column.lower(): kind for column, kind in (types or {}).items()}
+        self._record = None
+        self._convert = []
+        self._columns = None
+
+    def record_type(self, columns):
+        if columns != self._columns:
+            fields = [field_name(column) for column in columns]
+            self._record = namedtuple(field_name(self.name).title().replace("_", "") + "Row", fields, rename=True)
+            self._convert = [(i, CONVERTERS[self.types[column.lower()]])
+                             for i, column in enumerate(columns) if column.lower() in self.types]
+            self._columns = columns
+        return self._record
+
+    def rows(self, columns, rows):
+        record = self.record_type(columns)
+        if not self._convert:
+            return [record._make(row) for row in rows]
+        made = []
+        for row in rows:
+            row = list(row)
+            for i, convert in self._convert:
+                row[i] = convert(row[i])
+            made.append(record._make(row))
+        return made
+
+
+def column_buffer(values):
+    # Most compact buffer that holds every value: 64-bit integers, then doubles with NaN
+    # for NULL, then a plain list
+    try:
+        if all(type(value) is int for value in values):
+            return array("q", values)
+        if all(value is None or type(value) in (int, float) for value in values):
+            return array("d", [NAN if value is None else value for value in values])
+    except OverflowError:
+        pass
+    return list(values)
+
+
+def extend_column(buffer, values):
+    if isinstance(buffer, list):
+        buffer.extend(values)
+        return buffer
+    # Built separately first so a value that does not fit leaves the buffer untouched;
+    # NULLs are only looked for once a chunk fails, and a column that cannot hold the
+    # chunk at all is widened once
+    try:
+        chunk = array(buffer.typecode, values)
+    except (TypeError, OverflowError):
+        try:
+            if buffer.typecode != "d":
+                raise TypeError
+            chunk = array("d", [NAN if value is None else value for value in values])
+        except TypeError:
+            return column_buffer(list(buffer) + list(values))
+    buffer.extend(chunk)
+    return buffer
+
+
+def fetch_columns(con, sql, params=(), types=None):
+    # Column-store read: {column: buffer} where numeric columns are array('q') or array('d')
+    # buffers of 8 bytes per value, rather than a float or int object per cell. Money
+    # columns are stored as integer cents and date columns as datetime.date lists.
+    types = {column.lower(): kind for column, kind in (types or {}).items()}
+    cur = con.execute(sql, params)
+    names = [d[0] for d in cur.description]
+    convert = [{"money": to_cents, "date": to_date}.get(types.get(name.lower())) for name in names]
+    buffers = [None] * len(names)
+    while True:
+        chunk = cur.fetchmany(FETCH_SIZE)
+        if not chunk:
+            break
+        for i, values in enumerate(zip(*chunk)):
+            if convert[i] is not None:
+                values = [convert[i](value) for value in values]
+            buffers[i] = column_buffer(values) if buffers[i] is None else extend_column(buffers[i], values)
+    cur.close()
+    return {name: array("q") if buffer is None else buffer for name, buffer in zip(names, buffers)}
+
+
+def measured(buffer):
+    # The non-NULL values of a numeric column; a column without NULLs is returned as is
+    if isinstance(buffer, array) and buffer.typecode == "d" and math.isnan(math.fsum(buffer)):
+        return array("d", [value for value in buffer if value == value])
+    return buffer
+
+
+def to_numpy(columns):
+    # Zero-copy numpy views of the numeric buffers; other columns become object arrays.
+    # numpy is imported here rather than with the module, which every screen loads.
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("numpy is not installed") from None
+    return {name: numpy.frombuffer(buffer, dtype="int64" if buffer.typecode == "q" else "float64")
+            if isinstance(buffer, array) else numpy.array(buffer, dtype=object)
+            for name, buffer in columns.items()}
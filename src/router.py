@@ -0,0 +1,57 @@
+import time
+
+
+class Screen:
+    # content is the screen's root control. width and height, when set, size the window
+    # each time the screen is shown; enter runs on every visit after the first, leave
+    # whenever another screen takes over (to cancel queries still running)
+    def __init__(self, content, width=None, height=None, enter=None, leave=None):
+        self.content = content
+        self.width = width
+        self.height = height
+        self.enter = enter
+        self.leave = leave
+
+
+class Router:
+    # One per session. Each screen is built the first time it is opened and then stays in
+    # page.controls, hidden while another one shows, so navigating sends the client two
+    # visibility changes instead of a new control tree, and a screen keeps what was typed
+    # into it. builders maps a name to build(page, router), which returns a Screen.
+    def __init__(self, page, builders):
+        self.page = page
+        self.builders = builders
+        self.screens = {}
+        self.current = None
+        self.last = None
+
+    def go(self, name):
+        start = time.perf_counter()
+        screen = self.screens.get(name)
+        built = screen is None
+        if built:
+            screen = self.screens[name] = self.builders[name](self.page, self)
+            self.page.controls.append(screen.content)
+        elif screen.enter is not None:
+            screen.enter()
+        previous = self.screens.get(self.current)
+        if previous is not None and previous is not screen:
+            previous.content.visible = False
+            if previous.leave is not None:
+                previous.leave()
+        screen.content.visible = True
+        self.current = name
+        resized = False
+        for size, value in (("width", screen.width), ("height", screen.height)):
+            if value is not None and getattr(self.page.window, size) != value:
+                setattr(self.page.window, size, value)
+                resized = True
+        # Diffing the whole page walks every screen built so far; a visit that adds no
+        # screen and keeps the window size only needs the two that changed
+        if built or resized or previous is None:
+            self.page.update()
+        elif previous is screen:
+            self.page.update(screen.content)
+        else:
+            self.page.update(previous.content, screen.content)
+        self.last = (name, built, time.perf_counter() - start)
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+DEFAULT_TIMEOUT = 30.0
+
+# One executor is shared by every session; its size matches the connection pool so a
+# worker never waits on a checkout.
+executor = ThreadPoolExecutor(max_workers=db.POOL_SIZE, thread_name_prefix="query")
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, work, timeout):
+        self.work = work
+        self.timeout = timeout
+        self.con = None
+        self.future = None
+        self.reason = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def run(self):
+        if self.reason:
+            raise QueryCancelled(self.reason)
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self.cancel, ["Query timed out"])
+            self._timer.daemon = True
+            self._timer.start()
+        try:
+            with db.connection() as con:
+                with self._lock:
+                    self.con = con
+                try:
+                    if self.reason:
+                        raise QueryCancelled(self.reason)
+                    return self.work(con)
+                except sqlite3.OperationalError as err:
+                    if self.reason and "interrupt" in str(err):
+                        raise QueryCancelled(self.reason) from err
+                    raise
+                finally:
+                    with self._lock:
+                        self.con = None
+        finally:
+            if self._timer:
+                self._timer.cancel()
+
+    def cancel(self, reason="Query cancelled"):
+        with self._lock:
+            if self.reason:
+                return
+            self.reason = reason
+            if self.con is not None:
+                self.con.interrupt()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class QueryRunner:
+    # Per-session front end to the shared executor. Callbacks run on the worker thread,
+    # which Flet allows for control updates.
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.jobs = set()
+        self._lock = threading.Lock()
+
+    def submit(self, work, on_done, on_error=None, timeout=None):
+        job = Job(work, self.timeout if timeout is None else timeout)
+        with self._lock:
+            self.jobs.add(job)
+        job.future = executor.submit(job.run)
+        job.future.add_done_callback(lambda f: self._finish(job, f, on_done, on_error))
+        return job
+
+    def _finish(self, job, future, on_done, on_error):
+        with self._lock:
+            self.jobs.discard(job)
+        if future.cancelled():
+            return
+        err = future.exception()
+        if err is None:
+            on_done(future.result())
+        elif isinstance(err, QueryCancelled) and job.reason == "Query cancelled":
+            return
+        elif on_error is not None:
+            on_error(err)
+
+    def cancel(self):
+        with self._lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
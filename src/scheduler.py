@@ -0,0 +1,296 @@
+import argparse
+import datetime
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import cache
+import db
+
+OPEN = 8 * 60
+CLOSE = 17 * 60
+SLOT_MINUTES = 30
+WORKDAYS = {0, 1, 2, 3, 4}
+HORIZON_DAYS = 60
+# Busy time is kept as a bitmask per doctor per day with one bit per UNIT minutes
+UNIT = 5
+# HH:MM on a 24-hour clock, the form the Appointment_Time CHECK expects
+CLOCK = re.compile(r"([01][0-9]|2[0-3]):([0-5][0-9])")
+
+
+class SlotTaken(Exception):
+    pass
+
+
+def minutes(hhmm):
+    match = CLOCK.fullmatch(str(hhmm))
+    if match is None:
+        raise ValueError(f"time {hhmm!r} is not HH:MM")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def clock(value):
+    minutes(value)
+    return str(value)
+
+
+def day(value):
+    # Stored as YYYY-MM-DD so booking dates sort, index and age as dates
+    try:
+        return datetime.date.fromisoformat(str(value).strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"date {value!r} is not YYYY-MM-DD") from None
+
+
+def hhmm(total):
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+
+def interval(start, length=SLOT_MINUTES):
+    # An appointment at start occupies [start, start + length); bookings made off the grid
+    # cover every unit they touch
+    first = start // UNIT
+    last = -(-(start + length) // UNIT)
+    return ((1 << (last - first)) - 1) << first
+
+
+def busy_mask(times):
+    mask = 0
+    for value in times:
+        try:
+            mask |= interval(minutes(value))
+        except ValueError:
+            continue
+    return mask
+
+
+class Schedule:
+    # In-memory index of booked time per (doctor, day) from today on. Writes made through
+    # book/cancel update it in place; writes from anywhere else reach it through
+    # cache.invalidate and it is reloaded on next use.
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._busy = {}
+        self._loaded_from = None
+        self.load_seconds = None
+
+    def changed(self, tables):
+        if tables is None or "booked" in tables:
+            with self._lock:
+                self._loaded_from = None
+
+    def ensure(self, con, day):
+        with self._lock:
+            if self._loaded_from is not None and self._loaded_from <= day:
+                return
+            start = time.perf_counter()
+            # Grouped in SQL so Python handles one row per doctor and day, walking
+            # idx_booked_schedule in order
+            self._busy = {(doctor, date): busy_mask(times.split(",")) for doctor, date, times in con.execute(
+                "SELECT Doctor_Id, Appointment_Date, group_concat(Appointment_Time) FROM booked "
+                "WHERE Appointment_Date >= ? GROUP BY Doctor_Id, Appointment_Date", (day.isoformat(),))}
+            self._loaded_from = day
+            self.load_seconds = time.perf_counter() - start
+
+    def refresh_day(self, con, doctor, date):
+        times = [row[0] for row in con.execute(
+            "SELECT Appointment_Time FROM booked WHERE Doctor_Id = ? AND Appointment_Date = ?", (doctor, date))]
+        with self._lock:
+            self._busy[(doctor, date)] = busy_mask(times)
+
+    def patient_days(self, con, patient_id, day):
+        # The patient's own bookings: busy time per day and the doctors already seen that
+        # day (ck_multiday allows one appointment per patient, doctor and day)
+        busy = {}
+        doctors = {}
+        for date, at, doctor in con.execute(
+                "SELECT Appointment_Date, Appointment_Time, Doctor_Id FROM booked "
+                "WHERE Patient_Id = ? AND Appointment_Date >= ?", (patient_id, day.isoformat())):
+            busy[date] = busy.get(date, 0) | busy_mask([at])
+            doctors.setdefault(date, set()).add(doctor)
+        return busy, doctors
+
+    def free_slots(self, con, doctor_ids, n=10, after=None, patient_id=None, horizon=HORIZON_DAYS):
+        # Next n (date, time, doctor) slots, earliest first, where the doctor and, if given,
+        # the patient are both free
+        after = after or datetime.datetime.now()
+        self.ensure(con, after.date())
+        patient_busy, patient_doctors = ({}, {})
+        if patient_id is not None:
+            patient_busy, patient_doctors = self.patient_days(con, patient_id, after.date())
+        found = []
+        for offset in range(horizon):
+            day = after.date() + datetime.timedelta(days=offset)
+            if day.weekday() not in WORKDAYS:
+                continue
+            date = day.isoformat()
+            unavailable = patient_busy.get(date, 0)
+            seen = patient_doctors.get(date, ())
+            earliest = after.hour * 60 + after.minute + 1 if offset == 0 else OPEN
+            with self._lock:
+                for start in range(OPEN, CLOSE - SLOT_MINUTES + 1, SLOT_MINUTES):
+                    if start < earliest:
+                        continue
+                    mask = interval(start)
+                    if unavailable & mask:
+                        continue
+                    for doctor in doctor_ids:
+                        if doctor not in seen and not self._busy.get((doctor, date), 0) & mask:
+                            found.append((date, hhmm(start), doctor))
+                            if len(found) == n:
+                                return found
+        return found
+
+    def booked(self, doctor_id, date, at):
+        # Marks a committed booking in the index in place
+        key = (doctor_id, date)
+        with self._lock:
+            if self._loaded_from is not None and date >= self._loaded_from.isoformat():
+                self._busy[key] = self._busy.get(key, 0) | interval(minutes(at))
+
+    def book(self, patient_id, doctor_id, date, at, reason=None):
+        # The lock serialises sessions in this process and BEGIN IMMEDIATE serialises writers
+        # in other processes; the slot is re-checked against the table inside both, so two
+        # sessions offered the same slot cannot both get it.
+        date = day(date)
+        with self._lock, db.connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                insert_booking(con, patient_id, doctor_id, date, at, reason)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            self.booked(doctor_id, date, at)
+        # The index is already current, so it is not reloaded
+        notify("booked", patient_id, doctor_id, date, current=[self.changed])
+
+    def cancel(self, patient_id, date, at):
+        with self._lock, db.connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                doctor_id = delete_booking(con, patient_id, date, at)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            if doctor_id is None:
+                return False
+            # Overlapping legacy bookings may share units, so the day is rebuilt rather than cleared
+            self.refresh_day(con, doctor_id, date)
+        notify("cancelled", patient_id, doctor_id, date, current=[self.changed])
+        return True
+
+
+# Other in-memory indexes over booked (the co-care panels) that apply bookings and
+# cancellations made here in place. Each has booked(patient, doctor, date),
+# cancelled(patient, doctor, date) and the cache listener changed(tables) that still hears
+# about every other write to booked.
+indexes = []
+
+
+def notify(kind, patient_id, doctor_id, date, current=()):
+    # After a booking or cancellation commits; current are listeners already up to date
+    for index in indexes:
+        getattr(index, kind)(patient_id, doctor_id, date)
+    cache.invalidate("booked", skip=list(current) + [index.changed for index in indexes])
+
+
+def insert_booking(con, patient_id, doctor_id, date, at, reason=None):
+    # Checks the slot and inserts the booking inside the caller's write transaction
+    date = day(date)
+    mask = interval(minutes(at))
+    for doctor, patient, other in con.execute(
+            "SELECT Doctor_Id, Patient_Id, Appointment_Time FROM booked "
+            "WHERE Appointment_Date = ? AND (Doctor_Id = ? OR Patient_Id = ?)",
+            (date, doctor_id, patient_id)):
+        if doctor == doctor_id and patient == patient_id:
+            raise SlotTaken(f"patient {patient_id} already sees doctor {doctor_id} on {date}")
+        if busy_mask([other]) & mask:
+            who = f"doctor {doctor_id}" if doctor == doctor_id else f"patient {patient_id}"
+            raise SlotTaken(f"{who} is already booked at {other} on {date}")
+    try:
+        con.execute("INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason) "
+                    "VALUES (?, ?, ?, ?, ?)", (date, patient_id, doctor_id, at, reason))
+    except sqlite3.IntegrityError as err:
+        # Only a duplicate key is a race for the slot; CHECK and foreign key failures are not
+        if err.sqlite_errorcode not in (sqlite3.SQLITE_CONSTRAINT_PRIMARYKEY, sqlite3.SQLITE_CONSTRAINT_UNIQUE):
+            raise
+        raise SlotTaken(str(err)) from None
+
+
+def delete_booking(con, patient_id, date, at):
+    # Returns the doctor the booking was with, or None if there was none
+    row = con.execute("SELECT Doctor_Id FROM booked WHERE Patient_Id = ? AND Appointment_Date = ? "
+                      "AND Appointment_Time = ?", (patient_id, date, at)).fetchone()
+    if row is None:
+        return None
+    con.execute("DELETE FROM booked WHERE Patient_Id = ? AND Appointment_Date = ? AND Appointment_Time = ?",
+                (patient_id, date, at))
+    return row[0]
+
+
+schedule = Schedule()
+cache.listeners.append(schedule.changed)
+
+
+def doctors(con, doctor_id=None, specialty=None, language=None):
+    sql = "SELECT Doctor_Id FROM doctor WHERE Status IS NOT 'Inactive'"
+    params = []
+    if doctor_id is not None:
+        sql += " AND Doctor_Id = ?"
+        params.append(doctor_id)
+    if specialty:
+        sql += " AND Specialty = ? COLLATE NOCASE"
+        params.append(specialty)
+    if language:
+        sql += " AND Lang LIKE ?"
+        params.append(f"%{language}%")
+    return [row[0] for row in con.execute(sql + " ORDER BY Doctor_Id", params)]
+
+
+def find(n=10, doctor_id=None, specialty=None, language=None, patient_id=None, after=None):
+    with db.connection() as con:
+        return schedule.free_slots(con, doctors(con, doctor_id, specialty, language), n, after, patient_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find free appointment slots or book one.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find_cmd = sub.add_parser("find")
+    find_cmd.add_argument("-n", type=int, default=10)
+    find_cmd.add_argument("--doctor", type=int)
+    find_cmd.add_argument("--specialty")
+    find_cmd.add_argument("--language")
+    find_cmd.add_argument("--patient", type=int, help="only slots this patient is also free for")
+    find_cmd.add_argument("--after", type=datetime.datetime.fromisoformat)
+    book_cmd = sub.add_parser("book")
+    book_cmd.add_argument("patient", type=int)
+    book_cmd.add_argument("doctor", type=int)
+    book_cmd.add_argument("date", type=day)
+    book_cmd.add_argument("time", type=clock)
+    book_cmd.add_argument("--reason")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    if args.command == "book":
+        try:
+            schedule.book(args.patient, args.doctor, args.date, args.time, args.reason)
+        except SlotTaken as err:
+            print(err, file=sys.stderr)
+            return 1
+        print(f"booked {args.date} {args.time} with doctor {args.doctor}")
+        return 0
+    start = time.perf_counter()
+    slots = find(args.n, args.doctor, args.specialty, args.language, args.patient, args.after)
+    for date, at, doctor in slots:
+        print(f"{date} {at}  doctor {doctor}")
+    print(f"{(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
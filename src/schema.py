@@ -0,0 +1,396 @@
+# Base schema in dependency order: every table is created after the tables it references.
+TABLES = [
+    ("patient", """
+        CREATE TABLE patient (
+            Patient_Id    INTEGER     PRIMARY KEY,
+            F_Name        VARCHAR2(15)   NOT NULL,
+            M_Initial     CHAR(1),
+            L_Name        VARCHAR2(15)   NOT NULL,
+            Sex           CHAR(1) CHECK (Sex IN ('M', 'F', 'X')),
+            Dob           DATE           NOT NULL,
+            Address       VARCHAR2(50),
+            Email         VARCHAR2(30) CHECK (Email LIKE '%@%.%'),
+            Phone_Num     VARCHAR2(12) CHECK (Phone_Num LIKE '___-___-____'),
+            Insurance     VARCHAR2(50)
+        )
+    """),
+    ("doctor", """
+        CREATE TABLE doctor (
+            Doctor_Id    INTEGER      PRIMARY KEY CHECK (Doctor_Id >= 10000),
+            F_Name       VARCHAR2(15)   NOT NULL,
+            L_Name       VARCHAR2(15)   NOT NULL,
+            Sex          CHAR(1) CHECK (Sex IN ('M', 'F', 'X')),
+            Extension    VARCHAR2(6),
+            Specialty    VARCHAR2(50),
+            Lang         VARCHAR2(50),
+            Status       VARCHAR2(8)    DEFAULT 'Active' CHECK (Status IN ('Active', 'Inactive'))
+        )
+    """),
+    ("booked", """
+        CREATE TABLE booked (
+            Appointment_Date    DATE          NOT NULL,
+            Patient_Id          INTEGER   NOT NULL,
+            Doctor_Id           INTEGER   NOT NULL,
+            Appointment_Time    VARCHAR2(5)   NOT NULL CHECK(Appointment_Time LIKE '__:__'),
+            Reason              VARCHAR2(50),
+            CONSTRAINT pk_booked PRIMARY KEY (Patient_Id, Appointment_Date, Appointment_Time),
+            CONSTRAINT fk_booked_pid FOREIGN KEY (Patient_Id) REFERENCES patient(Patient_Id),
+            CONSTRAINT fk_booked_did FOREIGN KEY (Doctor_Id) REFERENCES doctor(Doctor_Id),
+            CONSTRAINT ck_multiday UNIQUE (Patient_Id, Doctor_Id, Appointment_Date),
+            CONSTRAINT ck_double_book_patient UNIQUE (Appointment_Date, Patient_Id, Appointment_Time),
+            CONSTRAINT ck_double_book_doctor UNIQUE (Appointment_Date, Doctor_Id, Appointment_Time)
+        )
+    """),
+    ("bill", """
+        CREATE TABLE bill (
+            payer              VARCHAR2(255) NOT NULL,
+            status             VARCHAR2(6)   NOT NULL,
+            amount             NUMBER(10,2)  NOT NULL,
+            Appointment_Date   DATE          NOT NULL,
+            Patient_Id         INTEGER     NOT NULL,
+            Doctor_Id          INTEGER     NOT NULL,
+            CONSTRAINT pk_bill PRIMARY KEY (Appointment_Date, Doctor_Id, Patient_Id),
+            CONSTRAINT fk_bill_booked FOREIGN KEY (Appointment_Date, Patient_Id, Doctor_Id) 
+                REFERENCES booked(Appointment_Date, Patient_Id, Doctor_Id)
+        )
+    """),
+    ("medical_procedure", """
+        CREATE TABLE medical_procedure (
+            filepath           VARCHAR2(255),
+            procedure_type     VARCHAR2(9)   NOT NULL,
+            location           VARCHAR2(20)   NOT NULL,
+            procedure_summary  VARCHAR2(255),
+            Appointment_Date   DATE          NOT NULL,
+            Patient_Id         INTEGER   NOT NULL,
+            Doctor_Id          INTEGER   NOT NULL,
+            CONSTRAINT pk_medical_procedure PRIMARY KEY (procedure_type, Appointment_Date, Doctor_Id, Patient_Id),
+            CONSTRAINT fk_medical_procedure_booked FOREIGN KEY (Appointment_Date, Patient_Id, Doctor_Id) 
+                REFERENCES booked(Appointment_Date, Patient_Id, Doctor_Id)
+        )
+    """),
+    ("drug", """
+        CREATE TABLE drug (
+            DIN             NUMBER(10)      NOT NULL,
+            drug_name       VARCHAR2(30)    NOT NULL,
+            dosage          NUMBER(10, 2)   NOT NULL,
+            CONSTRAINT pk_drug PRIMARY KEY (DIN)
+        )
+    """),
+    ("prescription", """
+        CREATE TABLE prescription (
+            DIN               NUMBER(10)    NOT NULL,
+            med_count         NUMBER(5)     NOT NULL,
+            refills           NUMBER(5)     DEFAULT 0,
+            frequency         NUMBER(5)     NOT NULL,
+            Appointment_Date  DATE          NOT NULL,
+            Patient_Id        INTEGER     NOT NULL,
+            Doctor_Id         INTEGER     NOT NULL,
+            CONSTRAINT pk_prescription PRIMARY KEY (DIN, Appointment_Date, Doctor_Id, Patient_Id),
+            CONSTRAINT fk_prescription_booked FOREIGN KEY (Appointment_Date, Patient_Id, Doctor_Id) 
+                REFERENCES booked(Appointment_Date, Patient_Id, Doctor_Id),
+            CONSTRAINT fk_din FOREIGN KEY (DIN) REFERENCES drug(DIN)
+        )
+    """),
+    ("diagnosis", """
+        CREATE TABLE diagnosis (
+            Code_System       VARCHAR2(10)  NOT NULL,
+            Code              VARCHAR2(10)  NOT NULL,
+            Diagnosis_Name    VARCHAR2(30)  NOT NULL UNIQUE,
+            Condition_Type    VARCHAR2(15)  NOT NULL,
+            CONSTRAINT pk_code PRIMARY KEY (Code_System, Code),
+            CONSTRAINT ck_code_system CHECK (Code_System IN ('DSM-5-TR', 'ICD-10', 'ICD-11'))
+        )
+    """),
+    ("conditions", """
+        CREATE TABLE conditions (
+            Condition_Id    INTEGER PRIMARY KEY,
+            Patient_Id      INTEGER    NOT NULL,
+            Diagnosis_Name  VARCHAR2(30) NOT NULL,
+            Onset_Date      DATE         NOT NULL,
+            CONSTRAINT fk_conditions_patient FOREIGN KEY (Patient_Id) REFERENCES patient(Patient_Id),
+            CONSTRAINT fk_conditions_diagnosis FOREIGN KEY (Diagnosis_Name) REFERENCES code(Diagnosis_Name),
+            CONSTRAINT ck_duplicates1 UNIQUE (Patient_Id, Diagnosis_Name, Onset_Date),
+            CONSTRAINT ck_duplicates2 UNIQUE (Patient_Id, Condition_Id, Onset_Date)
+        )
+    """),
+    ("condition_details", """
+        CREATE TABLE condition_details (
+            Condition_Id      INTEGER   NOT NULL,
+            Patient_Id        INTEGER   NOT NULL,
+            Code_System       VARCHAR2(10),
+            Code              VARCHAR2(10),
+            Onset_Date        DATE,
+            Abatement_Date    DATE,
+            Clinical_Status   VARCHAR2(12)  DEFAULT 'active',
+            Severity          VARCHAR2(10),
+            Doctor_Id         INTEGER,
+            CONSTRAINT pk_condition_dets PRIMARY KEY (Condition_Id),
+            CONSTRAINT fk_condition_dets_base1 FOREIGN KEY (Condition_Id) REFERENCES conditions(Condition_Id),
+            CONSTRAINT fk_condition_dets_base FOREIGN KEY (Patient_Id, Condition_Id, Onset_Date) REFERENCES conditions(Patient_Id, Condition_Id, Onset_Date),
+            CONSTRAINT fk_condition_dets_code FOREIGN KEY (Code_System, Code) REFERENCES code(Code_System, Code),
+            CONSTRAINT fk_condition_dets_doctor FOREIGN KEY (Doctor_Id) REFERENCES doctor(Doctor_Id),
+            CONSTRAINT ck_conditions_status CHECK (Clinical_Status IN ('active','resolved','remission','unknown')),
+            CONSTRAINT ck_conditions_severity CHECK (Severity IN ('mild','moderate','severe','critical'))
+        )
+    """),
+    ("chronic_condition", """
+        CREATE TABLE chronic_condition (
+            Condition_Id                  INTEGER NOT NULL,
+            Is_Lifestyle_Modifiable       CHAR(1),
+            Long_Term_Med_Required        CHAR(1),
+            Follow_Up_Interval_Months     NUMBER(3),
+            CONSTRAINT pk_chronic_condition PRIMARY KEY (Condition_Id),
+            CONSTRAINT fk_chronic_condition_base FOREIGN KEY (Condition_Id) 
+                REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
+            CONSTRAINT ck_chronic_yn_check CHECK (
+                (Is_Lifestyle_Modifiable IN ('Y','N') OR Is_Lifestyle_Modifiable IS NULL)
+                AND (Long_Term_Med_Required IN ('Y','N') OR Long_Term_Med_Required IS NULL)
+            ),
+            CONSTRAINT ck_chronic_fu_check CHECK (Follow_Up_Interval_Months IS NULL OR Follow_Up_Interval_Months >= 0)
+        )
+    """),
+    ("infectious_condition", """
+        CREATE TABLE infectious_condition (
+            Condition_Id        INTEGER NOT NULL,
+            Pathogen_Type       VARCHAR2(20),
+            Isolation_Required  CHAR(1),
+            CONSTRAINT pk_infectious_condition PRIMARY KEY (Condition_Id),
+            CONSTRAINT fk_infectious_condition_base FOREIGN KEY (Condition_Id) 
+                REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
+            CONSTRAINT ck_infectious_pathogen CHECK (
+                Pathogen_Type IN ('virus','bacteria','fungus','parasite','unknown') 
+                OR Pathogen_Type IS NULL
+            ),
+            CONSTRAINT ck_infectious_yn_check CHECK (
+                (Isolation_Required IN ('Y','N') OR Isolation_Required IS NULL)
+            )
+        )
+    """),
+    ("injury_condition", """
+        CREATE TABLE injury_condition (
+            Condition_Id    INTEGER  NOT NULL,
+            Injury_Type     VARCHAR2(20),
+            Body_Site       VARCHAR2(120),
+            Laterality      VARCHAR2(10),
+            Cause           VARCHAR2(20),
+            Date_Of_Injury  DATE,
+            CONSTRAINT pk_injury_condition PRIMARY KEY (Condition_Id),
+            CONSTRAINT fk_injury_condition_base FOREIGN KEY (Condition_Id) 
+                REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
+            CONSTRAINT ck_injury_laterality CHECK (
+                Laterality IN ('left','right','bilateral','midline','na') 
+                OR Laterality IS NULL
+            )
+        )
+    """),
+    ("mental_health_condition", """
+        CREATE TABLE mental_health_condition (
+            Condition_Id        INTEGER  NOT NULL,
+            Disorder_Category   VARCHAR2(20),
+            Episode             VARCHAR2(20),
+            Treatment_Type      VARCHAR2(30),
+            Risk_Factor         VARCHAR2(50),
+            CONSTRAINT pk_mental_health_condition PRIMARY KEY (Condition_Id),
+            CONSTRAINT fk_mh_condition_base FOREIGN KEY (Condition_Id) 
+                REFERENCES conditions(Condition_Id) ON DELETE CASCADE,
+            CONSTRAINT ck_mental_episode CHECK (
+                Episode IN ('initial', 'acute', 'partial remission', 'full remission', 'multiple', 'na') 
+                OR Episode IS NULL
+            )
+        )
+    """),
+    ("vitals", """
+        CREATE TABLE vitals (
+            Patient_Id     INTEGER NOT NULL,
+            Measure_Ts     DATE DEFAULT SYSDATE NOT NULL,
+            Height_Cm      NUMBER(5,2),
+            Weight_Kg      NUMBER(5,2),
+            Bp_Systolic    NUMBER(3),
+            Bp_Diastolic   NUMBER(3),
+            Heart_Rate     NUMBER(3),
+            Resp_Rate      NUMBER(3),
+            Temp_C         NUMBER(4,1),
+            SpO2           NUMBER(3),
+            BMI            NUMBER(5,2) GENERATED ALWAYS AS (
+                CASE 
+                    WHEN Height_Cm IS NOT NULL AND Height_Cm > 0 AND Weight_Kg IS NOT NULL 
+                    THEN ROUND(Weight_Kg / POWER(Height_Cm / 100.0, 2), 2)
+                    ELSE NULL
+                END
+            ) STORED,
+            CONSTRAINT pk_vitals PRIMARY KEY (Patient_Id, Measure_Ts),
+            CONSTRAINT fk_vitals_patient FOREIGN KEY (Patient_Id) REFERENCES patient(Patient_Id)
+        )
+    """),
+]
+
+POPULATE = """
+    INSERT INTO patient VALUES (100000001, 'John', 'A', 'Smith', 'M', date("1990-12-01"), '22 Bathurst St.', 'jsmith@gmail.com', '416-991-2231', 'SF12345678');
+    INSERT INTO patient VALUES (100000002, 'Amanada', NULL, 'Smith', 'F', date("1988-07-16"), '22 Bathurst St.', 'asmith@gmail.com', '416-991-2231', 'SF12345678');
+    INSERT INTO patient VALUES (100000003, 'Sandra', 'F', 'Emerson', 'F', date("2001-09-01"), '119 Sheppard Ave W', 'sandra4432@hotmail.com', '905-999-0121', NULL);
+    INSERT INTO patient VALUES (100000004, 'James', 'E', 'Emerson', 'M', date("2024-09-15"), '119 Sheppard Ave W', NULL, '905-999-0121', NULL);
+    INSERT INTO patient VALUES (100000005, 'Julian', NULL, 'Emerson', 'M', date("1999-10-02"), '119 Sheppard Ave W', 'julianemerson@gmail.com', '289-991-2646', NULL);
+    INSERT INTO patient VALUES (100000006, 'Avery', 'A', 'Jones', 'X', date("1989-03-31"), '898 Oakwood Ave.', NULL, NULL, 'GS987654321');
+    INSERT INTO doctor VALUES (100001, 'Addison', 'Montgomery', 'F', '4512', 'Gynecology', 'English', 'Active');
+    INSERT INTO doctor VALUES (100002, 'James', 'Wilson', 'M', '4513', 'Oncology', NULL, 'Active');
+    INSERT INTO doctor VALUES (100003, 'Gregory', 'House', 'M', '4514', NULL, 'Spanish', 'Inactive');
+    INSERT INTO doctor VALUES (100004, 'Robert', 'Chase', 'M', '4515', NULL, 'German', 'Active');
+    INSERT INTO doctor VALUES (100005, 'Preston', 'Burke', 'M', '4516', 'Cardiology', 'English', 'Active');
+    INSERT INTO doctor VALUES (100006, 'Meredith', 'Grey', 'F', '4517', NULL, 'English, Russian', 'Active');
+    INSERT INTO doctor VALUES (100007, 'Christina', 'Yang', 'F', '4517', 'Cardiology', 'Mandarin', 'Active');
+    INSERT INTO doctor VALUES (100008, 'Allison', 'Cameron', 'F', '4518', 'Immunology', 'English', 'Active');
+    INSERT INTO doctor VALUES (100009, 'Anita', 'Akavan', 'F', '4599', 'Psychology', 'Persian', 'Active');
+    INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
+        VALUES (date("2025-10-25"), 100000001, 100001, '10:00', 'Annual check-up');
+    INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
+        VALUES (date("2025-11-05"), 100000002, 100008, '14:30', 'Allergic reaction/rash');
+    INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
+        VALUES (date("2025-12-10"), 100000005, 100005, '09:15', 'Cardiology follow-up');
+    INSERT INTO booked (Appointment_Date, Patient_Id, Doctor_Id, Appointment_Time, Reason)
+        VALUES (date("2025-11-16"), 100000003, 100009, '11:00', 'Initial consultation');
+    INSERT INTO bill (payer, status, amount, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES ('Insurance', 'Paid', 125.50, date("2025-10-25"), 100000001, 100001);
+    INSERT INTO bill (payer, status, amount, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES ('Patient', 'Unpaid', 75.00, date("2025-11-05"), 100000002, 100008);
+    INSERT INTO bill (payer, status, amount, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES ('Insurance', 'Unpaid', 250.75, date("2025-11-16"), 100000003, 100009);
+    INSERT INTO medical_procedure (procedure_type, location, procedure_summary, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES ('Physical', 'Exam Room 1', 'Standard physical exam with blood draw.', date("2025-10-25"), 100000001, 100001);
+    INSERT INTO medical_procedure (procedure_type, location, procedure_summary, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES ('Dermatology', 'Exam Room 3', 'Skin scraping to test for fungal infection.', date("2025-11-05"), 100000002, 100008);
+    INSERT INTO medical_procedure (procedure_type, location, procedure_summary, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES ('Consult', 'Office 2', 'Initial mental health assessment. Discussed history and treatment goals.', date(2025-11-16), 100000003, 100009);
+    INSERT INTO drug (DIN, drug_name, dosage) VALUES (1234567890, 'Amoxicillin', 500);
+    INSERT INTO drug (DIN, drug_name, dosage) VALUES (2345678901, 'Lipitor', 20);
+    INSERT INTO drug (DIN, drug_name, dosage) VALUES (3456789012, 'Zoloft', 50);
+    INSERT INTO drug (DIN, drug_name, dosage) VALUES (4567890123, 'Acetaminophen', 325);
+    INSERT INTO prescription (DIN, med_count, refills, frequency, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES (2345678901, 30, 3, 1, date("2025-10-25"), 100000001, 100001);
+    INSERT INTO prescription (DIN, med_count, refills, frequency, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES (1234567890, 14, 0, 2, date("2025-11-05"), 100000002, 100008);
+    INSERT INTO prescription (DIN, med_count, refills, frequency, Appointment_Date, Patient_Id, Doctor_Id)
+        VALUES (3456789012, 60, 1, 1, date("2025-11-16"), 100000003, 100009);
+    INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
+        VALUES ('ICD-10', 'I10', 'Essential Hypertension', 'chronic');
+    INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
+        VALUES ('ICD-10', 'J02.9', 'Acute Pharyngitis', 'infectious');
+    INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
+        VALUES ('DSM-5-TR', '300.4', 'Persistent Depressive Disorder', 'mental_health');
+    INSERT INTO diagnosis (Code_System, Code, Diagnosis_Name, Condition_Type)
+        VALUES ('ICD-10', 'S82.30', 'Fracture of Tibia', 'injury');
+    INSERT INTO conditions (Patient_Id, Diagnosis_Name, Onset_Date)
+        VALUES (100000001, 'Essential Hypertension', date("2024-05-10"));
+    INSERT INTO conditions (Patient_Id, Diagnosis_Name, Onset_Date)
+        VALUES (100000002, 'Acute Pharyngitis', date("2025-11-01"));
+    INSERT INTO conditions (Patient_Id, Diagnosis_Name, Onset_Date)
+        VALUES (100000003, 'Persistent Depressive Disorder', date("2023-01-20"));
+    INSERT INTO condition_details (Condition_Id, Patient_Id, Code_System, Code, Onset_Date, Clinical_Status, Severity, Doctor_Id)
+        VALUES (100000, 100000001, 'ICD-10', 'I10', date("2024-05-10"), 'active', 'moderate', 100001);
+    INSERT INTO condition_details (Condition_Id, Patient_Id, Code_System, Code, Onset_Date, Abatement_Date, Clinical_Status, Severity, Doctor_Id)
+        VALUES (100001, 100000002, 'ICD-10', 'J02.9', date("2025-11-01"), date("2025-11-15"), 'resolved', 'mild', 100008);
+    INSERT INTO condition_details (Condition_Id, Patient_Id, Code_System, Code, Onset_Date, Clinical_Status, Severity, Doctor_Id)
+        VALUES (100002, 100000003, 'DSM-5-TR', '300.4', date("2023-01-20"), 'active', 'moderate', 100009);
+    INSERT INTO chronic_condition (Condition_Id, Is_Lifestyle_Modifiable, Long_Term_Med_Required, Follow_Up_Interval_Months)
+        VALUES (100000, 'Y', 'Y', 6);
+    INSERT INTO infectious_condition (Condition_Id, Pathogen_Type, Isolation_Required)
+        VALUES (100001, 'virus', 'N');
+    INSERT INTO mental_health_condition (Condition_Id, Disorder_Category, Episode, Treatment_Type, Risk_Factor)
+        VALUES (100002, 'Mood Disorder', 'multiple', 'Cognitive Behavioral Therapy', 'Family History');
+    INSERT INTO vitals (Patient_Id, Measure_Ts, Height_Cm, Weight_Kg, Bp_Systolic, Bp_Diastolic, Heart_Rate, Resp_Rate, Temp_C, SpO2)
+        VALUES (100000001, date("2025-11-16"), 175.00, 80.50, 145, 95, 75, 16, 36.8, 98);
+    INSERT INTO vitals (Patient_Id, Measure_Ts, Height_Cm, Weight_Kg, Bp_Systolic, Bp_Diastolic, Heart_Rate, Resp_Rate, Temp_C, SpO2)
+        VALUES (100000002, date("2025-11-05"), 162.00, 65.00, 120, 80, 85, 18, 37.2, 97);
+    INSERT INTO vitals (Patient_Id, Measure_Ts, Height_Cm, Weight_Kg, Bp_Systolic, Bp_Diastolic, Heart_Rate, Resp_Rate, Temp_C, SpO2)
+        VALUES (100000003, date("2025-11-16"), 168.00, 58.00, 110, 70, 68, 15, 36.5, 99);
+"""
+
+# More than 3 days outstanding, compared as dates so the unpaid-bill indexes answer it
+OVERDUE_BILLS_VIEW = """
+    CREATE VIEW IF NOT EXISTS overdue_bills (Patient, Appt_Date, Amount) AS SELECT Patient_Id, Appointment_Date, Amount FROM bill
+        WHERE Status = 'Unpaid' AND Appointment_Date < date('now', '-3 days') ORDER BY Patient_Id, Appointment_Date
+"""
+
+CREATE_VIEWS = f"""
+BEGIN;
+    {OVERDUE_BILLS_VIEW.strip()};
+
+    CREATE VIEW IF NOT EXISTS day_schedule_100001 (Patient, Time, Reason) AS SELECT Patient_Id, Appointment_Time, Reason FROM booked
+        WHERE Doctor_Id=100001 AND Appointment_Date=date("2025-10-25") ORDER BY Appointment_Time;
+
+    CREATE VIEW IF NOT EXISTS prescription_history (Pres_Date, Drug, DIN, Drug_Count, Dosage_Mg, Refills, Frequency, Doctor) AS
+        SELECT Appointment_Date, Drug_Name, prescription.DIN, Med_Count, Dosage, Refills, Frequency, doctor.L_Name FROM prescription, doctor, drug
+        WHERE Patient_Id=100000002
+        AND doctor.Doctor_Id = prescription.Doctor_Id
+        AND prescription.DIN = drug.DIN
+        ORDER BY Appointment_Date;
+COMMIT;
+"""
+
+DROP_VIEWS = """
+BEGIN;
+    DROP VIEW IF EXISTS overdue_bills;
+
+    DROP VIEW IF EXISTS day_schedule_100001;
+
+    DROP VIEW IF EXISTS prescription_history;
+COMMIT;
+"""
+
+
+def create_statements():
+    return [sql.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1) for _, sql in TABLES]
+
+
+def drop_statements():
+    # Children before the tables they reference
+    return [f"DROP TABLE IF EXISTS {name}" for name, _ in reversed(TABLES)]
+
+
+def execute(con, statement):
+    # A statement is SQL text, or a function of the connection for a step that depends on
+    # what the database already holds
+    if callable(statement):
+        statement(con)
+    else:
+        con.execute(statement)
+
+
+def run_all(con, statements):
+    # All or nothing, so a failure part way never leaves a half-created or half-dropped schema
+    con.execute("BEGIN")
+    try:
+        for sql in statements:
+            execute(con, sql)
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+
+
+def create_tables(con):
+    run_all(con, create_statements())
+
+
+def drop_tables(con):
+    run_all(con, drop_statements())
+
+
+def populate_tables(con):
+    # The sample readings are rolled up in the same transaction, like every other path that
+    # inserts vitals. vitals imports this module for the table definitions.
+    import vitals
+    first_rowid = vitals.next_rowid(con)
+    try:
+        con.executescript("BEGIN;\n" + POPULATE + vitals.roll_up_script(first_rowid) + "COMMIT;")
+    except BaseException:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+
+
+def create_views(con):
+    con.executescript(CREATE_VIEWS)
+
+
+def drop_views(con):
+    con.executescript(DROP_VIEWS)
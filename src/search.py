@@ -0,0 +1,191 @@
+import argparse
+import re
+import sys
+import time
+import unicodedata
+
+import db
+
+LIMIT = 20
+# Past this many matches bm25 ranking is skipped: a one or two letter prefix can match most
+# of a million patients, and scoring every one of them blows the search-as-you-type budget.
+RANK_CAP = 2000
+MIN_PREFIX = 2
+# Prefix lengths FTS5 keeps a prefix index for. A longer prefix query has to merge the
+# doclist of every term it covers before returning a row.
+PREFIX_LENGTHS = (2, 3, 4, 5, 6)
+# Seconds of quiet typing before the search screen runs a query
+DEBOUNCE = 0.25
+
+# FTS5 indexes with their columns and bm25 weights. Tables keyed by an INTEGER PRIMARY KEY
+# use external content (the text lives only in the base table). diagnosis has a composite
+# key and unstable rowids (VACUUM may renumber them), so its index keeps its own copy and
+# carries the key as UNINDEXED columns.
+INDEXES = {
+    "patient": {
+        "rowid": "Patient_Id",
+        "columns": [("F_Name", 10.0), ("L_Name", 10.0), ("Email", 5.0), ("Phone_Num", 5.0), ("Address", 1.0)],
+    },
+    "doctor": {
+        "rowid": "Doctor_Id",
+        "columns": [("F_Name", 10.0), ("L_Name", 10.0), ("Specialty", 3.0), ("Lang", 1.0)],
+    },
+    "diagnosis": {
+        "key": ["Code_System", "Code"],
+        "columns": [("Diagnosis_Name", 10.0), ("Code", 5.0), ("Code_System", 0.0)],
+        "unindexed": ["Code_System"],
+    },
+}
+
+
+def index_sql(table, spec):
+    unindexed = spec.get("unindexed", [])
+    columns = ", ".join(column + (" UNINDEXED" if column in unindexed else "") for column, _ in spec["columns"])
+    options = f"tokenize='unicode61 remove_diacritics 2', prefix='{' '.join(map(str, PREFIX_LENGTHS))}'"
+    if "rowid" in spec:
+        options = f"content='{table}', content_rowid='{spec['rowid']}', " + options
+    return f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({columns}, {options})"
+
+
+def trigger_sql(table, spec):
+    names = [column for column, _ in spec["columns"]]
+    columns = ", ".join(names)
+
+    def values(row):
+        return ", ".join(f"{row}.{column}" for column in names)
+
+    if "rowid" in spec:
+        key = spec["rowid"]
+        add = f"INSERT INTO {table}_fts (rowid, {columns}) VALUES (NEW.{key}, {values('NEW')});"
+        remove = (f"INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) "
+                  f"VALUES ('delete', OLD.{key}, {values('OLD')});")
+    else:
+        add = f"INSERT INTO {table}_fts ({columns}) VALUES ({values('NEW')});"
+        remove = f"DELETE FROM {table}_fts WHERE " + " AND ".join(f"{k} = OLD.{k}" for k in spec["key"]) + ";"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_ins AFTER INSERT ON {table} BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_del AFTER DELETE ON {table} BEGIN {remove} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_upd AFTER UPDATE ON {table} BEGIN {remove} {add} END",
+    ]
+
+
+SCHEMA = [index_sql(table, spec) for table, spec in INDEXES.items()] + [
+    sql for table, spec in INDEXES.items() for sql in trigger_sql(table, spec)
+]
+
+def rebuild_sql(table, spec):
+    if "rowid" in spec:
+        return [f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')"]
+    columns = ", ".join(column for column, _ in spec["columns"])
+    return [f"DELETE FROM {table}_fts", f"INSERT INTO {table}_fts ({columns}) SELECT {columns} FROM {table}"]
+
+
+REBUILD = [sql for table, spec in INDEXES.items() for sql in rebuild_sql(table, spec)]
+
+# What each hit shows: an id, a title and the columns joined into a detail line
+RESULTS = {
+    "patient": ("Patient_Id", "F_Name || ' ' || L_Name", ["Email", "Phone_Num", "Address"]),
+    "doctor": ("Doctor_Id", "'Dr. ' || F_Name || ' ' || L_Name", ["Specialty", "Lang"]),
+    "diagnosis": ("diagnosis.Code_System || ' ' || diagnosis.Code", "Diagnosis_Name", ["Condition_Type"]),
+}
+
+
+def tokens(text):
+    # Folded the way the unicode61 tokenizer folds indexed text
+    text = "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+    words = re.findall(r"\w+", text)
+    if sum(len(word) for word in words) < MIN_PREFIX:
+        return []
+    return words
+
+
+def match_expression(words, prefix=True):
+    # Every word must match some indexed column. Words the user has moved past are whole
+    # terms; only the one still being typed is a prefix, so "jo smi" finds John Smith.
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += "*"
+    return " AND ".join(terms)
+
+
+def count_matches(con, table, expression):
+    return con.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table}_fts WHERE {table}_fts MATCH ? LIMIT ?)",
+                       (expression, RANK_CAP + 1)).fetchone()[0]
+
+
+def search_table(con, table, words, limit=LIMIT):
+    spec = INDEXES[table]
+    weights = ", ".join(str(weight) for _, weight in spec["columns"])
+    ident, title, detail = RESULTS[table]
+    expression = match_expression(words)
+    matches = None
+    if len(words[-1]) > max(PREFIX_LENGTHS):
+        # A long last word is tried as a whole term first, which streams from the index.
+        # If that alone is too broad to rank, its matches are shown without the costly
+        # prefix merge; otherwise the prefix expansions are small enough to add.
+        exact = match_expression(words, prefix=False)
+        matches = count_matches(con, table, exact)
+        if matches > RANK_CAP:
+            expression = exact
+        else:
+            matches = None
+    if matches is None:
+        matches = count_matches(con, table, expression)
+    # Ranking needs every match scored; cheap when the match set is small, which is when
+    # ranking matters. A broad search is returned in key order instead.
+    if matches <= RANK_CAP:
+        score = f"bm25({table}_fts, {weights})"
+        order = " ORDER BY score"
+    else:
+        score = "0.0"
+        order = ""
+    key = [spec["rowid"]] if "rowid" in spec else spec["key"]
+    hit_key = ["rowid"] if "rowid" in spec else spec["key"]
+    hits = (f"SELECT {', '.join(hit_key)}, {score} AS score FROM {table}_fts "
+            f"WHERE {table}_fts MATCH ?{order} LIMIT ?")
+    join = " AND ".join(f"{table}.{column} = hits.{hit}" for column, hit in zip(key, hit_key))
+    sql = f"""
+        SELECT {ident}, {title}, hits.score, {", ".join(detail)}
+        FROM ({hits}) AS hits JOIN {table} ON {join}
+        ORDER BY hits.score
+    """
+    rows = [(ident, title, " | ".join(str(value) for value in details if value is not None), score)
+            for ident, title, score, *details in con.execute(sql, (expression, limit))]
+    return rows, min(matches, RANK_CAP), matches <= RANK_CAP
+
+
+def search(con, text, limit=LIMIT):
+    # Returns {table: (rows, matches, ranked)}; matches stops counting at RANK_CAP
+    words = tokens(text)
+    if not words:
+        return {}
+    return {table: search_table(con, table, words, limit) for table in INDEXES}
+
+
+def drop(con):
+    for table in INDEXES:
+        con.execute(f"DROP TABLE IF EXISTS {table}_fts")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search patients, doctors and diagnoses.")
+    parser.add_argument("text")
+    parser.add_argument("--limit", type=int, default=LIMIT)
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    start = time.perf_counter()
+    with db.connection() as con:
+        results = search(con, args.text, args.limit)
+    elapsed = time.perf_counter() - start
+    for table, (rows, matches, ranked) in results.items():
+        print(f"{table}: {matches:,}{'' if ranked else '+'} matches")
+        for ident, title, detail, _ in rows:
+            print(f"  {ident}  {title}  {detail}")
+    print(f"{elapsed * 1000:.1f}ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
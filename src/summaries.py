@@ -0,0 +1,182 @@
+import argparse
+import json
+import sys
+
+import cache
+import db
+
+# Summary tables kept current by triggers on booked and bill, so the count/average
+# reports read one row per group instead of aggregating the base tables.
+TABLES = {
+    "appt_counts": """
+        CREATE TABLE IF NOT EXISTS appt_counts (
+            Doctor_Id     INTEGER NOT NULL,
+            Patient_Id    INTEGER NOT NULL,
+            Appointments  INTEGER NOT NULL,
+            PRIMARY KEY (Doctor_Id, Patient_Id)
+        ) WITHOUT ROWID
+    """,
+    "doctor_patient_counts": """
+        CREATE TABLE IF NOT EXISTS doctor_patient_counts (
+            Doctor_Id  INTEGER PRIMARY KEY,
+            Patients   INTEGER NOT NULL
+        )
+    """,
+    "patient_doctor_counts": """
+        CREATE TABLE IF NOT EXISTS patient_doctor_counts (
+            Patient_Id  INTEGER PRIMARY KEY,
+            Doctors     INTEGER NOT NULL
+        )
+    """,
+    "unpaid_totals": """
+        CREATE TABLE IF NOT EXISTS unpaid_totals (
+            Patient_Id    INTEGER PRIMARY KEY,
+            Unpaid_Sum    REAL    NOT NULL,
+            Unpaid_Count  INTEGER NOT NULL
+        )
+    """,
+}
+
+# The same rows computed from the base tables; used to rebuild and to verify
+DEFINITIONS = {
+    "appt_counts": "SELECT Doctor_Id, Patient_Id, COUNT(*) FROM booked GROUP BY Doctor_Id, Patient_Id",
+    "doctor_patient_counts": "SELECT Doctor_Id, COUNT(DISTINCT Patient_Id) FROM booked GROUP BY Doctor_Id",
+    "patient_doctor_counts": "SELECT Patient_Id, COUNT(DISTINCT Doctor_Id) FROM booked GROUP BY Patient_Id",
+    "unpaid_totals": "SELECT Patient_Id, SUM(amount), COUNT(*) FROM bill WHERE status = 'Unpaid' GROUP BY Patient_Id",
+}
+
+
+def booked_added(row):
+    return f"""
+        INSERT INTO appt_counts VALUES ({row}.Doctor_Id, {row}.Patient_Id, 1)
+            ON CONFLICT (Doctor_Id, Patient_Id) DO UPDATE SET Appointments = Appointments + 1;
+        INSERT INTO doctor_patient_counts
+            SELECT {row}.Doctor_Id, 1 WHERE (SELECT Appointments FROM appt_counts
+                WHERE Doctor_Id = {row}.Doctor_Id AND Patient_Id = {row}.Patient_Id) = 1
+            ON CONFLICT (Doctor_Id) DO UPDATE SET Patients = Patients + 1;
+        INSERT INTO patient_doctor_counts
+            SELECT {row}.Patient_Id, 1 WHERE (SELECT Appointments FROM appt_counts
+                WHERE Doctor_Id = {row}.Doctor_Id AND Patient_Id = {row}.Patient_Id) = 1
+            ON CONFLICT (Patient_Id) DO UPDATE SET Doctors = Doctors + 1;
+    """
+
+
+def booked_removed(row):
+    return f"""
+        UPDATE appt_counts SET Appointments = Appointments - 1
+            WHERE Doctor_Id = {row}.Doctor_Id AND Patient_Id = {row}.Patient_Id;
+        UPDATE doctor_patient_counts SET Patients = Patients - 1
+            WHERE Doctor_Id = {row}.Doctor_Id AND (SELECT Appointments FROM appt_counts
+                WHERE Doctor_Id = {row}.Doctor_Id AND Patient_Id = {row}.Patient_Id) = 0;
+        UPDATE patient_doctor_counts SET Doctors = Doctors - 1
+            WHERE Patient_Id = {row}.Patient_Id AND (SELECT Appointments FROM appt_counts
+                WHERE Doctor_Id = {row}.Doctor_Id AND Patient_Id = {row}.Patient_Id) = 0;
+        DELETE FROM appt_counts
+            WHERE Doctor_Id = {row}.Doctor_Id AND Patient_Id = {row}.Patient_Id AND Appointments = 0;
+        DELETE FROM doctor_patient_counts WHERE Doctor_Id = {row}.Doctor_Id AND Patients = 0;
+        DELETE FROM patient_doctor_counts WHERE Patient_Id = {row}.Patient_Id AND Doctors = 0;
+    """
+
+
+def bill_added(row):
+    return f"""
+        INSERT INTO unpaid_totals
+            SELECT {row}.Patient_Id, {row}.amount, 1 WHERE {row}.status = 'Unpaid'
+            ON CONFLICT (Patient_Id) DO UPDATE SET
+                Unpaid_Sum = Unpaid_Sum + excluded.Unpaid_Sum, Unpaid_Count = Unpaid_Count + 1;
+    """
+
+
+def bill_removed(row):
+    return f"""
+        UPDATE unpaid_totals SET Unpaid_Sum = Unpaid_Sum - {row}.amount, Unpaid_Count = Unpaid_Count - 1
+            WHERE Patient_Id = {row}.Patient_Id AND {row}.status = 'Unpaid';
+        DELETE FROM unpaid_totals WHERE Patient_Id = {row}.Patient_Id AND Unpaid_Count = 0;
+    """
+
+
+TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_booked_summary_ins AFTER INSERT ON booked BEGIN"
+    + booked_added("NEW") + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_booked_summary_del AFTER DELETE ON booked BEGIN"
+    + booked_removed("OLD") + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_booked_summary_upd AFTER UPDATE OF Doctor_Id, Patient_Id ON booked BEGIN"
+    + booked_removed("OLD") + booked_added("NEW") + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_bill_summary_ins AFTER INSERT ON bill BEGIN"
+    + bill_added("NEW") + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_bill_summary_del AFTER DELETE ON bill BEGIN"
+    + bill_removed("OLD") + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_bill_summary_upd AFTER UPDATE OF status, amount, Patient_Id ON bill BEGIN"
+    + bill_removed("OLD") + bill_added("NEW") + "END",
+]
+
+INDEXES = [
+    # Matches the Number of Patients report order so its keyset pages are index seeks
+    "CREATE INDEX IF NOT EXISTS idx_doctor_patient_counts_rank ON doctor_patient_counts (Patients DESC, Doctor_Id)",
+]
+
+REBUILD = [f"DELETE FROM {table}" for table in TABLES] + [
+    f"INSERT INTO {table} {sql}" for table, sql in DEFINITIONS.items()
+]
+
+SCHEMA = list(TABLES.values()) + TRIGGERS + INDEXES
+
+MONEY_TOLERANCE = 0.005
+
+
+def drift(con, table):
+    # Rows that differ between the summary table and a fresh aggregate of the base table
+    keys = [row[1] for row in con.execute(f"PRAGMA table_info({table})") if row[5]]
+    stored = {tuple(row[:len(keys)]): row[len(keys):] for row in con.execute(f"SELECT * FROM {table}")}
+    fresh = {tuple(row[:len(keys)]): row[len(keys):] for row in con.execute(DEFINITIONS[table])}
+    rows = []
+    for key in stored.keys() | fresh.keys():
+        have, want = stored.get(key), fresh.get(key)
+        if have is None or want is None or any(abs(a - b) > MONEY_TOLERANCE for a, b in zip(have, want)):
+            rows.append({"key": dict(zip(keys, key)), "stored": have, "expected": want})
+    return {"table": table, "rows": len(stored), "drift": rows}
+
+
+def verify(con):
+    return [drift(con, table) for table in TABLES]
+
+
+def rebuild(con):
+    con.execute("BEGIN")
+    try:
+        for sql in REBUILD:
+            con.execute(sql)
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    cache.invalidate("booked", "bill")
+
+
+def drop(con):
+    for table in TABLES:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify or rebuild the report summary tables.")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    with db.connection() as con:
+        if args.command == "rebuild":
+            rebuild(con)
+        results = verify(con)
+    drifted = 0
+    for result in results:
+        drifted += len(result["drift"])
+        print(f"{result['table']}: {result['rows']} rows, {len(result['drift'])} drifted")
+        for row in result["drift"][:20]:
+            print("  " + json.dumps(row))
+    return 1 if drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+START = time.perf_counter()
+
+
+def recording_connection():
+    # A Flet connection with no client behind it that measures each message the way the
+    # desktop socket server would send it: JSON behind a 4-byte length
+    from flet.core.local_connection import LocalConnection
+    from flet.core.protocol import (ClientActions, ClientMessage, CommandEncoder, PageCommandResponsePayload,
+                                    PageCommandsBatchResponsePayload)
+
+    class RecordingConnection(LocalConnection):
+        def __init__(self):
+            super().__init__()
+            self.sent = []
+
+        def record(self, message):
+            self.sent.append(4 + len(json.dumps(message, cls=CommandEncoder, separators=(",", ":")).encode("utf-8")))
+
+        def send_command(self, session_id, command):
+            result, message = self._process_command(command)
+            if message:
+                self.record(message)
+            return PageCommandResponsePayload(result=result, error="")
+
+        def send_commands(self, session_id, commands):
+            results, messages = [], []
+            for command in commands:
+                result, message = self._process_command(command)
+                if command.name in ("add", "get"):
+                    results.append(result)
+                if message:
+                    messages.append(message)
+            if messages:
+                self.record(ClientMessage(ClientActions.PAGE_CONTROLS_BATCH, messages))
+            return PageCommandsBatchResponsePayload(results=results, error="")
+
+    return RecordingConnection()
+
+
+def run(rounds):
+    # In a fresh process, so the imports are cold: time to the main menu's first update,
+    # then every screen opened from the menu and back, rounds times over
+    import asyncio
+
+    import flet as ft
+    import main
+    imported = time.perf_counter()
+    conn = recording_connection()
+    page = ft.Page(conn, "bench", asyncio.new_event_loop())
+    main.main(page)
+    painted = time.perf_counter()
+    router = page.session.get("router")
+    result = {"import_ms": round((imported - START) * 1000, 1), "first_paint_ms": round((painted - START) * 1000, 1),
+              "first_paint_bytes": sum(conn.sent), "screens": {}}
+    for name in main.SCREENS:
+        if name == "main":
+            continue
+        visits = []
+        for _ in range(rounds):
+            steps = []
+            for target in (name, "main"):
+                sent = len(conn.sent)
+                router.go(target)
+                steps.append({"bytes": sum(conn.sent[sent:]), "ms": round(router.last[2] * 1000, 2)})
+            visits.append({"open": steps[0], "back": steps[1]})
+        result["screens"][name] = visits
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the app's cold start and measure what each navigation sends.")
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    parser.add_argument("--rounds", type=int, default=2, help="visits to each screen; the first one builds it")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        if args.db:
+            import db
+            db.configure(args.db)
+        print(json.dumps(run(args.rounds)))
+        return 0
+    command = [sys.executable, __file__, "--worker", "--rounds", str(args.rounds)] + (["--db", args.db] if args.db else [])
+    result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+    print(f"imports {result['import_ms']}ms, first paint {result['first_paint_ms']}ms "
+          f"({result['first_paint_bytes']:,} bytes)")
+    for name, visits in result["screens"].items():
+        print(f"  {name:14}" + "  ".join(
+            f"open {visit['open']['bytes']:>6,}B {visit['open']['ms']:>6.1f}ms  back {visit['back']['bytes']:>5,}B"
+            for visit in visits))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import argparse
+import datetime
+import json
+import math
+import re
+import sys
+import time
+
+import cache
+import db
+import records
+import schema
+
+READING_COLUMNS = ["Height_Cm", "Weight_Kg", "Bp_Systolic", "Bp_Diastolic", "Heart_Rate", "Resp_Rate", "Temp_C", "SpO2"]
+METRICS = READING_COLUMNS + ["BMI"]
+COLUMNS = ["Patient_Id", "Measure_Ts"] + READING_COLUMNS
+INSERT = f"INSERT OR IGNORE INTO vitals ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# Bucket label for each rollup resolution, computed from Measure_Ts
+RESOLUTIONS = {
+    "vitals_hourly": "strftime('%Y-%m-%d %H:00', Measure_Ts)",
+    "vitals_daily": "date(Measure_Ts)",
+}
+
+# Windows up to RAW_MAX read individual readings and up to HOURLY_MAX read hourly buckets,
+# which keeps a trend near a thousand points at one reading per minute.
+RAW_MAX = datetime.timedelta(days=1)
+HOURLY_MAX = datetime.timedelta(days=45)
+
+ROLLUP_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        Patient_Id  INTEGER NOT NULL,
+        Metric      TEXT    NOT NULL,
+        Bucket      TEXT    NOT NULL,
+        N           INTEGER NOT NULL,
+        Total       REAL    NOT NULL,
+        Min_Value   REAL    NOT NULL,
+        Max_Value   REAL    NOT NULL,
+        PRIMARY KEY (Patient_Id, Metric, Bucket)
+    ) WITHOUT ROWID
+"""
+
+# vitals.BMI was a VIRTUAL column recomputed with POWER() on every read; the table is
+# rebuilt with it STORED. Generated columns cannot be altered in place.
+STORED_BMI = [
+    dict(schema.TABLES)["vitals"].replace("CREATE TABLE vitals", "CREATE TABLE vitals_stored"),
+    f"INSERT INTO vitals_stored ({', '.join(COLUMNS)}) SELECT {', '.join(COLUMNS)} FROM vitals",
+    "DROP TABLE vitals",
+    "ALTER TABLE vitals_stored RENAME TO vitals",
+]
+
+
+def store_bmi(con):
+    # Only databases created before BMI was STORED are rebuilt; a table created from
+    # schema.TABLES already has it, and copying every reading again would gain nothing
+    ddl = con.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'vitals'").fetchone()[0]
+    if re.search(r"\bSTORED\b", ddl, re.IGNORECASE):
+        return
+    for sql in STORED_BMI:
+        con.execute(sql)
+
+
+def aggregate(bucket, metric, where, source="vitals"):
+    return f"""
+        SELECT Patient_Id, '{metric}', {bucket}, COUNT(*), SUM({metric}), MIN({metric}), MAX({metric})
+        FROM {source} WHERE {where} AND {metric} IS NOT NULL
+        GROUP BY Patient_Id, {bucket}
+    """
+
+
+# Merges the vitals rows with rowid >= ? into the rollups: counts and totals add, minimum
+# and maximum widen. Writers insert a batch and then roll up from its first rowid.
+# NOT INDEXED keeps the planner on the rowid range; otherwise it walks the whole primary
+# key index to avoid sorting for the GROUP BY, which costs a full scan per small batch.
+ROLL_UP = [
+    f"""
+    INSERT INTO {table} {aggregate(bucket, metric, "rowid >= ?", "vitals NOT INDEXED")}
+    ON CONFLICT (Patient_Id, Metric, Bucket) DO UPDATE SET
+        N = N + excluded.N,
+        Total = Total + excluded.Total,
+        Min_Value = MIN(Min_Value, excluded.Min_Value),
+        Max_Value = MAX(Max_Value, excluded.Max_Value)
+    """
+    for table, bucket in RESOLUTIONS.items() for metric in METRICS
+]
+
+REBUILD = [f"DELETE FROM {table}" for table in RESOLUTIONS] + [
+    f"INSERT INTO {table} {aggregate(bucket, metric, 'true')}"
+    for table, bucket in RESOLUTIONS.items() for metric in METRICS
+]
+
+SCHEMA = [store_bmi] + [ROLLUP_TABLE.format(name=table) for table in RESOLUTIONS]
+
+
+def roll_up(con, first_rowid):
+    for sql in ROLL_UP:
+        con.execute(sql, (first_rowid,))
+
+
+def roll_up_script(first_rowid):
+    # roll_up as SQL text, to end a script that inserts readings inside its own transaction
+    return "".join(sql.replace("rowid >= ?", f"rowid >= {int(first_rowid)}") + ";\n" for sql in ROLL_UP)
+
+
+def next_rowid(con):
+    return con.execute("SELECT IFNULL(MAX(rowid), 0) + 1 FROM vitals").fetchone()[0]
+
+
+def rebuild(con):
+    # Rollups only ever grow, so after readings are corrected or deleted they are recomputed
+    con.execute("BEGIN")
+    try:
+        for sql in REBUILD:
+            con.execute(sql)
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    cache.invalidate("vitals")
+
+
+def drift(con):
+    # Buckets whose stored count, total, minimum or maximum differs from a fresh aggregate
+    # of the raw readings, per rollup table
+    results = []
+    for table, bucket in RESOLUTIONS.items():
+        stored = {row[:3]: row[3:] for row in con.execute(f"SELECT * FROM {table}")}
+        fresh = {}
+        for metric in METRICS:
+            for row in con.execute(aggregate(bucket, metric, "true")):
+                fresh[row[:3]] = row[3:]
+        rows = []
+        for key in stored.keys() | fresh.keys():
+            have, want = stored.get(key), fresh.get(key)
+            if have is None or want is None or any(abs(a - b) > 1e-6 for a, b in zip(have, want)):
+                rows.append({"key": dict(zip(["Patient_Id", "Metric", "Bucket"], key)), "stored": have, "expected": want})
+        results.append({"table": table, "rows": len(stored), "drift": rows})
+    return results
+
+
+def drop(con):
+    for table in RESOLUTIONS:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def timestamp(value):
+    return datetime.datetime.fromisoformat(str(value)).isoformat(" ", "seconds")
+
+
+def metric_value(value):
+    return None if value is None or value == "" else float(value)
+
+
+def reading(raw):
+    return (int(raw["Patient_Id"]), timestamp(raw["Measure_Ts"])) + tuple(
+        metric_value(raw.get(column)) for column in READING_COLUMNS
+    )
+
+
+def insert_readings(con, rows):
+    # Inserts parsed readings and rolls up just the new ones inside the caller's transaction
+    first_rowid = next_rowid(con)
+    inserted = con.executemany(INSERT, rows).rowcount
+    if inserted:
+        roll_up(con, first_rowid)
+    return inserted
+
+
+def ingest(readings):
+    # Batched path for bedside monitors: one transaction and one executemany per batch, then
+    # a single rollup pass over just the new rows. A reading already stored for the same
+    # patient and timestamp (a monitor resend) is skipped.
+    start = time.perf_counter()
+    rows = [reading(raw) for raw in readings]
+    with db.connection() as con:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = insert_readings(con, rows)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+    if inserted:
+        cache.invalidate("vitals")
+    elapsed = time.perf_counter() - start
+    return {
+        "inserted": inserted,
+        "duplicates": len(rows) - inserted,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(inserted / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def bound(moment):
+    # Measure_Ts holds either a date or a date and time, so a midnight bound is written as
+    # a bare date to compare correctly against both
+    if moment.time() == datetime.time():
+        return moment.date().isoformat()
+    return moment.isoformat(" ", "seconds")
+
+
+def resolution(start, end):
+    window = end - start
+    if window <= RAW_MAX:
+        return "raw"
+    if window <= HOURLY_MAX:
+        return "hourly"
+    return "daily"
+
+
+def trend_query(patient_id, metric, start, end):
+    # Returns (resolution, sql, params) for readings of one metric in [start, end); each row
+    # is (time, readings, average, minimum, maximum) whatever the resolution.
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+    if end <= start:
+        raise ValueError("end must be after start")
+    level = resolution(start, end)
+    if level == "raw":
+        sql = f"""
+            SELECT Measure_Ts AS time, 1 AS readings, {metric} AS average, {metric} AS minimum, {metric} AS maximum
+            FROM vitals
+            WHERE Patient_Id = ? AND Measure_Ts >= ? AND Measure_Ts < ? AND {metric} IS NOT NULL
+        """
+        return level, sql, (patient_id, bound(start), bound(end))
+    if level == "hourly":
+        low = start.replace(minute=0, second=0, microsecond=0).strftime("%Y-%m-%d %H:00")
+    else:
+        low = start.date().isoformat()
+    sql = f"""
+        SELECT Bucket AS time, N AS readings, ROUND(Total / N, 2) AS average, Min_Value AS minimum, Max_Value AS maximum
+        FROM vitals_{level}
+        WHERE Patient_Id = ? AND Metric = ? AND Bucket >= ? AND Bucket < ?
+    """
+    return level, sql, (patient_id, metric, low, bound(end))
+
+
+def trend(patient_id, metric, start, end):
+    level, sql, params = trend_query(patient_id, metric, start, end)
+    with db.connection() as con:
+        rows = con.execute(sql + " ORDER BY time", params).fetchall()
+    return level, rows
+
+
+def readings(con, patient_id, start, end):
+    # Every raw reading in [start, end) as column buffers: 8 bytes per value instead of a
+    # float object per cell, with NaN for a metric that was not measured
+    sql = f"""
+        SELECT Measure_Ts, {", ".join(METRICS)} FROM vitals
+        WHERE Patient_Id = ? AND Measure_Ts >= ? AND Measure_Ts < ?
+        ORDER BY Measure_Ts
+    """
+    return records.fetch_columns(con, sql, (patient_id, bound(start), bound(end)))
+
+
+def summary(columns):
+    # {metric: (readings, mean, minimum, maximum)} over buffers from readings()
+    result = {}
+    for metric in METRICS:
+        values = records.measured(columns[metric])
+        if len(values):
+            result[metric] = (len(values), round(math.fsum(values) / len(values), 2), min(values), max(values))
+        else:
+            result[metric] = (0, None, None, None)
+    return result
+
+
+def moment(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest vitals readings, rebuild or verify rollups, or print a trend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_cmd = sub.add_parser("ingest", help="ingest a JSONL file of readings in batches")
+    ingest_cmd.add_argument("path")
+    ingest_cmd.add_argument("--batch", type=int, default=1000)
+    sub.add_parser("rebuild", help="recompute the hourly and daily rollups from raw readings")
+    sub.add_parser("verify", help="compare the hourly and daily rollups with the raw readings")
+    trend_cmd = sub.add_parser("trend", help="print a trend for one patient and metric")
+    trend_cmd.add_argument("patient_id", type=int)
+    trend_cmd.add_argument("metric", choices=METRICS)
+    trend_cmd.add_argument("start", type=moment)
+    trend_cmd.add_argument("end", type=moment)
+    summary_cmd = sub.add_parser("summary", help="print per-metric count, mean, min and max of raw readings")
+    summary_cmd.add_argument("patient_id", type=int)
+    summary_cmd.add_argument("start", type=moment)
+    summary_cmd.add_argument("end", type=moment)
+    parser.add_argument("--db", help="database path (defaults to PATIENT_DB_PATH)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+
+    if args.command == "ingest":
+        totals = {"inserted": 0, "duplicates": 0}
+        batch = []
+        with open(args.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) == args.batch:
+                    result = ingest(batch)
+                    totals = {key: totals[key] + result[key] for key in totals}
+                    batch = []
+        if batch:
+            result = ingest(batch)
+            totals = {key: totals[key] + result[key] for key in totals}
+        print(json.dumps(totals))
+    elif args.command == "rebuild":
+        with db.connection() as con:
+            rebuild(con)
+    elif args.command == "verify":
+        with db.connection() as con:
+            results = drift(con)
+        for result in results:
+            print(f"{result['table']}: {result['rows']} rows, {len(result['drift'])} drifted")
+            for row in result["drift"][:20]:
+                print("  " + json.dumps(row))
+        return 1 if any(result["drift"] for result in results) else 0
+    elif args.command == "summary":
+        with db.connection() as con:
+            columns = readings(con, args.patient_id, args.start, args.end)
+        for metric, (n, mean, low, high) in summary(columns).items():
+            print(f"{metric}\t{n}\t{mean}\t{low}\t{high}")
+    else:
+        level, rows = trend(args.patient_id, args.metric, args.start, args.end)
+        print(f"{level} resolution, {len(rows)} points")
+        for row in rows:
+            print("\t".join("" if value is None else str(value) for value in row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
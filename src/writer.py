@@ -0,0 +1,293 @@
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import billing
+import cache
+import db
+import scheduler
+import vitals
+from runner import executor
+
+QUEUE_SIZE = int(os.environ.get("PATIENT_WRITE_QUEUE", "1000"))
+# Most writes committed together; whatever queued up during the last commit goes in the next
+GROUP_SIZE = int(os.environ.get("PATIENT_WRITE_GROUP", "256"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Write:
+    # parse runs where the request arrives and raises ValueError for bad input; run does the
+    # write inside the writer's transaction; applied runs in every process once it commits,
+    # to bring caches and in-memory indexes up to date
+    def __init__(self, parse, run, applied):
+        self.parse = parse
+        self.run = run
+        self.applied = applied
+
+
+def required(args, *names):
+    missing = [name for name in names if args.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    return [args[name] for name in names]
+
+
+def parse_booking(args):
+    patient, doctor, date, at = required(args, "patient", "doctor", "date", "time")
+    return int(patient), int(doctor), scheduler.day(date), scheduler.clock(at), args.get("reason")
+
+
+def booked(params, result):
+    patient, doctor, date, at, _ = params
+    scheduler.schedule.booked(doctor, date, at)
+    scheduler.notify("booked", patient, doctor, date, current=[scheduler.schedule.changed])
+
+
+def book(con, patient, doctor, date, at, reason):
+    scheduler.insert_booking(con, patient, doctor, date, at, reason)
+    return {"patient": patient, "doctor": doctor, "date": date, "time": at}
+
+
+def parse_cancel(args):
+    patient, date, at = required(args, "patient", "date", "time")
+    return int(patient), str(date), str(at)
+
+
+def cancel(con, patient, date, at):
+    doctor = scheduler.delete_booking(con, patient, date, at)
+    return {"cancelled": doctor is not None, "doctor": doctor}
+
+
+def cancelled(params, result):
+    # The slot index reloads; other indexes drop just this booking
+    if result["cancelled"]:
+        patient, date, _ = params
+        scheduler.notify("cancelled", patient, result["doctor"], date)
+
+
+def parse_readings(args):
+    readings = args.get("readings") if isinstance(args, dict) else args
+    if not isinstance(readings, list):
+        raise ValueError("readings must be a list")
+    try:
+        return ([vitals.reading(raw) for raw in readings],)
+    except (KeyError, TypeError) as err:
+        raise ValueError(f"bad reading: {err}") from None
+
+
+def ingest(con, rows):
+    inserted = vitals.insert_readings(con, rows)
+    return {"inserted": inserted, "duplicates": len(rows) - inserted}
+
+
+def ingested(params, result):
+    if result["inserted"]:
+        cache.invalidate("vitals")
+
+
+def parse_payments(args):
+    bills = args.get("bills") if isinstance(args, dict) else None
+    if not isinstance(bills, list):
+        raise ValueError("bills must be a list")
+    try:
+        return ([(str(bill["date"]), int(bill["doctor"]), int(bill["patient"])) for bill in bills],)
+    except (KeyError, TypeError) as err:
+        raise ValueError(f"bad bill: {err}") from None
+
+
+def pay(con, bills):
+    return {"paid": billing.mark_paid(con, bills)}
+
+
+def paid(params, result):
+    if result["paid"]:
+        cache.invalidate("bill")
+
+
+WRITES = {
+    "book": Write(parse_booking, book, booked),
+    "cancel": Write(parse_cancel, cancel, cancelled),
+    "vitals": Write(parse_readings, ingest, ingested),
+    "pay": Write(parse_payments, pay, paid),
+}
+
+
+class LocalWriter:
+    # Single-process mode: each write is its own transaction on the query executor, the way
+    # the app writes
+    def submit(self, name, args):
+        write = WRITES[name]
+        params = write.parse(args)
+        return executor.submit(self.run, write, params)
+
+    def run(self, write, params):
+        with db.connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                result = write.run(con, *params)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        write.applied(params, result)
+        return result
+
+    def stats(self):
+        return {"mode": "local"}
+
+
+class WriterClient:
+    # Worker side of the writer process. Writes are queued without blocking; a full queue is
+    # refused with Overloaded so callers shed load instead of piling up behind the writer.
+    # Replies and every other worker's committed writes arrive on this worker's inbox.
+    def __init__(self, worker, requests, inbox):
+        self.worker = worker
+        self.requests = requests
+        self.inbox = inbox
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.refused = 0
+        threading.Thread(target=self.receive, name="writer-inbox", daemon=True).start()
+
+    def submit(self, name, args):
+        params = WRITES[name].parse(args)
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        try:
+            self.requests.put_nowait((self.worker, request_id, name, params))
+        except queue.Full:
+            with self._lock:
+                del self._pending[request_id]
+                self.refused += 1
+            raise Overloaded("write queue is full") from None
+        return future
+
+    def receive(self):
+        while True:
+            message = self.inbox.get()
+            if message is None:
+                break
+            kind, *rest = message
+            if kind == "applied":
+                name, params, result = rest
+                WRITES[name].applied(params, result)
+            else:
+                request_id, ok, value = rest
+                with self._lock:
+                    future = self._pending.pop(request_id)
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"mode": "writer", "worker": self.worker, "pending": pending, "refused": self.refused}
+
+
+def sendable(err):
+    # Exceptions cross the process boundary pickled; anything that cannot be is sent as text
+    try:
+        pickle.dumps(err)
+        return err
+    except Exception:
+        return RuntimeError(f"{type(err).__name__}: {err}")
+
+
+def next_group(requests):
+    group = [requests.get()]
+    while group[-1] is not None and len(group) < GROUP_SIZE:
+        try:
+            group.append(requests.get_nowait())
+        except queue.Empty:
+            break
+    return group
+
+
+def commit_group(con, group):
+    # One transaction for the whole group; each write gets a savepoint so one that fails
+    # is rolled back alone and the rest still commit
+    outcomes = []
+    try:
+        con.execute("BEGIN IMMEDIATE")
+    except sqlite3.Error as err:
+        return [(False, sendable(err))] * len(group)
+    try:
+        for worker, request_id, name, params in group:
+            con.execute("SAVEPOINT write")
+            try:
+                outcomes.append((True, WRITES[name].run(con, *params)))
+            except Exception as err:
+                con.execute("ROLLBACK TO write")
+                outcomes.append((False, sendable(err)))
+            con.execute("RELEASE write")
+        con.execute("COMMIT")
+    except BaseException as err:
+        con.execute("ROLLBACK")
+        if not isinstance(err, Exception):
+            raise
+        outcomes = [(False, sendable(err))] * len(group)
+    return outcomes
+
+
+def serve(path, requests, inboxes):
+    # The writer process: the only connection that writes. A None request stops it.
+    # Ctrl-C reaches every process; the writer keeps going until the server sends the stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    con = db.open_connection(path)
+    stats = {"groups": 0, "writes": 0, "largest": 0, "seconds": 0.0}
+    while True:
+        group = next_group(requests)
+        stop = group[-1] is None
+        group = [request for request in group if request is not None]
+        if group:
+            start = time.perf_counter()
+            outcomes = commit_group(con, group)
+            stats["groups"] += 1
+            stats["writes"] += len(group)
+            stats["largest"] = max(stats["largest"], len(group))
+            stats["seconds"] += time.perf_counter() - start
+            # Each inbox is read in order, so the worker that sent a write applies it before
+            # it sees the reply and its own reads after the write are fresh. The other workers
+            # apply it whenever their inbox thread next runs; until then a read there can still
+            # be answered from a cache filled before the write.
+            for (worker, request_id, name, params), (ok, value) in zip(group, outcomes):
+                if ok:
+                    for inbox in inboxes:
+                        inbox.put(("applied", name, params, value))
+            for (worker, request_id, name, params), (ok, value) in zip(group, outcomes):
+                inboxes[worker].put(("done", request_id, ok, value))
+        if stop:
+            break
+    con.close()
+    for inbox in inboxes:
+        # Workers may already be gone, so nothing waits for these to be read
+        inbox.cancel_join_thread()
+        inbox.put(None)
+    print(f"writer: {stats['writes']} writes in {stats['groups']} commits (largest {stats['largest']}), "
+          f"{stats['seconds']:.2f}s in transactions", flush=True)
+
+
+def start(path, workers, context=None):
+    # Returns (process, requests, inboxes): the writer process, its bounded request queue
+    # and one inbox per worker
+    context = context or multiprocessing.get_context("spawn")
+    requests = context.Queue(QUEUE_SIZE)
+    inboxes = [context.Queue() for _ in range(workers)]
+    process = context.Process(target=serve, args=(path, requests, inboxes), name="writer")
+    process.start()
+    return process, requests, inboxes